@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Audio, Playlist, History, Like, Comment, Follow, Download, Category, Notification, FollowCategory
+from django.db import transaction
+from django.db.models import Count
+from .models import Audio, Playlist, History, Like, Comment, Follow, Download, Category, Notification, FollowCategory, NotificationFanOut, Broadcast, Job, AudioRendition
 from .thread import create_audio_notifications, create_category_notifications
 
 # Category
@@ -13,13 +15,43 @@ class CategoryAdmin(admin.ModelAdmin):
         if not change:  # শুধুমাত্র নতুন create হলে
             create_category_notifications(obj)
 
+# Broadcast notifications (stored once, shown to every user)
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ("id", "message", "audio", "category", "created_at")
+    search_fields = ("message",)
+
+# Notification fan-outs (progress of "new story/category" deliveries)
+@admin.register(NotificationFanOut)
+class NotificationFanOutAdmin(admin.ModelAdmin):
+    list_display = ("id", "message", "sent", "last_user_id", "created_at", "finished_at")
+    readonly_fields = ("audio", "category", "message", "last_user_id", "sent", "finished_at")
+
+# Background jobs
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "attempts", "duration_ms", "run_at", "finished_at")
+    list_filter = ("status", "name")
+    readonly_fields = ("locked_at", "locked_by", "last_error", "duration_ms", "finished_at")
+
 # Audio
+class AudioRenditionInline(admin.TabularInline):
+    model = AudioRendition
+    extra = 0
+    can_delete = False
+    readonly_fields = ("name", "bitrate", "codec", "size", "file", "playlist", "source", "created_at")
+
+    def has_add_permission(self, request, obj=None):
+        return False  # made by the "media.transcode" job
+
+
 @admin.register(Audio)
 class AudioAdmin(admin.ModelAdmin):
     list_display = ("id", "title", "artist", "category", "play_count", "is_premium", "created_at")
     list_filter = ("category", "is_premium", "created_at")
     search_fields = ("title", "artist", "description")
-    readonly_fields = ("play_count",)
+    readonly_fields = ("play_count", "like_count", "comment_count", "codec", "bitrate", "sample_rate", "channels", "file_size")
+    inlines = [AudioRenditionInline]
     
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
@@ -40,19 +72,37 @@ class HistoryAdmin(admin.ModelAdmin):
     list_filter = ("completed", "played_at")
     search_fields = ("user__email", "audio__title")
 
+class AudioCounterAdminMixin:
+    """Keeps Audio.like_count / comment_count in sync with admin deletes"""
+    counter_name = None
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            Audio.adjust_counters(obj.audio_id, **{self.counter_name: -1})
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            per_audio = list(queryset.values("audio_id").annotate(total=Count("id")).order_by())
+            super().delete_queryset(request, queryset)
+            for row in per_audio:
+                Audio.adjust_counters(row["audio_id"], **{self.counter_name: -row["total"]})
+
 # Like
 @admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
+class LikeAdmin(AudioCounterAdminMixin, admin.ModelAdmin):
     list_display = ("id", "user", "audio", "created_at")
     search_fields = ("user__email", "audio__title")
     list_filter = ("created_at",)
+    counter_name = "likes"
 
 # Comment
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(AudioCounterAdminMixin, admin.ModelAdmin):
     list_display = ("id", "user", "audio", "text", "created_at")
     search_fields = ("user__email", "audio__title", "text")
     list_filter = ("created_at",)
+    counter_name = "comments"
 
 # # Follow
 # @admin.register(Follow)
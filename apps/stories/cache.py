@@ -0,0 +1,116 @@
+"""
+Response cache for the anonymous catalog endpoints.
+
+Entries hold the rendered response data together with the catalog
+version it was built from. Any Audio/Category save or delete bumps the
+version (see signals.py), which turns every entry stale at once. A stale
+or expired entry is rebuilt by the single worker that wins the rebuild
+lock while the others keep serving the stale copy, so a version bump or
+an expiry never sends every worker to the database at the same time.
+
+The backend is whatever CACHES[CATALOG_CACHE_ALIAS] is configured as:
+local memory for a single process, file-based or a shared cache such as
+Redis when several workers must see the same version.
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .images import variant_key
+
+VERSION_KEY = "catalog:version"
+STATS_KEYS = ("hit", "stale", "miss")
+
+
+def catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def catalog_version():
+    cache = catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # a fresh starting point, so an evicted counter never repeats an old version
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = catalog_cache()
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def count(event):
+    cache = catalog_cache()
+    key = f"catalog:stats:{event}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def cache_stats():
+    cache = catalog_cache()
+    values = cache.get_many([f"catalog:stats:{event}" for event in STATS_KEYS])
+    stats = {event: values.get(f"catalog:stats:{event}", 0) for event in STATS_KEYS}
+    served = stats["hit"] + stats["stale"]
+    stats["hit_ratio"] = round(served / (served + stats["miss"]), 4) if served + stats["miss"] else 0.0
+    stats["version"] = catalog_version()
+    return stats
+
+
+def cached_response(request, build):
+    """Serve `build()`'s response from the catalog cache, rebuilding at most once at a time"""
+    cache = catalog_cache()
+    # the data holds absolute media URLs built for the scheme and host asked
+    # for, and image URLs for the size and format (Accept) negotiated
+    origin = f"{request.scheme}://{request.get_host()}"
+    key = f"catalog:response:{origin}{request.path}?{request.GET.urlencode()}#{variant_key(request)}"
+    version = catalog_version()
+    entry = cache.get(key)
+
+    if entry and entry["version"] == version and entry["fresh_until"] > time.time():
+        count("hit")
+        return Response(entry["data"], status=entry["status"])
+
+    locked = cache.add(f"{key}:lock", 1, timeout=settings.CATALOG_CACHE_LOCK_TIMEOUT)
+    if entry and not locked:
+        # another worker is rebuilding this entry
+        count("stale")
+        return Response(entry["data"], status=entry["status"])
+
+    count("miss")
+    try:
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, {
+                "version": version,
+                "fresh_until": time.time() + settings.CATALOG_CACHE_TTL,
+                "data": response.data,
+                "status": response.status_code,
+            }, timeout=settings.CATALOG_CACHE_TTL + settings.CATALOG_CACHE_STALE_TTL)
+        return response
+    finally:
+        if locked:
+            cache.delete(f"{key}:lock")
+
+
+def catalog_cached(view_method):
+    """Cache an APIView GET handler for anonymous clients"""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.user.is_authenticated or not settings.CATALOG_CACHE_TTL:
+            return view_method(self, request, *args, **kwargs)
+        return cached_response(request, lambda: view_method(self, request, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 5000
+
+
+class PlayCountBuffer:
+    """
+    Coalesces play_count increments per audio and writes them in batches.
+
+    A play is an INSERT into the shared PendingPlay table, so concurrent
+    plays of one story never wait on its row lock. Every worker process
+    runs a flusher that sums the pending rows every
+    PLAY_COUNT_FLUSH_INTERVAL seconds into `play_count = play_count + n`
+    updates. It deletes those rows in the same transaction, so a play is
+    counted exactly once even when workers are killed or restarted. An
+    interval of 0 writes every play straight through.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def interval(self):
+        return settings.PLAY_COUNT_FLUSH_INTERVAL
+
+    def add(self, audio_id, plays=1):
+        """Record `plays` for an audio and return its play count including the ones not flushed yet"""
+        from .models import PendingPlay
+
+        if self.interval <= 0:
+            self._apply({audio_id: plays})
+        else:
+            PendingPlay.objects.create(audio_id=audio_id, plays=plays)
+            self._start()
+        return self.total(audio_id)
+
+    def total(self, audio_id):
+        """play_count plus pending plays, read in one statement so a concurrent flush is seen whole or not at all"""
+        from .models import Audio, PendingPlay
+
+        pending = (
+            PendingPlay.objects.filter(audio_id=OuterRef("pk")).order_by()
+            .values("audio_id").annotate(plays=Sum("plays")).values("plays")
+        )
+        return (
+            Audio.objects.filter(pk=audio_id)
+            .annotate(total=F("play_count") + Coalesce(Subquery(pending), Value(0)))
+            .values_list("total", flat=True).first()
+        ) or 0
+
+    def pending(self, audio_id):
+        from .models import PendingPlay
+
+        return PendingPlay.objects.filter(audio_id=audio_id).aggregate(plays=Sum("plays"))["plays"] or 0
+
+    def flush(self):
+        """Write every pending play, returns the number of plays written"""
+        from .models import PendingPlay
+
+        written = 0
+        while True:
+            with transaction.atomic():
+                # rows another flusher is applying are skipped, not counted twice
+                rows = list(
+                    PendingPlay.objects.select_for_update(skip_locked=True)
+                    .order_by("id").values_list("id", "audio_id", "plays")[:FLUSH_BATCH_SIZE]
+                )
+                if not rows:
+                    return written
+                batch = Counter()
+                for _, audio_id, plays in rows:
+                    batch[audio_id] += plays
+                self._apply(batch)
+                PendingPlay.objects.filter(id__in=[row_id for row_id, _, _ in rows]).delete()
+            written += sum(batch.values())
+            if len(rows) < FLUSH_BATCH_SIZE:
+                return written
+
+    def _apply(self, batch):
+        from .models import Audio
+
+        # one UPDATE per distinct delta; most audios in a window share n=1
+        by_delta = defaultdict(list)
+        for audio_id, plays in batch.items():
+            by_delta[plays].append(audio_id)
+        with transaction.atomic():
+            for plays, audio_ids in sorted(by_delta.items()):
+                Audio.objects.filter(pk__in=sorted(audio_ids)).update(play_count=F("play_count") + plays)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="play-count-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # the plays stay in the table for the next run
+                logger.exception("Play count flush failed")
+
+
+play_counter = PlayCountBuffer()
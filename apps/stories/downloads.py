@@ -0,0 +1,119 @@
+"""
+Signed, expiring offline download links.
+
+A download covers DOWNLOAD_WINDOW_DAYS from its creation. Creating one
+returns a manifest of the files to keep for offline play (the audio, its
+renditions and the cover). Each entry carries its size, SHA-256 and a
+transfer URL. The URL is signed for the user, the download, that exact
+stored file and the end of the window. It needs no other credentials, so a
+platform download manager can fetch it. It stops working when the window
+closes, the download is removed or the file is replaced.
+
+Transfers go through serve_file: `Range` with `If-Range` resumes an
+interrupted transfer, and `Repr-Digest` lets the client check the
+assembled file. Checksums are never computed here. Content-addressed
+files carry theirs in the name. The probe and transcode jobs store the
+others (Audio.file_sha256, AudioRendition.sha256). A file whose checksum
+is not known yet is listed without one.
+"""
+import base64
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Download
+from .storage import blob_digest
+
+SALT = "stories.downloads"
+
+
+class DownloadGone(Exception):
+    """The link was valid but its download expired, was removed or the file changed"""
+
+
+def window_start():
+    """Downloads created before this have expired"""
+    return timezone.now() - timedelta(days=settings.DOWNLOAD_WINDOW_DAYS)
+
+
+def expires_at(download):
+    return download.created_at + timedelta(days=settings.DOWNLOAD_WINDOW_DAYS)
+
+
+def download_files(audio):
+    """(kind, FieldFile, hex SHA-256 or None) of the files offered for offline play"""
+    files = []
+    if audio.audio_file:
+        name = audio.audio_file.name
+        digest = blob_digest(name) or (audio.file_sha256 if audio.probed_file == name else None)
+        files.append(("audio", audio.audio_file, digest or None))
+    files.extend(
+        (f"rendition-{rendition.name}", rendition.file, rendition.sha256 or None)
+        for rendition in audio.renditions.all()
+    )
+    if audio.cover_image:
+        files.append(("cover", audio.cover_image, blob_digest(audio.cover_image.name)))
+    return files
+
+
+def repr_digest(digest):
+    """Repr-Digest header value (RFC 9530) of a hex SHA-256"""
+    return f"sha-256=:{base64.b64encode(bytes.fromhex(digest)).decode()}:"
+
+
+def file_name(audio, kind, field_file):
+    extension = os.path.splitext(field_file.name)[1].lower()
+    title = slugify(audio.title, allow_unicode=True) or f"audio-{audio.pk}"
+    return f"{title}{extension}" if kind == "audio" else f"{title}-{kind}{extension}"
+
+
+def sign(download, kind, field_file):
+    return signing.dumps({
+        "d": download.pk,
+        "u": download.user_id,
+        "k": kind,
+        "n": field_file.name,
+        "e": int(expires_at(download).timestamp()),
+    }, salt=SALT, compress=True)
+
+
+def manifest(download, request):
+    audio = download.audio
+    files = []
+    for kind, field_file, digest in download_files(audio):
+        url = reverse("download-transfer", args=[sign(download, kind, field_file)])
+        files.append({
+            "kind": kind,
+            "name": file_name(audio, kind, field_file),
+            "size": field_file.size,
+            "sha256": digest,
+            "url": request.build_absolute_uri(url),
+        })
+    return {"expires_at": expires_at(download), "files": files}
+
+
+def resolve(token):
+    """
+    (download, kind, FieldFile, hex SHA-256 or None) granted by a transfer
+    token. Raises signing.BadSignature when it was not issued here,
+    DownloadGone when it no longer applies.
+    """
+    payload = signing.loads(token, salt=SALT)
+    if payload["e"] < timezone.now().timestamp():
+        raise DownloadGone("The download link has expired.")
+    download = (
+        Download.objects.select_related("audio")
+        .filter(pk=payload["d"], user_id=payload["u"], created_at__gte=window_start())
+        .first()
+    )
+    if download is None:
+        raise DownloadGone("The download was removed or has expired.")
+    for kind, field_file, digest in download_files(download.audio):
+        if kind == payload["k"] and field_file.name == payload["n"]:
+            return download, kind, field_file, digest
+    raise DownloadGone("The file has changed, request a new download link.")
@@ -0,0 +1,127 @@
+"""
+Server-Sent Events stream of a user's new notifications (ASGI only).
+
+The client authenticates with its JWT access token in the Authorization
+header or, for EventSource which cannot set headers, a `?token=` query
+parameter. Each event carries the feed item as FeedSerializer renders it
+and an id of the form "<personal id>:<broadcast id>", the newest rows the
+client has seen. A reconnect sends that back as Last-Event-ID and the
+rows created in between are replayed from the database before live
+events resume. A comment line is sent every SSE_HEARTBEAT_INTERVAL
+seconds to keep proxies from closing an idle connection.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from . import notifications
+from .models import Broadcast
+from .pubsub import BROADCAST_CHANNEL, OVERFLOW, broker, user_channel
+from .serializers import FeedSerializer
+
+
+def authenticate(request):
+    header = request.headers.get("Authorization", "")
+    raw_token = header[len("Bearer "):] if header.startswith("Bearer ") else request.GET.get("token")
+    if not raw_token:
+        return None
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def parse_event_id(value):
+    try:
+        personal_id, broadcast_id = (int(part) for part in value.split(":"))
+    except (AttributeError, ValueError):
+        return None
+    return personal_id, broadcast_id
+
+
+def latest_ids(user):
+    personal = notifications.personal_for(user).aggregate(last=Max("id"))["last"] or 0
+    broadcast = notifications.broadcasts_for(user).aggregate(last=Max("id"))["last"] or 0
+    return personal, broadcast
+
+
+def load(user, personal_after, broadcast_after, limit):
+    """Feed items newer than the given ids, oldest first"""
+    personal = notifications.personal_for(user).filter(id__gt=personal_after)
+    broadcasts = notifications.broadcasts_for(user).filter(id__gt=broadcast_after)
+    items = [
+        *personal.select_related("audio", "category").order_by("id")[:limit],
+        *broadcasts.select_related("audio", "category").order_by("id")[:limit],
+    ]
+    return sorted(items, key=lambda item: item.created_at)
+
+
+def render(request, items):
+    return [
+        (item, json.dumps(FeedSerializer(item, context={"request": request}).data, default=str))
+        for item in items
+    ]
+
+
+def event(item, data, seen):
+    if isinstance(item, Broadcast):
+        seen[1] = max(seen[1], item.id)
+    else:
+        seen[0] = max(seen[0], item.id)
+    return f"id: {seen[0]}:{seen[1]}\nevent: notification\ndata: {data}\n\n"
+
+
+async def stream(request, user, last_event_id):
+    channels = [user_channel(user.pk)]
+    if user.receive_announcements:
+        channels.append(BROADCAST_CHANNEL)
+    # subscribe before reading the replay so nothing created in between is lost
+    subscription = broker.subscribe(channels)
+    try:
+        seen = list(last_event_id or await sync_to_async(latest_ids)(user))
+        yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+
+        replay = await sync_to_async(load)(user, *seen, settings.SSE_REPLAY_LIMIT)
+        for item, data in await sync_to_async(render)(request, replay):
+            yield event(item, data, seen)
+
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), settings.SSE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if message is OVERFLOW:
+                return  # the client reconnects with Last-Event-ID and catches up
+            # anything published since the last event, including the row behind this message
+            items = await sync_to_async(load)(user, *seen, settings.SSE_REPLAY_LIMIT)
+            for item, data in await sync_to_async(render)(request, items):
+                yield event(item, data, seen)
+    finally:
+        subscription.close()
+
+
+async def notification_stream(request):
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({
+            "success": False,
+            "message": "Authentication credentials were not provided or are invalid.",
+            "status_code": status.HTTP_401_UNAUTHORIZED,
+            "data": [],
+        }, status=status.HTTP_401_UNAUTHORIZED)
+
+    last_event_id = parse_event_id(request.headers.get("Last-Event-ID") or request.GET.get("last_event_id"))
+    response = StreamingHttpResponse(stream(request, user, last_event_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: do not buffer the stream
+    return response
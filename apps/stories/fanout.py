@@ -0,0 +1,81 @@
+"""
+Batched notification fan-out.
+
+User ids are streamed with `.iterator()` (a server-side cursor on
+PostgreSQL) and each batch of NOTIFICATION_BATCH_SIZE rows is inserted in
+its own short transaction together with the fan-out checkpoint, so memory
+stays flat, no transaction outlives one batch, and a fan-out that was
+interrupted continues after the last committed batch
+(`manage.py resume_fan_outs`).
+"""
+import logging
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.user.models import User
+from .models import FollowCategory, Notification, NotificationFanOut
+from .notifications import push
+
+logger = logging.getLogger(__name__)
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def recipients(fan_out):
+    """Ids of the users still to notify, ascending"""
+    if fan_out.followers_of_id:
+        # range scan on follow_category_user_idx
+        return (
+            FollowCategory.objects.filter(category_id=fan_out.followers_of_id, user_id__gt=fan_out.last_user_id)
+            .order_by("user_id").values_list("user_id", flat=True)
+        )
+    return User.objects.filter(id__gt=fan_out.last_user_id).order_by("id").values_list("id", flat=True)
+
+
+def run_fan_out(fan_out_id, batch_size=None):
+    """Deliver the fan-out to every user after its checkpoint, returns the fan-out"""
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    fan_out = NotificationFanOut.objects.get(pk=fan_out_id)
+    if fan_out.finished_at:
+        return fan_out
+
+    user_ids = recipients(fan_out).iterator(chunk_size=batch_size)
+    for batch in batches(user_ids, batch_size):
+        started = time.monotonic()
+        with transaction.atomic():
+            push(Notification.objects.bulk_create([
+                Notification(
+                    user_id=user_id,
+                    audio_id=fan_out.audio_id,
+                    category_id=fan_out.category_id,
+                    message=fan_out.message,
+                )
+                for user_id in batch
+            ]))
+            NotificationFanOut.objects.filter(pk=fan_out.pk).update(
+                last_user_id=batch[-1], sent=F("sent") + len(batch)
+            )
+        fan_out.last_user_id = batch[-1]
+        fan_out.sent += len(batch)
+        logger.info(
+            "Fan-out %s: %s notifications up to user %s in %.1f ms (%s sent)",
+            fan_out.pk, len(batch), batch[-1], (time.monotonic() - started) * 1000, fan_out.sent,
+        )
+
+    fan_out.finished_at = timezone.now()
+    fan_out.save(update_fields=["finished_at"])
+    return fan_out
+
+
+def resume_fan_outs():
+    """Finish every fan-out left unfinished by a crash or restart"""
+    return [run_fan_out(pk) for pk in NotificationFanOut.objects.filter(finished_at__isnull=True).values_list("id", flat=True)]
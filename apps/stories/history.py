@@ -0,0 +1,116 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    Takes History writes off the request path.
+
+    Play/view events go onto a bounded in-process queue and a background
+    thread writes them with bulk_create, HISTORY_BATCH_SIZE rows at a time
+    or every HISTORY_FLUSH_INTERVAL seconds, whichever comes first. When
+    the queue is full a producer waits up to HISTORY_ENQUEUE_TIMEOUT
+    seconds before the event is dropped. The queue is drained when the
+    worker exits. An interval of 0 writes every event immediately.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.dropped = 0
+
+    def record(self, user, audio):
+        """Queue a play/view of `audio` by `user`, returns False if it was dropped"""
+        if not user.is_authenticated:
+            return False
+        event = (user.pk, audio.pk, timezone.now())
+        if settings.HISTORY_FLUSH_INTERVAL <= 0:
+            self._write([event])
+            return True
+
+        self._start()
+        try:
+            self._queue.put(event, timeout=settings.HISTORY_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("History queue full, dropped event (%s dropped so far)", self.dropped)
+            return False
+        return True
+
+    def drain(self, timeout=10):
+        """Write everything queued so far and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass  # the writer sees the stop flag once the queue runs dry
+        thread.join(timeout)
+        self._stopping.clear()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=settings.HISTORY_QUEUE_SIZE)
+                atexit.register(self.drain)
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                close_old_connections()
+                self._write(batch)
+            if stop or (self._stopping.is_set() and self._queue.empty()):
+                return
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + settings.HISTORY_FLUSH_INTERVAL
+        while len(batch) < settings.HISTORY_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if event is _STOP:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _write(self, batch):
+        from .models import History
+
+        try:
+            History.objects.bulk_create([
+                History(user_id=user_id, audio_id=audio_id, played_at=played_at)
+                for user_id, audio_id, played_at in batch
+            ])
+        except Exception:
+            logger.exception("Failed to write %s history events", len(batch))
+
+
+history_writer = HistoryWriter()
@@ -0,0 +1,129 @@
+"""
+Resized derivatives of uploaded images (audio covers, user photos).
+
+After an upload the "media.images" job (tasks.py) decodes the original
+once, downscales it to every IMAGE_SIZES entry (longest edge, never
+upscaled) and encodes each as WebP and progressive JPEG. The results are
+stored as `derivatives/<hash[:2]>/<hash>.<ext>`, named after a hash of
+their own bytes, so a derivative URL never changes content and can be
+cached forever; identical results are stored once.
+
+Serializers resolve the derivative the client asked for:
+
+    ?image_size=thumbnail|card|full|original  (default IMAGE_DEFAULT_SIZE)
+    ?image_format=webp|jpeg                   (default: webp when the
+                                               Accept header allows it)
+
+and fall back to the original until the derivatives exist. Lists look
+them up for all their images at once with `prime_images()`.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import ImageDerivative
+
+logger = logging.getLogger(__name__)
+
+ORIGINAL = "original"
+FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+
+def requested_variant(request):
+    """(size, format) asked for by the request"""
+    if request is None:
+        return settings.IMAGE_DEFAULT_SIZE, "jpeg"
+    size = request.GET.get("image_size", settings.IMAGE_DEFAULT_SIZE)
+    if size != ORIGINAL and size not in settings.IMAGE_SIZES:
+        size = settings.IMAGE_DEFAULT_SIZE
+    image_format = request.GET.get("image_format")
+    if image_format not in FORMATS:
+        image_format = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+    return size, image_format
+
+
+def variant_key(request):
+    return "{}.{}".format(*requested_variant(request))
+
+
+def prime_images(context, field_files):
+    """Look up the requested derivative of each image not already in the render context"""
+    found = context.setdefault("image_derivatives", {})
+    size, image_format = requested_variant(context.get("request"))
+    sources = {file.name for file in field_files if file} - found.keys()
+    if not sources:
+        return found
+    found.update(dict.fromkeys(sources))
+    if size != ORIGINAL:
+        rows = ImageDerivative.objects.filter(source__in=sources, size=size, format=image_format)
+        found.update(rows.values_list("source", "file"))
+    return found
+
+
+def image_url(field_file, context):
+    """Absolute URL of the requested derivative of `field_file`, or of the original"""
+    if not field_file:
+        return None
+    name = prime_images(context, [field_file])[field_file.name]
+    url = default_storage.url(name) if name else field_file.url
+    request = context.get("request")
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def store(image, image_format):
+    pil_format, extension = FORMATS[image_format]
+    buffer = io.BytesIO()
+    if pil_format == "JPEG":
+        image.convert("RGB").save(
+            buffer, pil_format, quality=settings.IMAGE_JPEG_QUALITY, optimize=True, progressive=True
+        )
+    else:
+        image.save(buffer, pil_format, quality=settings.IMAGE_WEBP_QUALITY, method=4)
+    data = buffer.getvalue()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    name = f"derivatives/{digest[:2]}/{digest}{extension}"
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name, len(data)
+
+
+def build_derivatives(source):
+    """Create every size and format of the image stored as `source`, returns the rows"""
+    sizes = sorted(settings.IMAGE_SIZES.items(), key=lambda item: item[1], reverse=True)
+    try:
+        with default_storage.open(source, "rb") as file:
+            image = Image.open(file)
+            # JPEG: let the decoder downscale by up to 8x instead of decoding every pixel
+            image.draft("RGB", (sizes[0][1], sizes[0][1]))
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except FileNotFoundError:
+        logger.warning("Image %s is missing", source)
+        return []
+    except (UnidentifiedImageError, OSError) as exc:
+        logger.warning("Image %s cannot be decoded: %s", source, exc)
+        return []
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    rows = []
+    # each size is scaled down from the previous, larger one
+    for size, edge in sizes:
+        image = image.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        for image_format in FORMATS:
+            name, length = store(image, image_format)
+            rows.append(ImageDerivative(
+                source=source, size=size, format=image_format, file=name,
+                width=image.width, height=image.height, bytes=length,
+            ))
+    ImageDerivative.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=["source", "size", "format"],
+        update_fields=["file", "width", "height", "bytes"],
+    )
+    return rows
@@ -0,0 +1,196 @@
+"""
+Database-backed background jobs.
+
+`enqueue()` inserts a Job row, so a job queued inside a transaction only
+becomes visible to workers when that transaction commits, and queued work
+survives restarts. `manage.py run_workers` runs a pool of workers that
+claim due jobs with `SELECT ... FOR UPDATE SKIP LOCKED` (PostgreSQL), so
+any number of workers never pick the same row. A failed job is retried
+with exponential backoff up to its `max_attempts`. While a job runs its
+lock is refreshed every JOB_HEARTBEAT_INTERVAL, so however long it takes
+it is only handed out again once its worker died and the lock is older
+than JOB_LOCK_TIMEOUT.
+Each run records `duration_ms`, see `job_stats()`.
+
+Handlers are plain functions registered with `@job("name")` and called
+with the payload as keyword arguments (see tasks.py).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name):
+    """Register a function as the handler of jobs called `name`"""
+    def register(func):
+        registry[name] = func
+        return func
+    return register
+
+
+def enqueue(name, run_at=None, max_attempts=None, **payload):
+    if name not in registry:
+        raise KeyError(f"No job handler registered as {name!r}")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def backoff(attempts):
+    """Seconds before retry number `attempts`, doubling with +-25% jitter"""
+    delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def claim(worker):
+    """Lock the next due job for `worker`, or None when there is nothing to do"""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by("run_at", "id")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.locked_at = now
+        job.locked_by = worker
+        job.save(update_fields=["status", "attempts", "locked_at", "locked_by"])
+    return job
+
+
+class Heartbeat:
+    """Refreshes the lock of a running job from a thread of its own"""
+
+    def __init__(self, job):
+        self.job = job
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name=f"job-heartbeat-{job.pk}", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def beat(self):
+        try:
+            while not self.stopped.wait(settings.JOB_HEARTBEAT_INTERVAL):
+                try:
+                    Job.objects.filter(pk=self.job.pk, status=Job.RUNNING, locked_by=self.job.locked_by).update(
+                        locked_at=timezone.now()
+                    )
+                except Exception:
+                    logger.exception("Could not refresh the lock of job %s", self.job)
+        finally:
+            connection.close()
+
+
+def run(job):
+    """Run a claimed job and record the outcome"""
+    started = time.monotonic()
+    try:
+        # handlers manage their own transactions, e.g. one per fan-out batch
+        with Heartbeat(job):
+            registry[job.name](**job.payload)
+    except Exception:
+        job.duration_ms = int((time.monotonic() - started) * 1000)
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+        logger.warning("Job %s attempt %s failed (%s)", job, job.attempts, job.status, exc_info=True)
+    else:
+        job.duration_ms = int((time.monotonic() - started) * 1000)
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+        logger.info("Job %s done in %s ms", job, job.duration_ms)
+    job.locked_at = None
+    job.save(update_fields=["status", "run_at", "locked_at", "last_error", "duration_ms", "finished_at"])
+    return job
+
+
+def requeue_stale():
+    """Hand out again the jobs whose worker died while running them"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(status=Job.QUEUED, locked_at=None)
+
+
+def work_off(worker="inline", limit=None):
+    """Run due jobs until none are left (or `limit` ran), returns how many ran"""
+    done = 0
+    while limit is None or done < limit:
+        job = claim(worker)
+        if job is None:
+            break
+        run(job)
+        done += 1
+    return done
+
+
+def worker_loop(name, stop):
+    """Claim and run jobs until `stop` is set, sleeping JOB_POLL_INTERVAL when idle"""
+    logger.info("Worker %s started", name)
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            job = claim(name)
+        except Exception:
+            logger.exception("Worker %s could not claim a job", name)
+            job = None
+        if job is None:
+            stop.wait(settings.JOB_POLL_INTERVAL)
+            continue
+        try:
+            run(job)
+        except Exception:
+            # the outcome could not be saved, the job is requeued once its lock goes stale
+            logger.exception("Worker %s lost job %s", name, job.pk)
+    close_old_connections()
+
+
+def worker_name(index):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def job_stats(since=None):
+    """Per job name: counts by status and run time of the finished ones"""
+    jobs = Job.objects.all()
+    if since is not None:
+        jobs = jobs.filter(created_at__gte=since)
+    rows = jobs.values("name").annotate(
+        queued=Count("id", filter=Q(status=Job.QUEUED)),
+        running=Count("id", filter=Q(status=Job.RUNNING)),
+        done=Count("id", filter=Q(status=Job.DONE)),
+        failed=Count("id", filter=Q(status=Job.FAILED)),
+        avg_ms=Avg("duration_ms", filter=Q(status=Job.DONE)),
+        max_ms=Max("duration_ms", filter=Q(status=Job.DONE)),
+    ).order_by("name")
+    return list(rows)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.stories.jobs import enqueue
+from apps.stories.models import Audio, ImageDerivative
+from apps.user.models import User
+
+
+class Command(BaseCommand):
+    help = "Queue derivative builds for audio covers and user photos that have none yet"
+
+    def handle(self, *args, **options):
+        sources = set(Audio.objects.exclude(cover_image="").exclude(cover_image=None).values_list("cover_image", flat=True))
+        sources |= set(User.objects.exclude(photo="").exclude(photo=None).values_list("photo", flat=True))
+        sources -= set(ImageDerivative.objects.filter(source__in=sources).values_list("source", flat=True))
+        for source in sorted(sources):
+            enqueue("media.images", source=source)
+        self.stdout.write(self.style.SUCCESS(f"Queued {len(sources)} image jobs"))
@@ -0,0 +1,92 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from apps.stories.models import Audio, AudioRendition, ImageDerivative
+from apps.stories.storage import PREFIX, blob_name, digest_of, media_storage
+from apps.user.models import User
+
+FIELDS = [(Audio, "audio_file"), (Audio, "cover_image"), (User, "photo")]
+
+
+def rename_references(old, new):
+    """Keys that name the original file: probing, renditions and image derivatives"""
+    Audio.objects.filter(probed_file=old).update(probed_file=new)
+    AudioRendition.objects.filter(source=old).update(source=new)
+    taken = ImageDerivative.objects.filter(source=new, size=OuterRef("size"), format=OuterRef("format"))
+    ImageDerivative.objects.filter(source=old).exclude(Exists(taken)).update(source=new)
+    ImageDerivative.objects.filter(source=old).delete()
+
+
+def is_referenced(name):
+    return any(model.objects.filter(**{field_name: name}).exists() for model, field_name in FIELDS)
+
+
+def copy_blob(storage, name, new):
+    """Store a copy of `name` as `new`, complete or not at all"""
+    target = storage.path(new)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f"{target}.{os.getpid()}.tmp"
+    shutil.copyfile(storage.path(name), temporary)
+    os.replace(temporary, target)
+
+
+class Command(BaseCommand):
+    help = "Move uploads stored under their upload names into the content-addressed store, merging duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be merged")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        storage = media_storage()
+        blobs = {}  # old name -> (blob name, digest, size)
+        stored = set()
+        merged = freed = missing = 0
+
+        for model, field_name in FIELDS:
+            rows = (
+                model.objects.exclude(**{f"{field_name}__startswith": PREFIX})
+                .exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+                .values_list("pk", field_name)
+            )
+            for pk, name in rows.iterator():
+                if name not in blobs:
+                    if not storage.exists(name):
+                        missing += 1
+                        self.stderr.write(f"Missing: {model.__name__} {pk} {field_name}={name}")
+                        continue
+                    with storage.open(name, "rb") as file:
+                        digest = digest_of(file)
+                    size = storage.size(name)
+                    new = blob_name(digest, name)
+                    if new in stored or storage.blobs.filter(name=new).exists():
+                        merged += 1
+                        freed += size
+                    elif not dry_run and not storage.exists(new):
+                        # copied, not moved: the rows still name the original
+                        copy_blob(storage, name, new)
+                    stored.add(new)
+                    blobs[name] = (new, digest, size)
+                if dry_run:
+                    continue
+                new, digest, size = blobs[name]
+                with transaction.atomic():
+                    storage.add_reference(new, digest, size)
+                    model.objects.filter(pk=pk).update(**{field_name: new})
+                    rename_references(name, new)
+
+        if not dry_run:
+            # the originals, once no row names them any more
+            for name in blobs:
+                if storage.exists(name) and not is_referenced(name):
+                    os.remove(storage.path(name))
+
+        verb = "Would merge" if dry_run else "Merged"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {merged} duplicates of {len(blobs)} files, "
+            f"{freed / 1024 / 1024:.1f} MiB freed ({missing} missing)"
+        ))
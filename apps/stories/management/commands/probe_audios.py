@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from apps.stories.jobs import enqueue
+from apps.stories.models import Audio
+
+
+class Command(BaseCommand):
+    help = "Queue header probing (then transcoding) for audios whose file was never probed or has no checksum"
+
+    def handle(self, *args, **options):
+        audios = Audio.objects.exclude(audio_file="").filter(~Q(probed_file=F("audio_file")) | Q(file_sha256=""))
+        queued = 0
+        for audio_id in audios.values_list("id", flat=True).iterator():
+            enqueue("media.probe", audio_id=audio_id)
+            queued += 1
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} probe jobs"))
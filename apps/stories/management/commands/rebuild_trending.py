@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.stories.trending import rebuild_trending
+
+
+class Command(BaseCommand):
+    help = "Recompute every hourly play bucket and trending score from History"
+
+    def handle(self, *args, **options):
+        consumed = rebuild_trending()
+        self.stdout.write(self.style.SUCCESS(f"Trending rebuilt from {consumed} play(s)"))
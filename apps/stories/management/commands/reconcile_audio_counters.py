@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.stories.models import Audio
+
+
+class Command(BaseCommand):
+    help = "Recompute Audio.like_count and Audio.comment_count from the Like and Comment tables"
+
+    def handle(self, *args, **options):
+        fixed = Audio.reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled counters, {fixed} audio(s) had drifted"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.stories.fanout import resume_fan_outs
+
+
+class Command(BaseCommand):
+    help = "Finish notification fan-outs interrupted before their last batch"
+
+    def handle(self, *args, **options):
+        fan_outs = resume_fan_outs()
+        for fan_out in fan_outs:
+            self.stdout.write(f"Fan-out {fan_out.pk}: {fan_out.sent} notification(s) sent")
+        self.stdout.write(self.style.SUCCESS(f"Resumed {len(fan_outs)} fan-out(s)"))
@@ -0,0 +1,66 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.utils.module_loading import import_string
+
+from apps.stories.jobs import requeue_stale, work_off, worker_loop, worker_name
+from apps.stories.pubsub import LocalBackend
+
+
+class Command(BaseCommand):
+    help = "Run background jobs with a pool of worker threads or processes until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.JOB_WORKERS, help="Pool size")
+        parser.add_argument(
+            "--processes", action="store_true",
+            help="One process per worker instead of threads (for CPU-bound jobs such as transcoding)",
+        )
+        parser.add_argument("--once", action="store_true", help="Run the jobs due now and exit")
+
+    def handle(self, *args, **options):
+        if import_string(settings.NOTIFICATION_PUBSUB_BACKEND) is LocalBackend:
+            raise CommandError(
+                "NOTIFICATION_PUBSUB_BACKEND is LocalBackend, so the notifications these jobs push would only reach "
+                "this process and never the live streams of the web app. Use apps.stories.pubsub.PostgresBackend."
+            )
+        requeue_stale()
+        if options["once"]:
+            done = work_off(worker_name("once"))
+            self.stdout.write(self.style.SUCCESS(f"Ran {done} job(s)"))
+            return
+
+        if options["processes"]:
+            stop = multiprocessing.Event()
+            connections.close_all()  # never share a connection with the forked workers
+            context = multiprocessing.get_context("fork")
+            pool = [
+                context.Process(target=worker_loop, args=(worker_name(f"p{i}"), stop), name=f"worker-{i}")
+                for i in range(options["workers"])
+            ]
+        else:
+            stop = threading.Event()
+            pool = [
+                threading.Thread(target=worker_loop, args=(worker_name(i), stop), name=f"worker-{i}")
+                for i in range(options["workers"])
+            ]
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+        for worker in pool:
+            worker.start()
+        self.stdout.write(f"{len(pool)} worker(s) running, stop with Ctrl+C or SIGTERM")
+
+        # hand out again the jobs of workers that died mid-run
+        while not stop.wait(min(60, settings.JOB_LOCK_TIMEOUT / 2)):
+            close_old_connections()
+            requeue_stale()
+
+        self.stdout.write("Stopping, waiting for running jobs to finish")
+        for worker in pool:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped"))
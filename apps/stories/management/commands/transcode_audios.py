@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from apps.stories.jobs import enqueue
+from apps.stories.models import Audio, AudioRendition
+
+
+class Command(BaseCommand):
+    help = "Queue transcoding for audios without current renditions (e.g. uploaded before the pipeline)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Also redo audios whose renditions are current")
+
+    def handle(self, *args, **options):
+        audios = Audio.objects.exclude(audio_file="")
+        if not options["all"]:
+            current = AudioRendition.objects.filter(audio=OuterRef("pk"), source=OuterRef("audio_file"))
+            audios = audios.exclude(Exists(current))
+        queued = 0
+        for audio_id in audios.values_list("id", flat=True).iterator():
+            enqueue("media.transcode", max_attempts=3, audio_id=audio_id, force=options["all"])
+            queued += 1
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} transcode jobs"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.stories.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = "Fold new History plays into the hourly buckets and trending scores (run from cron)"
+
+    def handle(self, *args, **options):
+        consumed = update_trending()
+        self.stdout.write(self.style.SUCCESS(f"Trending updated from {consumed} new play(s)"))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Audio = apps.get_model('stories', 'Audio')
+    Like = apps.get_model('stories', 'Like')
+    Comment = apps.get_model('stories', 'Comment')
+
+    def count_of(model):
+        rows = model.objects.filter(audio=OuterRef('pk')).values('audio').annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(rows), 0)
+
+    Audio.objects.update(like_count=count_of(Like), comment_count=count_of(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0005_searchhistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audio',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='audio',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0006_audio_like_count_audio_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audio',
+            index=models.Index(fields=['-created_at', '-id'], name='audio_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audio',
+            index=models.Index(fields=['-play_count', '-created_at', '-id'], name='audio_popular_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0007_audio_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='history',
+            name='played_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
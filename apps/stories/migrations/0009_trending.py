@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0008_alter_history_played_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_history_id', models.BigIntegerField(default=0)),
+                ('epoch', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('audio', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='stories.audio')),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-audio'], name='trending_score_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AudioPlayBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('audio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='play_buckets', to='stories.audio')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('audio', 'hour'), name='unique_audio_play_bucket')],
+            },
+        ),
+    ]
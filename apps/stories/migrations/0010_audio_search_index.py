@@ -0,0 +1,50 @@
+from django.db import migrations
+
+POSTGRES_CREATE = """
+CREATE TABLE stories_audio_search (
+    audio_id bigint PRIMARY KEY REFERENCES stories_audio (id) ON DELETE CASCADE,
+    document tsvector NOT NULL
+);
+CREATE INDEX stories_audio_search_document_idx ON stories_audio_search USING GIN (document);
+INSERT INTO stories_audio_search (audio_id, document)
+SELECT a.id,
+       setweight(to_tsvector('simple', coalesce(a.title, '')), 'A') ||
+       setweight(to_tsvector('simple', coalesce(a.artist, '')), 'B') ||
+       setweight(to_tsvector('simple', coalesce(c.name, '')), 'B') ||
+       setweight(to_tsvector('simple', coalesce(a.description, '')), 'C')
+FROM stories_audio a LEFT JOIN stories_category c ON c.id = a.category_id;
+"""
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE stories_audio_search USING fts5(
+    title, artist, category, description, tokenize = 'unicode61 remove_diacritics 2'
+);
+INSERT INTO stories_audio_search (rowid, title, artist, category, description)
+SELECT a.id, a.title, a.artist, coalesce(c.name, ''), coalesce(a.description, '')
+FROM stories_audio a LEFT JOIN stories_category c ON c.id = a.category_id;
+"""
+
+
+def create_index(apps, schema_editor):
+    sql = {"postgresql": POSTGRES_CREATE, "sqlite": SQLITE_CREATE}.get(schema_editor.connection.vendor)
+    if sql:
+        with schema_editor.connection.cursor() as cursor:
+            for statement in sql.split(";"):
+                if statement.strip():
+                    cursor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("postgresql", "sqlite"):
+        schema_editor.execute("DROP TABLE IF EXISTS stories_audio_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0009_trending'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
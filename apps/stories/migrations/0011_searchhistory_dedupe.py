@@ -0,0 +1,75 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:02
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+# SEARCH_HISTORY_LIMIT when this migration was written, so its result does
+# not depend on the settings of the deploy that runs it
+HISTORY_LIMIT = 50
+
+
+def dedupe_history(apps, schema_editor):
+    """Normalize existing queries and keep only the latest row per user and query"""
+    SearchHistory = apps.get_model('stories', 'SearchHistory')
+    SearchHistory.objects.update(searched_at=models.F('created_at'))
+    batch = []
+    for row in SearchHistory.objects.only('id', 'query').iterator(chunk_size=2000):
+        row.normalized_query = " ".join(row.query.casefold().split())[:255]
+        batch.append(row)
+        if len(batch) == 2000:
+            SearchHistory.objects.bulk_update(batch, ['normalized_query'])
+            batch = []
+    SearchHistory.objects.bulk_update(batch, ['normalized_query'])
+
+    table = schema_editor.quote_name(SearchHistory._meta.db_table)
+    for partition, order, keep in [
+        # duplicates: the latest row per user and query stays
+        ('user_id, normalized_query', 'created_at DESC, id DESC', 1),
+        # the most recent HISTORY_LIMIT queries per user stay
+        ('user_id', 'searched_at DESC, id DESC', HISTORY_LIMIT),
+    ]:
+        schema_editor.execute(f"""
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {order}) AS position
+                    FROM {table}
+                ) ranked WHERE position > %s
+            )
+        """, [keep])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0010_audio_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchhistory',
+            name='normalized_query',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='searchhistory',
+            name='searched_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(dedupe_history, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='searchhistory',
+            options={'ordering': ['-searched_at', '-id']},
+        ),
+        migrations.AddConstraint(
+            model_name='searchhistory',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_query'), name='search_history_user_query_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='searchhistory',
+            index=models.Index(fields=['user', '-searched_at', '-id'], name='search_history_recent_idx'),
+        ),
+    ]
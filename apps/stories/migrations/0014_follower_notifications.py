@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0013_broadcasts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationfanout',
+            name='followers_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stories.category'),
+        ),
+        migrations.AddIndex(
+            model_name='followcategory',
+            index=models.Index(fields=['category', 'user'], name='follow_category_user_idx'),
+        ),
+    ]
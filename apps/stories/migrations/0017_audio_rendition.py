@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0016_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20)),
+                ('bitrate', models.PositiveIntegerField()),
+                ('codec', models.CharField(max_length=20)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('playlist', models.FileField(max_length=255, upload_to='')),
+                ('source', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('audio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='stories.audio')),
+            ],
+            options={
+                'ordering': ['bitrate'],
+                'constraints': [models.UniqueConstraint(fields=('audio', 'name'), name='audio_rendition_uniq')],
+            },
+        ),
+    ]
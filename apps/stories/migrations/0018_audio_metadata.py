@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:48
+
+import apps.stories.probe
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0017_audio_rendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audio',
+            name='bitrate',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='audio',
+            name='channels',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='audio',
+            name='codec',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='audio',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='audio',
+            name='probed_file',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='audio',
+            name='sample_rate',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='audio',
+            name='audio_file',
+            field=models.FileField(upload_to='audios/', validators=[apps.stories.probe.validate_audio_file]),
+        ),
+    ]
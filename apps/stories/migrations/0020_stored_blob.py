@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:57
+
+import apps.stories.probe
+import apps.stories.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0019_image_derivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('digest', models.CharField(max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='audio',
+            name='audio_file',
+            field=models.FileField(storage=apps.stories.storage.media_storage, upload_to='audios/', validators=[apps.stories.probe.validate_audio_file]),
+        ),
+        migrations.AlterField(
+            model_name='audio',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=apps.stories.storage.media_storage, upload_to='cover/'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:15
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def checkpoint_by_time(apps, schema_editor):
+    """Continue right after the latest play already aggregated"""
+    History = apps.get_model("stories", "History")
+    TrendingState = apps.get_model("stories", "TrendingState")
+    for state in TrendingState.objects.filter(last_history_id__gt=0):
+        last = History.objects.filter(id__lte=state.last_history_id).aggregate(last=Max("played_at"))["last"]
+        state.played_until = last + timedelta(microseconds=1) if last else None
+        state.save(update_fields=["played_until"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0020_stored_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trendingstate',
+            name='played_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(checkpoint_by_time, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='trendingstate',
+            name='last_history_id',
+        ),
+        migrations.AlterField(
+            model_name='history',
+            name='played_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
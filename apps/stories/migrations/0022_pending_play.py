@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0021_trending_played_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPlay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plays', models.PositiveIntegerField(default=1)),
+                ('audio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stories.audio')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0022_pending_play'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audio',
+            name='file_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='audiorendition',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -1,8 +1,16 @@
+import posixpath
+
 from django.db import models
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 
 # Create your models here.
 from apps.user.models import User
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from .counters import play_counter
+from .probe import validate_audio_file
+from .storage import media_storage
 
 
 class Category(models.Model):
@@ -16,22 +24,123 @@ class Audio (models.Model):
     title= models.CharField(max_length=200)
     artist= models.CharField(max_length=150)
     description= models.TextField(null=True, blank= True)
-    cover_image= models.ImageField(upload_to='cover/', null=True, blank= True)
-    audio_file= models.FileField(upload_to='audios/')
-    duration= models.DurationField(null=False, blank= False)
+    cover_image= models.ImageField(upload_to='cover/', storage=media_storage, null=True, blank= True)
+    audio_file= models.FileField(upload_to='audios/', storage=media_storage, validators=[validate_audio_file])
+    # filled from the file headers by the "media.probe" job (see probe.py)
+    duration= models.DurationField(null=True, blank= True)
+    codec= models.CharField(max_length=20, blank=True)
+    bitrate= models.PositiveIntegerField(null=True, blank=True)  # kbit/s
+    sample_rate= models.PositiveIntegerField(null=True, blank=True)
+    channels= models.PositiveSmallIntegerField(null=True, blank=True)
+    file_size= models.PositiveBigIntegerField(null=True, blank=True)
+    probed_file= models.CharField(max_length=255, blank=True, editable=False)  # audio_file the above describe
+    file_sha256= models.CharField(max_length=64, blank=True, editable=False)
     category= models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     
     play_count= models.PositiveIntegerField(default=0)
+    like_count= models.PositiveIntegerField(default=0)
+    comment_count= models.PositiveIntegerField(default=0)
     is_premium= models.BooleanField(default=False)
     created_at= models.DateTimeField(auto_now_add= True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination: latest and popular/top orderings
+            models.Index(fields=["-created_at", "-id"], name="audio_latest_idx"),
+            models.Index(fields=["-play_count", "-created_at", "-id"], name="audio_popular_idx"),
+        ]
     
     def increment_play(self):
-        self.play_count+=1
-        self.save(update_fields=["play_count"])
+        """Buffer one play; play_count then includes the plays not flushed yet"""
+        self.play_count = play_counter.add(self.pk)
+
+    @classmethod
+    def adjust_counters(cls, audio_id, likes=0, comments=0):
+        """Apply like/comment deltas with a single F-expression UPDATE"""
+        changes = {}
+        if likes:
+            changes["like_count"] = Greatest(F("like_count") + likes, 0)
+        if comments:
+            changes["comment_count"] = Greatest(F("comment_count") + comments, 0)
+        if changes:
+            cls.objects.filter(pk=audio_id).update(**changes)
+
+    @classmethod
+    def reconcile_counters(cls):
+        """Recompute like/comment counters from the source tables, returns rows fixed"""
+        def count_of(model):
+            rows = model.objects.filter(audio=OuterRef("pk")).values("audio").annotate(total=Count("id")).values("total")
+            return Coalesce(Subquery(rows), 0)
+
+        drifted = cls.objects.alias(
+            actual_likes=count_of(Like), actual_comments=count_of(Comment)
+        ).filter(~Q(like_count=F("actual_likes")) | ~Q(comment_count=F("actual_comments")))
+        return drifted.update(like_count=count_of(Like), comment_count=count_of(Comment))
     
     def __str__(self):
         return self.title
     
+class AudioRendition(models.Model):
+    """One transcoded bitrate of an audio: a progressive file and its HLS segments (see transcode.py)"""
+    audio = models.ForeignKey(Audio, on_delete=models.CASCADE, related_name="renditions")
+    name = models.CharField(max_length=20)  # low / medium / high
+    bitrate = models.PositiveIntegerField()  # kbit/s
+    codec = models.CharField(max_length=20)
+    file = models.FileField(max_length=255)
+    playlist = models.FileField(max_length=255)
+    # the audio_file it was made from, a new upload makes it stale
+    source = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)  # of `file`, for download manifests
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["bitrate"]
+        constraints = [
+            models.UniqueConstraint(fields=["audio", "name"], name="audio_rendition_uniq"),
+        ]
+
+    @property
+    def master_playlist(self):
+        """The HLS master playlist listing every rendition, next to the progressive files"""
+        return posixpath.join(posixpath.dirname(self.file.name), "master.m3u8")
+
+    def __str__(self):
+        return f"{self.audio_id} {self.name} ({self.bitrate} kbit/s)"
+
+
+class StoredBlob(models.Model):
+    """A file of the content-addressed media store and how many fields refer to it, see storage.py"""
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64)  # sha256 of the content
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class ImageDerivative(models.Model):
+    """A resized copy of an uploaded image (cover, user photo), see images.py"""
+    source = models.CharField(max_length=255)  # storage name of the original
+    size = models.CharField(max_length=20)  # thumbnail / card / full
+    format = models.CharField(max_length=10)  # webp / jpeg
+    file = models.FileField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    bytes = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "size", "format"], name="image_derivative_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.size}.{self.format}"
+
+
 class FollowCategory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followed_categories")
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="followers")
@@ -39,6 +148,10 @@ class FollowCategory(models.Model):
 
     class Meta:
         unique_together = ('user', 'category')  
+        indexes = [
+            # followers of a category in user id order, for notification fan-out
+            models.Index(fields=["category", "user"], name="follow_category_user_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.full_name} follows {self.category.name}"
@@ -50,9 +163,16 @@ class Notification(models.Model):
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    
-    
-    
+
+    class Meta:
+        indexes = [
+            # the user's feed, newest first
+            models.Index(fields=["user", "-created_at", "-id"], name="notification_feed_idx"),
+            # unread badge and mark-read only touch unread rows
+            models.Index(fields=["user", "id"], condition=models.Q(is_read=False), name="notification_unread_idx"),
+        ]
+
+
 class Playlist(models.Model):
     user= models.ForeignKey(User, on_delete=models.CASCADE)
     audios = models.ManyToManyField(Audio, related_name="playlists")
@@ -65,7 +185,7 @@ class Playlist(models.Model):
 class History(models.Model):
     user= models.ForeignKey(User, on_delete=models.CASCADE)
     audio= models.ForeignKey(Audio, on_delete=models.CASCADE)
-    played_at= models.DateTimeField(auto_now_add=True)
+    played_at= models.DateTimeField(default=timezone.now, db_index=True)
     last_viewed= models.DateTimeField(auto_now=True)
     duration_played= models.FloatField(default=0)
     completed= models.BooleanField(default=False)
@@ -94,12 +214,138 @@ class Download(models.Model):
     
     
 class SearchHistory(models.Model):
+    """One row per user and normalized query, bumped when the query is repeated"""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     query = models.CharField(max_length=255)
+    normalized_query = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    searched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-searched_at', '-id']
+        constraints = [
+            models.UniqueConstraint(fields=["user", "normalized_query"], name="search_history_user_query_uniq"),
+        ]
+        indexes = [
+            # per-user listing and trimming, newest first
+            models.Index(fields=["user", "-searched_at", "-id"], name="search_history_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} searched {self.query}"    
+
+class PendingPlay(models.Model):
+    """Plays of an audio not yet added to its play_count (see counters.py)"""
+    audio = models.ForeignKey(Audio, on_delete=models.CASCADE, related_name="+")
+    plays = models.PositiveIntegerField(default=1)
+
+
+class AudioPlayBucket(models.Model):
+    """Plays of one audio within one clock hour, aggregated from History"""
+    audio = models.ForeignKey(Audio, on_delete=models.CASCADE, related_name="play_buckets")
+    hour = models.DateTimeField()
+    plays = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["audio", "hour"], name="unique_audio_play_bucket"),
+        ]
+
+
+class TrendingScore(models.Model):
+    """Exponentially decayed play score, stored relative to TrendingState.epoch"""
+    audio = models.OneToOneField(Audio, on_delete=models.CASCADE, primary_key=True, related_name="trending")
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score", "-audio"], name="trending_score_idx"),
+        ]
+
+
+class TrendingState(models.Model):
+    """Single row: History played_at aggregated up to (exclusive) and the epoch scores are scaled to"""
+    played_until = models.DateTimeField(null=True, blank=True)
+    epoch = models.DateTimeField(default=timezone.now)
+
+
+class NotificationFanOut(models.Model):
+    """
+    One notification sent to every user (or every follower of a category),
+    inserted in batches. `last_user_id` is the checkpoint: users up to it
+    have their row, so an interrupted fan-out resumes after it.
+    """
+    audio = models.ForeignKey(Audio, on_delete=models.CASCADE, null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    # deliver only to users following this category, everyone when empty
+    followers_of = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    message = models.TextField()
+    last_user_id = models.BigIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.message} ({self.sent} sent)"
+
+
+class Broadcast(models.Model):
+    """
+    A notification for every user (new story, new category), stored once
+    and merged into each user's notification list when it is read.
+    """
+    audio = models.ForeignKey(Audio, on_delete=models.CASCADE, null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    message = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.message
+
+
+class BroadcastReceipt(models.Model):
+    """Per-user state of one broadcast, only written when the user reads or dismisses it"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="broadcast_receipts")
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, related_name="receipts")
+    is_read = models.BooleanField(default=False)
+    is_dismissed = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "broadcast"], name="unique_broadcast_receipt"),
+        ]
+
+
+class NotificationCursor(models.Model):
+    """Every broadcast with an id up to `last_read_broadcast_id` is read for the user"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="notification_cursor")
+    last_read_broadcast_id = models.BigIntegerField(default=0)
+
+
+class Job(models.Model):
+    """A unit of background work, claimed by `manage.py run_workers` (see jobs.py)"""
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
-        ordering = ['-created_at']
+        indexes = [
+            # workers only ever scan the due, queued rows
+            models.Index(fields=["run_at", "id"], condition=models.Q(status="queued"), name="job_queued_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} searched {self.query}"    
\ No newline at end of file
+        return f"{self.name} #{self.pk} ({self.status})"
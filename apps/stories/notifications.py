@@ -0,0 +1,157 @@
+"""
+A user's notification list is their personal Notification rows (e.g.
+subscription reminders, new stories in followed categories) merged with
+the Broadcasts published since they joined, unless they turned off
+`receive_announcements`. Publishing a broadcast is a single INSERT
+whatever the user count; read state comes from the user's
+NotificationCursor plus the sparse BroadcastReceipt rows written when
+they read or dismiss one broadcast.
+"""
+from django.db import transaction
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Broadcast, BroadcastReceipt, Notification, NotificationCursor
+from .pagination import InvalidCursor, KeysetPaginator
+from .pubsub import BROADCAST_CHANNEL, broker, user_channel
+
+# sort order of the merged feed; at equal timestamps personal rows come first
+FEED_ORDERING = ("-created_at", "-rank", "-id")
+BROADCAST, PERSONAL = 0, 1
+
+
+def publish(message, audio=None, category=None):
+    broadcast = Broadcast.objects.create(message=message, audio=audio, category=category)
+    transaction.on_commit(lambda: broker.publish(BROADCAST_CHANNEL, {"type": "broadcast", "id": broadcast.id}))
+    return broadcast
+
+
+def push(notifications):
+    """Send new personal notifications to their users' live streams once committed"""
+    events = [(user_channel(item.user_id), {"type": "personal", "id": item.id}) for item in notifications]
+
+    def send():
+        for channel, message in events:
+            broker.publish(channel, message)
+    transaction.on_commit(send)
+
+
+def broadcasts_for(user):
+    """Broadcasts visible to `user`, annotated with `is_read`"""
+    if not user.receive_announcements:
+        return Broadcast.objects.none()
+    receipts = BroadcastReceipt.objects.filter(user=user, broadcast=OuterRef("pk"))
+    cursor = NotificationCursor.objects.filter(user=user).values("last_read_broadcast_id")
+    return (
+        Broadcast.objects.filter(created_at__gte=user.date_joined)
+        .exclude(Exists(receipts.filter(is_dismissed=True)))
+        .annotate(is_read=ExpressionWrapper(
+            Q(id__lte=Coalesce(Subquery(cursor), 0)) | Q(Exists(receipts.filter(is_read=True))),
+            output_field=BooleanField(),
+        ))
+    )
+
+
+def personal_for(user):
+    return Notification.objects.filter(user=user)
+
+
+def before(queryset, rank, cursor):
+    """Rows of one source that sort after the (created_at, rank, id) cursor"""
+    created_at, cursor_rank, cursor_id = cursor
+    if rank < cursor_rank:
+        return queryset.filter(created_at__lte=created_at)
+    if rank > cursor_rank:
+        return queryset.filter(created_at__lt=created_at)
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=cursor_id))
+
+
+def feed(user, request):
+    """
+    Returns (items, pagination): personal notifications and broadcasts
+    merged newest first, one keyset page of each source per request.
+    `since_id` / `since_broadcast_id` keep only rows newer than the ones
+    the client already has, so polling fetches just the new rows (follow
+    `next_cursor` first when a poll returns a full page).
+    """
+    paginator = KeysetPaginator(FEED_ORDERING)
+    page_size = paginator.get_page_size(request)
+    cursor = request.GET.get("cursor")
+    cursor = paginator.decode_cursor(cursor, Notification) if cursor else None
+
+    sources = [
+        (personal_for(user), PERSONAL, "since_id"),
+        (broadcasts_for(user), BROADCAST, "since_broadcast_id"),
+    ]
+    rows, latest = [], {}
+    for queryset, rank, since_param in sources:
+        try:
+            latest[rank] = since = int(request.GET.get(since_param, 0))
+        except ValueError:
+            raise InvalidCursor(f"{since_param} must be an integer.")
+        if since:
+            queryset = queryset.filter(id__gt=since)
+        if cursor:
+            queryset = before(queryset, rank, cursor)
+        page = queryset.select_related("audio", "category").order_by("-created_at", "-id")[:page_size + 1]
+        rows += [(row.created_at, rank, row.id, row) for row in page]
+
+    rows.sort(key=lambda row: row[:3], reverse=True)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    for _, rank, row_id, _ in rows:
+        latest[rank] = max(latest[rank], row_id)
+    return [row[3] for row in rows], {
+        "page_size": page_size,
+        "next_cursor": paginator.encode_cursor(dict(zip(("created_at", "rank", "id"), rows[-1][:3])))
+        if has_more else None,
+        # pass back as since_id / since_broadcast_id on the next poll
+        "latest_id": latest[PERSONAL],
+        "latest_broadcast_id": latest[BROADCAST],
+    }
+
+
+def unread_counts(user):
+    personal = personal_for(user).filter(is_read=False).count()
+    broadcasts = broadcasts_for(user).filter(is_read=False).count()
+    return {"unread": personal + broadcasts, "personal": personal, "broadcasts": broadcasts}
+
+
+def mark_read(user, up_to_id=None, up_to_broadcast_id=None):
+    """
+    Mark personal notifications up to `up_to_id` and broadcasts up to
+    `up_to_broadcast_id` read. Only the kinds given are touched, with
+    neither everything is marked read.
+    """
+    everything = up_to_id is None and up_to_broadcast_id is None
+    updated = 0
+    if everything or up_to_id is not None:
+        unread = personal_for(user).filter(is_read=False)
+        if up_to_id is not None:
+            unread = unread.filter(id__lte=up_to_id)
+        updated = unread.update(is_read=True)
+    if everything or up_to_broadcast_id is not None:
+        last_read = advance_cursor(user, up_to_broadcast_id)
+    else:
+        last_read = (
+            NotificationCursor.objects.filter(user=user).values_list("last_read_broadcast_id", flat=True).first() or 0
+        )
+    return {"marked": updated, "last_read_broadcast_id": last_read}
+
+
+def set_receipt(user, broadcast, **state):
+    BroadcastReceipt.objects.update_or_create(user=user, broadcast=broadcast, defaults=state)
+
+
+def advance_cursor(user, up_to_id=None):
+    """Mark every broadcast up to `up_to_id` (default: the latest) read"""
+    if up_to_id is None:
+        up_to_id = Broadcast.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    cursor, created = NotificationCursor.objects.get_or_create(
+        user=user, defaults={"last_read_broadcast_id": up_to_id}
+    )
+    if not created and cursor.last_read_broadcast_id < up_to_id:
+        NotificationCursor.objects.filter(user=user, last_read_broadcast_id__lt=up_to_id).update(
+            last_read_broadcast_id=up_to_id
+        )
+    return max(cursor.last_read_broadcast_id, up_to_id)
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+LATEST_ORDERING = ("-created_at", "-id")
+POPULAR_ORDERING = ("-play_count", "-created_at", "-id")
+TRENDING_ORDERING = ("-score", "-audio_id")
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination keyed on the queryset sort order.
+
+    The cursor carries the sort key of the last row of the previous page,
+    so every page is a range scan on the ordering index instead of an
+    OFFSET. Rows are never skipped or repeated because the key always ends
+    with `id`; only rows whose own key changed (e.g. a play count moving
+    across the page boundary) can shift between pages.
+    """
+    salt = "stories.cursor"
+
+    def __init__(self, ordering, page_size=None):
+        self.ordering = [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+        self.page_size = page_size
+
+    def get_page_size(self, request):
+        default = settings.CATALOG_PAGE_SIZE
+        try:
+            size = int(request.GET.get("page_size", self.page_size or default))
+        except ValueError:
+            size = default
+        return max(1, min(size, settings.CATALOG_MAX_PAGE_SIZE))
+
+    def encode_cursor(self, row):
+        values = []
+        for name, _ in self.ordering:
+            value = getattr(row, name) if not isinstance(row, dict) else row[name]
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        return signing.dumps(values, salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor, model):
+        try:
+            values = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            raise InvalidCursor("Invalid pagination cursor.")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor("Invalid pagination cursor.")
+        decoded = []
+        for (name, _), value in zip(self.ordering, values):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                decoded.append(value)  # annotation, stored as plain JSON
+                continue
+            try:
+                decoded.append(field.to_python(value))
+            except ValidationError:
+                raise InvalidCursor("Invalid pagination cursor.")
+        return decoded
+
+    def after(self, values):
+        """Build `(a, b, c) > (va, vb, vc)` honouring each column's direction"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = f"{name}__lt" if descending else f"{name}__gt"
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        return condition
+
+    def paginate(self, queryset, request):
+        """Returns (rows, pagination) for the page selected by `?cursor=`"""
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*(f"-{name}" if desc else name for name, desc in self.ordering))
+
+        cursor = request.GET.get("cursor")
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor, queryset.model)))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        return rows, {
+            "page_size": page_size,
+            "next_cursor": self.encode_cursor(rows[-1]) if has_more else None,
+        }
@@ -0,0 +1,319 @@
+"""
+Audio metadata from container headers, without decoding.
+
+`probe(file)` reads a seekable binary file a few bytes at a time and
+returns an AudioInfo (codec, duration, bitrate, sample rate, channels):
+
+- MP3: skips ID3v2, parses the first frame header, then takes the frame
+  count from a Xing/Info or VBRI header or, when there is none, walks the
+  frame headers seeking past each payload;
+- Ogg Opus/Vorbis: the identification header of the first page and the
+  granule position of the last page;
+- AAC (ADTS): walks the ADTS frame headers;
+- MP4/M4A: walks the box tree to `mvhd` and the first audio sample entry,
+  seeking past `mdat`.
+
+Anything else raises ProbeError. `validate_audio_file` uses the same
+sniffing to reject non-audio uploads at form validation time.
+"""
+import os
+import struct
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+
+# how far past ID3v2 (or junk) to look for the first MP3/ADTS frame
+SYNC_WINDOW = 64 * 1024
+CBR_CHECK_FRAMES = 8  # frame headers that must agree before an MP3 is taken as constant bitrate
+
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1 layer III
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],  # MPEG-2/2.5 layer III
+}
+MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 25: [11025, 12000, 8000]}
+ADTS_SAMPLE_RATES = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350]
+MP4_CODECS = {"mp4a": "aac", "Opus": "opus", "alac": "alac", ".mp3": "mp3", "fLaC": "flac"}
+
+
+class ProbeError(ValueError):
+    """Not an audio file this module understands, or a corrupt one"""
+
+
+@dataclass
+class AudioInfo:
+    codec: str
+    duration: float  # seconds
+    bitrate: int  # kbit/s, averaged over the file
+    sample_rate: int
+    channels: int
+
+
+def file_size(file):
+    position = file.tell()
+    size = file.seek(0, os.SEEK_END)
+    file.seek(position)
+    return size
+
+
+def id3_size(header):
+    """Length of the ID3v2 tag starting with these 10 bytes, 0 when there is none"""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = (header[6] & 0x7F) << 21 | (header[7] & 0x7F) << 14 | (header[8] & 0x7F) << 7 | header[9] & 0x7F
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def mp3_frame(header):
+    """(version, sample_rate, bitrate, channels, frame length, samples per frame) or None"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = {0: 25, 2: 2, 3: 1}.get(header[1] >> 3 & 3)
+    layer = header[1] >> 1 & 3
+    bitrate_index = header[2] >> 4
+    rate_index = header[2] >> 2 & 3
+    if version is None or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = MP3_BITRATES[1 if version == 1 else 2][bitrate_index]
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = header[2] >> 1 & 1
+    channels = 1 if header[3] >> 6 == 3 else 2
+    samples = 1152 if version == 1 else 576
+    length = (samples // 8) * bitrate * 1000 // sample_rate + padding
+    return version, sample_rate, bitrate, channels, length, samples
+
+
+def adts_frame(header):
+    """(sample_rate, channels, frame length, samples) or None"""
+    if len(header) < 7 or header[0] != 0xFF or header[1] & 0xF6 != 0xF0:
+        return None
+    rate_index = header[2] >> 2 & 0xF
+    if rate_index >= len(ADTS_SAMPLE_RATES):
+        return None
+    channels = (header[2] & 1) << 2 | header[3] >> 6
+    length = (header[3] & 3) << 11 | header[4] << 3 | header[5] >> 5
+    if length < 7:
+        return None
+    return ADTS_SAMPLE_RATES[rate_index], channels, length, ((header[6] & 3) + 1) * 1024
+
+
+def find_sync(file, start, matches):
+    """Offset of the first frame header accepted by `matches` within SYNC_WINDOW of `start`"""
+    file.seek(start)
+    window = file.read(SYNC_WINDOW)
+    offset = window.find(b"\xff")
+    while offset != -1:
+        if matches(window[offset:offset + 8]):
+            return start + offset
+        offset = window.find(b"\xff", offset + 1)
+    return None
+
+
+def sniff(file):
+    """Container of the file by its first bytes: "mp3", "adts", "ogg", "mp4" or None"""
+    position = file.tell()
+    try:
+        file.seek(0)
+        head = file.read(12)
+        if head[:4] == b"OggS":
+            return "ogg"
+        if head[4:8] == b"ftyp":
+            return "mp4"
+        start = id3_size(head)
+        if start:
+            file.seek(start)
+            head = file.read(8)
+        if mp3_frame(head):
+            return "mp3"
+        if adts_frame(head):
+            return "adts"
+        return None
+    finally:
+        file.seek(position)
+
+
+def cbr_frames(file, start, end, version, bitrate):
+    """
+    Frame count of a constant bitrate stream from its size, None when the
+    first CBR_CHECK_FRAMES frame headers do not all share one bitrate
+    """
+    file.seek(start)
+    data = file.read(min(end - start, CBR_CHECK_FRAMES * 1441 + 4))  # 1441: longest MPEG-1 layer III frame
+    offset = 0
+    for _ in range(CBR_CHECK_FRAMES):
+        frame = mp3_frame(data[offset:offset + 4])
+        if frame is None or frame[0] != version or frame[2] != bitrate:
+            return None
+        offset += frame[4]
+    sample_rate, samples = frame[1], frame[5]
+    # frames are padded a byte at a time to average out at this length
+    mean_length = samples / 8 * bitrate * 1000 / sample_rate
+    return round((end - start) / mean_length)
+
+
+def probe_mp3(file, size):
+    file.seek(0)
+    start = find_sync(file, id3_size(file.read(10)), mp3_frame)
+    if start is None:
+        raise ProbeError("No MPEG audio frame found")
+    file.seek(start)
+    first = file.read(4 + 32 + 26)
+    version, sample_rate, bitrate, channels, length, samples = mp3_frame(first)
+
+    end = size
+    file.seek(max(size - 128, 0))
+    if file.read(3) == b"TAG":  # ID3v1
+        end -= 128
+
+    frames = None
+    side_info = (32 if channels == 2 else 17) if version == 1 else (17 if channels == 2 else 9)
+    xing = first[4 + side_info:4 + side_info + 12]
+    if xing[:4] in (b"Xing", b"Info") and xing[7] & 1:
+        frames = struct.unpack(">I", xing[8:12])[0]
+    elif first[36:40] == b"VBRI":
+        frames = struct.unpack(">I", first[50:54])[0]
+
+    if frames is None:
+        frames = cbr_frames(file, start, end, version, bitrate)
+    if frames is None:
+        # no VBR header and the bitrate changes: count the frames, reading only their 4-byte headers
+        frames, offset = 0, start
+        while offset + 4 <= end:
+            file.seek(offset)
+            frame = mp3_frame(file.read(4))
+            if frame is None:
+                break
+            frames += 1
+            offset += frame[4]
+
+    duration = frames * samples / sample_rate
+    if not duration:
+        raise ProbeError("MPEG audio without frames")
+    return AudioInfo("mp3", duration, round((end - start) * 8 / duration / 1000), sample_rate, channels)
+
+
+def probe_adts(file, size):
+    file.seek(0)
+    offset = find_sync(file, id3_size(file.read(10)), adts_frame)
+    if offset is None:
+        raise ProbeError("No ADTS frame found")
+    start, samples, sample_rate, channels = offset, 0, 0, 0
+    while offset + 7 <= size:
+        file.seek(offset)
+        frame = adts_frame(file.read(7))
+        if frame is None:
+            break
+        sample_rate, channels, length, frame_samples = frame
+        samples += frame_samples
+        offset += length
+    if not samples:
+        raise ProbeError("AAC stream without frames")
+    duration = samples / sample_rate
+    return AudioInfo("aac", duration, round((offset - start) * 8 / duration / 1000), sample_rate, channels)
+
+
+def probe_ogg(file, size):
+    file.seek(0)
+    page = file.read(27)
+    if page[:4] != b"OggS":
+        raise ProbeError("Not an Ogg stream")
+    file.seek(27 + page[26])  # past the segment table
+    packet = file.read(32)
+    if packet[:8] == b"OpusHead":
+        codec, channels, pre_skip = "opus", packet[9], struct.unpack("<H", packet[10:12])[0]
+        sample_rate, clock = struct.unpack("<I", packet[12:16])[0] or 48000, 48000  # granules are always 48 kHz
+    elif packet[:7] == b"\x01vorbis":
+        codec, channels, pre_skip = "vorbis", packet[11], 0
+        sample_rate = clock = struct.unpack("<I", packet[12:16])[0]
+    else:
+        raise ProbeError("Unsupported Ogg codec")
+    serial = page[14:18]
+
+    # the last page of the stream carries the final granule position
+    tail_start = max(size - 65536, 0)
+    file.seek(tail_start)
+    tail = file.read()
+    granule, offset = None, len(tail)
+    while granule is None:
+        offset = tail.rfind(b"OggS", 0, offset)
+        if offset == -1:
+            raise ProbeError("No final Ogg page found")
+        if tail[offset + 14:offset + 18] == serial:
+            granule = struct.unpack("<q", tail[offset + 6:offset + 14])[0]
+    duration = max(granule - pre_skip, 0) / clock
+    if not duration or not clock:
+        raise ProbeError("Ogg stream without audio")
+    return AudioInfo(codec, duration, round(size * 8 / duration / 1000), sample_rate, channels)
+
+
+def boxes(file, start, end):
+    """(type, payload offset, payload end) of the MP4 boxes between two offsets"""
+    offset = start
+    while offset + 8 <= end:
+        file.seek(offset)
+        header = file.read(16)
+        if len(header) < 8:
+            return
+        box_size, kind = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if box_size == 1:
+            box_size, header_size = struct.unpack(">Q", header[8:16])[0], 16
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header_size:
+            return
+        yield kind.decode("latin-1"), offset + header_size, min(offset + box_size, end)
+        offset += box_size
+
+
+def probe_mp4(file, size):
+    duration = None
+    codec = sample_rate = channels = None
+
+    def walk(start, end):
+        nonlocal duration, codec, sample_rate, channels
+        for kind, payload, box_end in boxes(file, start, end):
+            if kind in ("moov", "trak", "mdia", "minf", "stbl"):
+                walk(payload, box_end)
+            elif kind == "mvhd":
+                file.seek(payload)
+                data = file.read(32)
+                if data[0] == 1:
+                    timescale, length = struct.unpack(">IQ", data[20:32])
+                else:
+                    timescale, length = struct.unpack(">II", data[12:20])
+                duration = length / timescale if timescale else None
+            elif kind == "stsd" and codec is None:
+                file.seek(payload + 8)  # version/flags, entry count
+                entry = file.read(36)
+                fourcc = entry[4:8].decode("latin-1")
+                if fourcc in MP4_CODECS:
+                    codec = MP4_CODECS[fourcc]
+                    channels = struct.unpack(">H", entry[24:26])[0]
+                    sample_rate = struct.unpack(">I", entry[32:36])[0] >> 16
+
+    walk(0, size)
+    if not duration or codec is None:
+        raise ProbeError("No audio track in MP4 container")
+    return AudioInfo(codec, duration, round(size * 8 / duration / 1000), sample_rate, channels)
+
+
+PROBES = {"mp3": probe_mp3, "adts": probe_adts, "ogg": probe_ogg, "mp4": probe_mp4}
+
+
+def probe(file):
+    kind = sniff(file)
+    if kind is None:
+        raise ProbeError("Not a supported audio file (MP3, AAC, Ogg Opus/Vorbis or MP4)")
+    try:
+        return PROBES[kind](file, file_size(file))
+    except (struct.error, IndexError, ZeroDivisionError) as exc:
+        raise ProbeError(f"Corrupt {kind} headers: {exc}")
+
+
+def validate_audio_file(value):
+    """Model field validator: new uploads must look like audio (already stored files are skipped)"""
+    if getattr(value, "_committed", False):
+        return
+    if sniff(value) is None:
+        raise ValidationError("Upload an MP3, AAC, Ogg (Opus/Vorbis) or M4A audio file.")
@@ -0,0 +1,168 @@
+"""
+Publish/subscribe for live notification events.
+
+Subscribers are asyncio queues held by the SSE connections of this
+process (see events.py). Publishing goes through the backend named by
+NOTIFICATION_PUBSUB_BACKEND, which hands every message back to
+`broker.deliver` in each process that should see it:
+
+- PostgresBackend sends it with NOTIFY and runs a LISTEN thread in every
+  process, so the SSE streams of the web workers receive what the job
+  workers (`manage.py run_workers`) publish.
+- LocalBackend delivers straight to this process only. Fan-outs and
+  reminders run in the job workers, so it is for tests and single-process
+  setups that run no workers.
+
+Messages are small dicts such as {"type": "personal", "id": 42}; the
+subscriber loads the row itself.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CHANNEL = "broadcast"
+
+# put on a subscriber's queue when it fell too far behind
+OVERFLOW = object()
+
+
+class LocalBackend:
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+
+class PostgresBackend:
+    """NOTIFY on publish, a LISTEN thread per process on delivery"""
+    channel = "stories_events"
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+        threading.Thread(target=self._listen, name="pubsub-listen", daemon=True).start()
+
+    def publish(self, channel, message):
+        payload = json.dumps({"channel": channel, "message": message})
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, payload])
+
+    def _listen(self):
+        db = connections["default"]
+        while True:
+            listener = None
+            try:
+                listener = db.get_new_connection(db.get_connection_params())
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([listener], [], [], 60) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        event = json.loads(listener.notifies.pop(0).payload)
+                        self.deliver(event["channel"], event["message"])
+            except Exception:
+                logger.exception("Notification listener lost its connection, reconnecting")
+                if listener is not None:
+                    listener.close()
+                threading.Event().wait(5)
+
+
+class Subscription:
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.SSE_QUEUE_SIZE)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def offer(self, message):
+        """Runs on the subscriber's loop"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # the stream ends and the client reconnects, replaying from the database
+            self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = import_string(settings.NOTIFICATION_PUBSUB_BACKEND)(self.deliver)
+        return self._backend
+
+    def publish(self, channel, message):
+        try:
+            self.backend.publish(channel, message)
+        except Exception:
+            # live delivery is best effort, clients catch up on reconnect
+            logger.exception("Failed to publish %s on %s", message, channel)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                pass  # its loop already closed, the subscription is going away
+
+    def subscribe(self, channels):
+        """Must be called from the subscriber's event loop"""
+        self.backend  # start listening before the first message can be missed
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].discard(subscription)
+                if not self._subscriptions[channel]:
+                    del self._subscriptions[channel]
+
+
+broker = Broker()
+
+
+def reset_backend(setting, **kwargs):
+    if setting == "NOTIFICATION_PUBSUB_BACKEND":
+        broker._backend = None
+
+
+setting_changed.connect(reset_backend)
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
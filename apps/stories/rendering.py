@@ -0,0 +1,71 @@
+"""
+Audio representations split into a shared catalog part and a per-user overlay.
+
+The catalog part (title, files, category, ...) is the same for every user
+and is rendered once per audio and catalog version, then kept in the
+catalog cache. Counters are taken from the row being rendered, so the
+cached part never has to be invalidated when they change. The overlay is
+the handful of fields that depend on the requesting user and is resolved
+for a whole list in one query. Both are merged at response time.
+"""
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Subquery
+
+from .cache import catalog_cache, catalog_version
+from .images import variant_key
+from .models import Audio, Download, History, Like
+
+LIVE_FIELDS = ("play_count", "like_count", "comment_count")
+EMPTY_OVERLAY = {"is_liked": False, "is_downloaded": False, "progress": 0}
+
+
+def user_overlay(user, audio_ids):
+    """is_liked / is_downloaded / progress of each audio for `user`, in one query"""
+    audio_ids = set(audio_ids)
+    if not audio_ids or user is None or not user.is_authenticated:
+        return {audio_id: dict(EMPTY_OVERLAY) for audio_id in audio_ids}
+
+    rows = Audio.objects.filter(id__in=audio_ids).annotate(
+        is_liked=Exists(Like.objects.filter(user=user, audio=OuterRef("pk"))),
+        is_downloaded=Exists(Download.objects.filter(user=user, audio=OuterRef("pk"))),
+        progress=Subquery(
+            History.objects.filter(user=user, audio=OuterRef("pk"))
+            .order_by("-played_at").values("duration_played")[:1]
+        ),
+    ).values("id", "is_liked", "is_downloaded", "progress")
+    return {
+        row["id"]: {
+            "is_liked": row["is_liked"],
+            "is_downloaded": row["is_downloaded"],
+            "progress": row["progress"] or 0,
+        }
+        for row in rows
+    }
+
+
+def cached_catalog(audios, request, render):
+    """
+    Catalog representation of each audio keyed by id. Cache misses are
+    rendered together with `render(audios)` and stored for the next request.
+    """
+    cache = catalog_cache()
+    # absolute media URLs depend on the scheme and host the client used, image URLs on the size asked for
+    origin = f"{request.scheme}://{request.get_host()}" if request is not None else ""
+    prefix = f"catalog:audio:{catalog_version()}:{origin}:{variant_key(request)}"
+    keys = {audio.id: f"{prefix}:{audio.id}" for audio in audios}
+
+    found = cache.get_many(list(keys.values()))
+    missing = [audio for audio in audios if keys[audio.id] not in found]
+    if missing:
+        rendered = {keys[audio.id]: dict(row) for audio, row in zip(missing, render(missing))}
+        cache.set_many(rendered, timeout=settings.CATALOG_RENDER_TTL)
+        found.update(rendered)
+    return {audio.id: found[keys[audio.id]] for audio in audios}
+
+
+def merge(audio, catalog, overlay):
+    data = dict(catalog)
+    for field in LIVE_FIELDS:
+        data[field] = getattr(audio, field)
+    data.update(overlay)
+    return data
@@ -0,0 +1,208 @@
+"""
+Ranked full-text search over audio titles, artists, categories and descriptions.
+
+PostgreSQL keeps a weighted `tsvector` per audio in `stories_audio_search`
+behind a GIN index and ranks with `ts_rank`. SQLite keeps the same columns
+in an FTS5 table (rowid = audio id) and ranks with `bm25`. Other databases
+fall back to the old `icontains` scan. Both indexes are maintained from
+the Audio/Category signals in signals.py and can be rebuilt with
+`manage.py rebuild_search_index`.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Subquery
+from django.utils import timezone
+
+from .models import Audio, SearchHistory
+from .pagination import KeysetPaginator
+
+SEARCH_TABLE = "stories_audio_search"
+SEARCH_ORDERING = ("-score", "-id")
+# ids per statement, well under SQLite's bound-parameter limit
+INDEX_BATCH_SIZE = 500
+
+
+def normalize_query(query):
+    """History key of a query: case-folded, whitespace collapsed"""
+    return " ".join(query.casefold().split())[:255]
+
+
+def batches(audio_ids):
+    audio_ids = list(audio_ids)
+    for start in range(0, len(audio_ids), INDEX_BATCH_SIZE):
+        yield audio_ids[start:start + INDEX_BATCH_SIZE]
+
+
+def terms(query):
+    """Plain word tokens of the user's query, safe to splice into a match expression"""
+    return re.findall(r"\w+", query.lower())[:16]
+
+
+class SearchBackend:
+
+    def index(self, audio_ids):
+        raise NotImplementedError
+
+    def remove(self, audio_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        self.index(list(Audio.objects.values_list("id", flat=True)))
+
+    def search(self, query, after=None, limit=20):
+        """[(audio_id, score), ...] best first, continuing after the (score, id) pair `after`"""
+        raise NotImplementedError
+
+
+class PostgresSearchBackend(SearchBackend):
+
+    def index(self, audio_ids):
+        with connection.cursor() as cursor:
+            for batch in batches(audio_ids):
+                cursor.execute(f"""
+                    INSERT INTO {SEARCH_TABLE} (audio_id, document)
+                    SELECT a.id,
+                           setweight(to_tsvector('simple', coalesce(a.title, '')), 'A') ||
+                           setweight(to_tsvector('simple', coalesce(a.artist, '')), 'B') ||
+                           setweight(to_tsvector('simple', coalesce(c.name, '')), 'B') ||
+                           setweight(to_tsvector('simple', coalesce(a.description, '')), 'C')
+                    FROM stories_audio a LEFT JOIN stories_category c ON c.id = a.category_id
+                    WHERE a.id = ANY(%s)
+                    ON CONFLICT (audio_id) DO UPDATE SET document = EXCLUDED.document
+                    """, [batch])
+
+    def remove(self, audio_ids):
+        # rows go away with the audio through ON DELETE CASCADE
+        pass
+
+    def search(self, query, after=None, limit=20):
+        words = terms(query)
+        if not words:
+            return []
+        tsquery = " & ".join(f"{word}:*" for word in words)
+        sql = f"""
+            SELECT audio_id, score FROM (
+                -- ts_rank is real: compare in the float8 the cursor carries
+                SELECT audio_id, ts_rank(document, to_tsquery('simple', %s))::float8 AS score
+                FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)
+            ) ranked
+        """
+        params = [tsquery, tsquery]
+        if after:
+            sql += " WHERE score < %s OR (score = %s AND audio_id < %s)"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY score DESC, audio_id DESC LIMIT %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+
+class SQLiteSearchBackend(SearchBackend):
+
+    def index(self, audio_ids):
+        with connection.cursor() as cursor:
+            for batch in batches(audio_ids):
+                placeholders = ", ".join("%s" for _ in batch)
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", batch)
+                cursor.execute(f"""
+                    INSERT INTO {SEARCH_TABLE} (rowid, title, artist, category, description)
+                    SELECT a.id, a.title, a.artist, coalesce(c.name, ''), coalesce(a.description, '')
+                    FROM stories_audio a LEFT JOIN stories_category c ON c.id = a.category_id
+                    WHERE a.id IN ({placeholders})
+                """, batch)
+
+    def remove(self, audio_ids):
+        with connection.cursor() as cursor:
+            for batch in batches(audio_ids):
+                placeholders = ", ".join("%s" for _ in batch)
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", batch)
+
+    def search(self, query, after=None, limit=20):
+        words = terms(query)
+        if not words:
+            return []
+        match = " ".join(f'"{word}"*' for word in words)
+        # bm25 is lower-is-better, negate it so both backends rank descending
+        sql = f"""
+            SELECT id, score FROM (
+                SELECT rowid AS id, -bm25({SEARCH_TABLE}, 10.0, 5.0, 5.0, 1.0) AS score
+                FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s
+            )
+        """
+        params = [match]
+        if after:
+            sql += " WHERE score < %s OR (score = %s AND id < %s)"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY score DESC, id DESC LIMIT %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+
+class BasicSearchBackend(SearchBackend):
+    """Unranked `icontains` scan for databases without a full-text index"""
+
+    def index(self, audio_ids):
+        pass
+
+    def remove(self, audio_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, after=None, limit=20):
+        audios = Audio.objects.filter(
+            Q(title__icontains=query) | Q(description__icontains=query) | Q(category__name__icontains=query)
+        )
+        if after:
+            audios = audios.filter(id__lt=after[1])
+        return [(audio_id, 0.0) for audio_id in audios.order_by("-id").values_list("id", flat=True)[:limit]]
+
+
+def get_search_backend():
+    return {
+        "postgresql": PostgresSearchBackend,
+        "sqlite": SQLiteSearchBackend,
+    }.get(connection.vendor, BasicSearchBackend)()
+
+
+def search_audios(query, request):
+    """Returns (audios, pagination) for the ranked page selected by `?cursor=`"""
+    paginator = KeysetPaginator(SEARCH_ORDERING)
+    page_size = paginator.get_page_size(request)
+    cursor = request.GET.get("cursor")
+    after = paginator.decode_cursor(cursor, Audio) if cursor else None
+
+    hits = get_search_backend().search(query, after=after, limit=page_size + 1)
+    has_more = len(hits) > page_size
+    hits = hits[:page_size]
+
+    audios = Audio.objects.select_related("category").in_bulk([audio_id for audio_id, _ in hits])
+    return [audios[audio_id] for audio_id, _ in hits if audio_id in audios], {
+        "page_size": page_size,
+        "next_cursor": paginator.encode_cursor({"score": hits[-1][1], "id": hits[-1][0]}) if has_more else None,
+    }
+
+
+def record_search(user, query):
+    """
+    Upsert `query` into the user's history and trim it to SEARCH_HISTORY_LIMIT
+    entries. A repeated query only moves its row to the top.
+    """
+    normalized = normalize_query(query)
+    if not user.is_authenticated or not normalized:
+        return
+    with transaction.atomic():
+        SearchHistory.objects.bulk_create(
+            [SearchHistory(user=user, query=query[:255], normalized_query=normalized, searched_at=timezone.now())],
+            update_conflicts=True,
+            unique_fields=["user", "normalized_query"],
+            update_fields=["query", "searched_at"],
+        )
+        recent = SearchHistory.objects.filter(user=user).order_by("-searched_at", "-id")
+        recent.exclude(id__in=Subquery(recent.values("id")[:settings.SEARCH_HISTORY_LIMIT])).delete()
@@ -1,5 +1,8 @@
+from django.db import models
 from rest_framework import serializers
 from .models import *
+from .images import image_url, prime_images
+from .rendering import cached_catalog, merge, user_overlay
 from apps.user.models import User
 from django.utils.timesince import timesince
 
@@ -27,21 +30,25 @@ class FollowCategorySerializer(serializers.ModelSerializer):
 
 
 class NotificationSerializer(serializers.ModelSerializer):
+    type = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
 
     class Meta:
         model = Notification
         fields = [
-            "id", "audio", "category", "image",
+            "id", "type", "audio", "category", "image",
             "message", "is_read", "created_at"
         ]
 
+    def get_type(self, obj):
+        return "broadcast" if isinstance(obj, Broadcast) else "personal"
+
     def get_image(self, obj):
         request = self.context.get("request")
         
         # যদি audio notification → audio cover image
         if obj.audio and obj.audio.cover_image:
-            return request.build_absolute_uri(obj.audio.cover_image.url)
+            return image_url(obj.audio.cover_image, self.context)
         
         # যদি category notification → fixed category icon
         if obj.category:
@@ -54,66 +61,165 @@ class NotificationSerializer(serializers.ModelSerializer):
         return None
 
 
-class AudioSerializer(serializers.ModelSerializer):
-    like_count = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
-    is_liked = serializers.SerializerMethodField()
-    is_downloaded = serializers.SerializerMethodField() 
+class BroadcastSerializer(NotificationSerializer):
+    # annotated by notifications.broadcasts_for()
+    is_read = serializers.BooleanField(read_only=True)
+
+    class Meta(NotificationSerializer.Meta):
+        model = Broadcast
+
+
+class FeedListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        items = list(data)
+        prime_images(self.context, [item.audio.cover_image for item in items if item.audio])
+        return super().to_representation(items)
+
+
+class FeedSerializer(serializers.BaseSerializer):
+    """Personal notifications and broadcasts in one list"""
+
+    class Meta:
+        list_serializer_class = FeedListSerializer
+
+    def to_representation(self, obj):
+        serializer_class = BroadcastSerializer if isinstance(obj, Broadcast) else NotificationSerializer
+        return serializer_class(obj, context=self.context).data
+
+
+def prime_audio_overlay(context, audio_ids):
+    """Resolve the per-user overlay of `audio_ids` not already in the render context"""
+    overlays = context.setdefault("audio_overlay", {})
+    missing = set(audio_ids) - overlays.keys()
+    if missing:
+        request = context.get("request")
+        overlays.update(user_overlay(request.user if request else None, missing))
+    return overlays
+
+
+class AudioListSerializer(serializers.ListSerializer):
+    """
+    Renders a list of audios as the cached catalog part merged with the
+    user overlay: one page query, one cache fetch and one overlay query.
+    """
+    select_related = ("category",)
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        # a prefetched queryset already holds its rows, cloning it would refetch them
+        if isinstance(data, models.QuerySet) and data._result_cache is None:
+            data = data.select_related(*self.select_related)
+        audios = list(data)
+
+        overlays = prime_audio_overlay(self.context, [audio.id for audio in audios])
+        catalog = cached_catalog(audios, self.context.get("request"), self.render_catalog)
+        return [merge(audio, catalog[audio.id], overlays[audio.id]) for audio in audios]
+
+
+    def render_catalog(self, audios):
+        prime_images(self.context, [audio.cover_image for audio in audios])
+        return AudioCatalogSerializer(audios, many=True, context=self.context).data
+
+
+class DerivativeImageField(serializers.ImageField):
+    """An image as the derivative (size, format) the request asks for, see images.py"""
+
+    def to_representation(self, value):
+        return image_url(value, self.context)
+
+
+class AudioCatalogSerializer(serializers.ModelSerializer):
+    """The user-independent part of an audio, safe to share between users"""
+    cover_image = DerivativeImageField(read_only=True)
 
     class Meta:
         model = Audio
-        fields = "__all__"
+        exclude = ["probed_file", "file_sha256"]
+        read_only_fields = ["play_count", "like_count", "comment_count"]
         depth = 1
 
-    def get_like_count(self, obj):
-        return Like.objects.filter(audio=obj).count()
 
-    def get_comment_count(self, obj):
-        return Comment.objects.filter(audio=obj).count()
-    
+class AudioSerializer(AudioCatalogSerializer):
+    is_liked = serializers.SerializerMethodField()
+    is_downloaded = serializers.SerializerMethodField() 
+    progress = serializers.SerializerMethodField()
+
+    class Meta(AudioCatalogSerializer.Meta):
+        list_serializer_class = AudioListSerializer
+
+    def overlay(self, obj):
+        return prime_audio_overlay(self.context, [obj.id])[obj.id]
+
     def get_is_liked(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return Like.objects.filter(audio=obj, user=request.user).exists()
-        return False
+        return self.overlay(obj)["is_liked"]
 
     def get_is_downloaded(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return Download.objects.filter(audio=obj, user=request.user).exists()
-        return False
+        return self.overlay(obj)["is_downloaded"]
 
+    def get_progress(self, obj):
+        return self.overlay(obj)["progress"]
+
+
+class AudioRenditionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AudioRendition
+        fields = ["name", "bitrate", "codec", "size", "file", "playlist"]
+
+
+def audio_streams(audio, request=None):
+    """
+    Transcoded streams of an audio for clients to pick by bandwidth: the HLS
+    master playlist (adaptive) and each rendition. Empty until transcoded.
+    """
+    renditions = list(audio.renditions.all())
+    if not renditions:
+        return {"hls": None, "renditions": []}
+    master = renditions[0].file.storage.url(renditions[0].master_playlist)
+    return {
+        "hls": request.build_absolute_uri(master) if request else master,
+        "renditions": AudioRenditionSerializer(renditions, many=True, context={"request": request}).data,
+    }
 
 
 class AudioPlaySerializer(serializers.ModelSerializer):
-    like_count = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()  # 👈 নতুন field
+    streams = serializers.SerializerMethodField()
+    cover_image = DerivativeImageField(read_only=True)
 
     class Meta:
         model = Audio
-        fields = "__all__"
+        exclude = ["probed_file", "file_sha256"]
+        read_only_fields = ["play_count", "like_count", "comment_count"]
         depth = 1
 
-    def get_like_count(self, obj):
-        return Like.objects.filter(audio=obj).count()
-
-    def get_comment_count(self, obj):
-        return Comment.objects.filter(audio=obj).count()
-
     def get_is_liked(self, obj):
         request = self.context.get("request")
         if request and request.user.is_authenticated:
             return Like.objects.filter(audio=obj, user=request.user).exists()
         return False
+
+    def get_streams(self, obj):
+        return audio_streams(obj, self.context.get("request"))
         
         
+class PlayListListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        playlists = list(data.all() if isinstance(data, models.Manager) else data)
+        # expects playlists with prefetched audios; primes one overlay for all of them
+        prime_audio_overlay(self.context, [
+            audio.id for playlist in playlists for audio in playlist.audios.all()
+        ])
+        return super().to_representation(playlists)
+
+
 class PlayListSerializer(serializers.ModelSerializer):
     audios= AudioSerializer(many=True, read_only= True)
     
     class Meta:
         model = Playlist
         fields = ["id", "name", "audios"]      
+        list_serializer_class = PlayListListSerializer
         
         
 class LikeSerializer(serializers.ModelSerializer):
@@ -141,12 +247,22 @@ class HistorySerializer(serializers.ModelSerializer):
         fields= "__all__"
         
         
+class DownloadListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, models.QuerySet) and data._result_cache is None:
+            data = data.select_related("audio__category")
+        downloads = list(data)
+        prime_audio_overlay(self.context, [download.audio_id for download in downloads])
+        return super().to_representation(downloads)
+
+
 class DownloadSerializer(serializers.ModelSerializer):
     audio = AudioSerializer(read_only=True)
     
     class Meta:
         model= Download
         fields= ['id','user', 'audio']                
+        list_serializer_class = DownloadListSerializer
         
         
 class SearchHistorySerializer(serializers.ModelSerializer):
@@ -0,0 +1,151 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from apps.user.models import User
+from .cache import bump_catalog_version
+from .jobs import enqueue
+from .models import Audio, Category, ImageDerivative
+from .search import get_search_backend
+from .storage import is_immutable
+from .suggest import suggestions
+from .transcode import remove_renditions
+
+
+@receiver(post_save, sender=Audio)
+@receiver(post_delete, sender=Audio)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Audio)
+def index_audio(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index([instance.pk])
+
+
+@receiver(post_delete, sender=Audio)
+def unindex_audio(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index(list(instance.audio_set.values_list("id", flat=True)))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_audios(sender, instance, **kwargs):
+    # the audios lose their category (SET_NULL) before post_delete runs
+    instance._search_audio_ids = list(instance.audio_set.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def reindex_category_audios(sender, instance, **kwargs):
+    get_search_backend().index(getattr(instance, "_search_audio_ids", []))
+
+
+@receiver(post_save, sender=Audio)
+def suggest_audio(sender, instance, raw=False, **kwargs):
+    if not raw:
+        suggestions.apply_audio(instance)
+
+
+@receiver(post_delete, sender=Audio)
+def unsuggest_audio(sender, instance, **kwargs):
+    suggestions.discard_audio(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def suggest_category(sender, instance, raw=False, created=False, **kwargs):
+    if not raw:
+        suggestions.apply_category(instance, audio_count=0 if created else None)
+
+
+@receiver(post_delete, sender=Category)
+def unsuggest_category(sender, instance, **kwargs):
+    suggestions.discard_category(instance.pk)
+
+
+@receiver(post_save, sender=Audio)
+def ingest_audio(sender, instance, raw=False, **kwargs):
+    # new upload or replaced file: read its headers, which then queues the transcode
+    if raw or not instance.audio_file or instance.probed_file == instance.audio_file.name:
+        return
+    enqueue("media.probe", audio_id=instance.pk)
+
+
+@receiver(post_delete, sender=Audio)
+def delete_renditions(sender, instance, **kwargs):
+    remove_renditions(instance.pk)
+
+
+def queue_derivatives(image, update_fields):
+    if not image or (update_fields is not None and image.field.name not in update_fields):
+        return
+    if not ImageDerivative.objects.filter(source=image.name).exists():
+        enqueue("media.images", source=image.name)
+
+
+@receiver(post_save, sender=Audio)
+def audio_cover_derivatives(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        queue_derivatives(instance.cover_image, update_fields)
+
+
+@receiver(post_save, sender=User)
+def user_photo_derivatives(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        queue_derivatives(instance.photo, update_fields)
+
+
+# content-addressed uploads (storage.py): a row gives up its reference to a
+# blob when it is deleted or the field gets another file
+MEDIA_FIELDS = {Audio: ("audio_file", "cover_image"), User: ("photo",)}
+
+
+def release(field_file, name):
+    if is_immutable(name):
+        storage = field_file.storage
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(pre_save, sender=Audio)
+@receiver(pre_save, sender=User)
+def remember_media_files(sender, instance, raw=False, update_fields=None, **kwargs):
+    fields = [
+        name for name in MEDIA_FIELDS[sender]
+        if update_fields is None or name in update_fields
+    ]
+    # only a new upload or a cleared field can drop a reference
+    uploaded = {
+        name: bool(getattr(instance, name)) for name in fields
+        if not getattr(instance, name) or not getattr(instance, name)._committed
+    }
+    if raw or instance.pk is None or not uploaded:
+        return
+    stored = sender.objects.filter(pk=instance.pk).values(*uploaded).first() or {}
+    instance._stored_media = {name: (old, uploaded[name]) for name, old in stored.items()}
+
+
+@receiver(post_save, sender=Audio)
+@receiver(post_save, sender=User)
+def release_replaced_media(sender, instance, **kwargs):
+    for name, (old, uploaded) in getattr(instance, "_stored_media", {}).items():
+        field_file = getattr(instance, name)
+        # an upload counted a new reference even when it stored the same blob
+        if old and (uploaded or old != field_file.name):
+            release(field_file, old)
+    instance._stored_media = {}
+
+
+@receiver(post_delete, sender=Audio)
+@receiver(post_delete, sender=User)
+def release_deleted_media(sender, instance, **kwargs):
+    for name in MEDIA_FIELDS[sender]:
+        field_file = getattr(instance, name)
+        if field_file:
+            release(field_file, field_file.name)
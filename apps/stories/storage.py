@@ -0,0 +1,121 @@
+"""
+Content-addressed, deduplicated storage for uploads.
+
+ContentAddressedStorage (STORAGES["media"], used by Audio.audio_file,
+Audio.cover_image and User.photo) ignores the upload name and stores the
+bytes as
+
+    MEDIA_ROOT/cas/<h[:2]>/<h[2:4]>/<sha256><.ext>
+
+so identical uploads share one file and a path never changes content: it
+can be cached forever (see `is_immutable`). A StoredBlob row counts the
+references. Saving increments it. `delete()` decrements it and removes
+the file once nothing refers to it any more. The signals in signals.py
+release a file when its row is deleted or the field gets a new file.
+
+`manage.py dedupe_media` moves existing uploads into the store.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+PREFIX = "cas/"
+WAVEFORM_SUFFIX = ".peaks"  # waveform.py
+# files derived from a blob and kept next to it, removed with it
+SIDECAR_SUFFIXES = (WAVEFORM_SUFFIX,)
+
+
+def media_storage():
+    """Storage of the uploaded media fields, a callable so migrations keep a reference to it"""
+    return storages["media"]
+
+
+def digest_of(content):
+    sha256 = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks() if hasattr(content, "chunks") else iter(lambda: content.read(64 * 1024), b""):
+        sha256.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return sha256.hexdigest()
+
+
+def blob_name(digest, name):
+    extension = os.path.splitext(name)[1].lower()[:10]
+    return f"{PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def is_immutable(name):
+    return bool(name) and name.startswith(PREFIX)
+
+
+def blob_digest(name):
+    """Hex SHA-256 of a blob, read from its name; None for files stored elsewhere"""
+    return posixpath.basename(name).split(".")[0] if is_immutable(name) else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    @property
+    def blobs(self):
+        return apps.get_model("stories", "StoredBlob").objects
+
+    def get_available_name(self, name, max_length=None):
+        # the stored name comes from the content, never suffixed
+        return name
+
+    def _save(self, name, content):
+        digest = digest_of(content)
+        name = blob_name(digest, name)
+        with transaction.atomic():
+            if not self.blobs.filter(name=name).update(refcount=F("refcount") + 1):
+                try:
+                    with transaction.atomic():
+                        self.blobs.create(name=name, digest=digest, size=content.size, refcount=1)
+                except IntegrityError:
+                    # created concurrently by an identical upload
+                    self.blobs.filter(name=name).update(refcount=F("refcount") + 1)
+            if not self.exists(name):
+                super()._save(name, content)
+        return name
+
+    def add_reference(self, name, digest, size):
+        """Count one more reference to an already stored blob (dedupe_media)"""
+        with transaction.atomic():
+            if not self.blobs.filter(name=name).update(refcount=F("refcount") + 1):
+                self.blobs.create(name=name, digest=digest, size=size, refcount=1)
+
+    def delete(self, name):
+        if not is_immutable(name):
+            # stored before the content-addressed layout
+            return super().delete(name)
+        with transaction.atomic():
+            blob = self.blobs.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.refcount > 1:
+                self.blobs.filter(pk=blob.pk).update(refcount=F("refcount") - 1)
+                return
+            blob.delete()
+            transaction.on_commit(lambda: self.remove_unreferenced(name))
+
+    def remove_unreferenced(self, name):
+        # an identical upload may have brought it back in the meantime
+        if not self.blobs.filter(name=name).exists():
+            super().delete(name)
+            for suffix in SIDECAR_SUFFIXES:
+                super().delete(name + suffix)
+            # drop the emptied fan-out directories
+            directory = posixpath.dirname(name)
+            while directory and directory + "/" != PREFIX:
+                try:
+                    os.rmdir(self.path(directory))
+                except OSError:
+                    break
+                directory = posixpath.dirname(directory)
@@ -0,0 +1,159 @@
+"""
+File responses with HTTP range and conditional request support.
+
+`serve_file()` answers `Range: bytes=...` with 206 Partial Content (416
+when the range is outside the file), honours `If-None-Match`,
+`If-Modified-Since` and `If-Range` against a strong ETag built from the
+file's size, mtime and inode, and advertises `Accept-Ranges`.
+
+The bytes themselves are sent in one of three ways, by MEDIA_SENDFILE:
+
+- "x-accel-redirect": nginx serves MEDIA_ACCEL_REDIRECT_PREFIX + the
+  path relative to MEDIA_ROOT from an `internal` location;
+- "x-sendfile": Apache mod_xsendfile / lighttpd serve the absolute path;
+- "" (default): the worker sends the file itself. The response wraps the
+  open file positioned at the range start with a length limit but keeps
+  `fileno()`, so WSGI servers with `wsgi.file_wrapper` (gunicorn) hand the
+  range to `os.sendfile` without copying it through Python.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe, quote_etag
+
+# a year, for files whose path changes whenever their content does
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class RangeFile:
+    """Read-only view of `length` bytes of `file` from its current position"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(stat):
+    return quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}-{stat.st_ino:x}")
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single `bytes=` range, None to ignore the
+    header (malformed or several ranges) and ValueError when unsatisfiable.
+    """
+    unit, _, spec = (header or "").partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        return "*" in tags or etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in tags}
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(mtime) <= since
+
+
+def range_allowed(request, etag, mtime):
+    """If-Range: only honour Range while the client's copy is still current"""
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag  # strong comparison
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def serve_file(request, path, content_type=None, max_age=None, filename=None, immutable=False, private=False):
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    content_type = content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    max_age = settings.MEDIA_STREAM_MAX_AGE if max_age is None else max_age
+    if private:
+        cache_control = f"private, max-age={max_age}"
+    elif immutable:
+        cache_control = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        cache_control = f"public, max-age={max_age}"
+
+    def with_headers(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        response["Accept-Ranges"] = "bytes"
+        response["Cache-Control"] = cache_control
+        if filename:
+            response["Content-Disposition"] = content_disposition_header(True, filename)
+        return response
+
+    if not_modified(request, etag, stat.st_mtime):
+        return with_headers(HttpResponse(status=304))
+
+    if settings.MEDIA_SENDFILE:
+        # the front server handles Range itself
+        response = with_headers(HttpResponse(content_type=content_type))
+        if settings.MEDIA_SENDFILE == "x-accel-redirect":
+            relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/")
+            response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relative)
+        else:
+            response["X-Sendfile"] = path
+        return response
+
+    byte_range = None
+    if request.method in ("GET", "HEAD") and "Range" in request.headers and range_allowed(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(request.headers["Range"], size)
+        except ValueError:
+            response = with_headers(HttpResponse(status=416))
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    start, end = byte_range or (0, size - 1)
+    length = max(end - start + 1, 0)
+    file = open(path, "rb")
+    file.seek(start)
+    response = with_headers(FileResponse(RangeFile(file, length), content_type=content_type))
+    response.block_size = 64 * 1024
+    response["Content-Length"] = str(length)
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
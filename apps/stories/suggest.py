@@ -0,0 +1,214 @@
+"""
+Search-as-you-type suggestions from an in-process prefix index.
+
+Every audio title, artist, category name and popular past query is stored
+as a sorted list of `(key, -weight, text, kind, ref)` tuples, one per word
+start of the text, so "night" finds "Rainy night". A prefix lookup is a
+bisect plus a short forward scan and never touches the database.
+
+Saves and deletes in this process patch the index directly (see
+signals.py). Changes made by other workers show up as a new catalog
+version, which is checked every SUGGEST_CHECK_INTERVAL seconds and
+triggers a rebuild in a background thread while the old index keeps
+serving. The first build runs in that thread too: until it lands the
+worker answers from an empty index rather than holding a request for a
+full catalog load. Popular queries are picked up by the periodic full
+rebuild.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max
+
+from .cache import catalog_version
+from .models import Audio, Category, SearchHistory
+
+logger = logging.getLogger(__name__)
+
+MAX_WORDS = 6
+MAX_SCAN = 2000
+
+
+def normalize(text):
+    return " ".join((text or "").casefold().split())
+
+
+def keys(text):
+    """The normalized text from each of its first MAX_WORDS word starts"""
+    words = normalize(text).split(" ")
+    return {" ".join(words[i:]) for i in range(min(len(words), MAX_WORDS)) if words[i]}
+
+
+class SuggestionIndex:
+
+    def __init__(self):
+        self._entries = []
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = 0.0
+        self._checked_at = float("-inf")
+        self._rebuilding = False
+
+    def suggest(self, prefix, limit):
+        self._refresh()
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        entries = self._entries
+        start = bisect.bisect_left(entries, (prefix,))
+        matches = []
+        for i in range(start, min(len(entries), start + MAX_SCAN)):
+            entry = entries[i]
+            if not entry[0].startswith(prefix):
+                break
+            matches.append(entry)
+
+        # best weight first, each text once even if several of its words matched
+        results, seen = [], set()
+        for _, weight, text, kind, ref in sorted(matches, key=lambda entry: (entry[1], entry[2])):
+            if text.casefold() in seen:
+                continue
+            seen.add(text.casefold())
+            results.append({"text": text, "type": kind, "id": ref[1] if kind in ("audio", "category") else None})
+            if len(results) == limit:
+                break
+        return results
+
+    # incremental updates: copy-on-write, so suggest() reads a list that never changes underneath it
+
+    def apply_audio(self, audio):
+        category = audio.category if audio.category_id else None
+        with self._lock:
+            entries = list(self._entries)
+            self._replace(entries, ("audio", audio.pk), audio.title, "audio", audio.play_count)
+            artist_ref = ("artist", normalize(audio.artist))
+            if artist_ref not in self._sources:
+                self._replace(entries, artist_ref, audio.artist, "artist", audio.play_count)
+            if category is not None and ("category", category.pk) not in self._sources:
+                self._replace(entries, ("category", category.pk), category.name, "category", 1)
+            self._publish(entries)
+
+    def discard_audio(self, audio_id):
+        with self._lock:
+            entries = list(self._entries)
+            self._replace(entries, ("audio", audio_id), "", "audio", 0)
+            self._publish(entries)
+
+    def apply_category(self, category, audio_count=None):
+        with self._lock:
+            entries = list(self._entries)
+            ref = ("category", category.pk)
+            if audio_count is None:
+                audio_count = -self._sources[ref][0][1] if self._sources.get(ref) else 0
+            self._replace(entries, ref, category.name, "category", audio_count)
+            self._publish(entries)
+
+    def discard_category(self, category_id):
+        with self._lock:
+            entries = list(self._entries)
+            self._replace(entries, ("category", category_id), "", "category", 0)
+            self._publish(entries)
+
+    def _replace(self, entries, ref, text, kind, weight):
+        for entry in self._sources.pop(ref, []):
+            i = bisect.bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+        if not normalize(text):
+            return
+        text = " ".join(text.split())
+        added = [(key, -weight, text, kind, ref) for key in keys(text)]
+        for entry in added:
+            bisect.insort(entries, entry)
+        self._sources[ref] = added
+
+    def _publish(self, entries):
+        self._entries = entries
+        self._caught_up()
+
+    def _caught_up(self):
+        # the signal handlers run after the version bump; if the index was
+        # current before it, this patch makes it current again
+        version = catalog_version()
+        if isinstance(self._version, int) and version == self._version + 1:
+            self._version = version
+
+    # rebuilds
+
+    def _refresh(self):
+        now = time.monotonic()
+        interval = settings.SUGGEST_CHECK_INTERVAL
+        if now - self._checked_at < interval:
+            return
+        self._checked_at = now
+        if self._version == catalog_version() and now - self._built_at < settings.SUGGEST_REBUILD_INTERVAL:
+            return
+
+        if interval <= 0:
+            self.rebuild()
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name="suggest-rebuild", daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            close_old_connections()
+            self.rebuild()
+        except Exception:
+            logger.exception("Failed to rebuild the suggestion index")
+        finally:
+            self._rebuilding = False
+            close_old_connections()
+
+    def rebuild(self):
+        # read the version first so changes made while loading leave the index stale
+        version = catalog_version()
+        entries, sources = [], {}
+
+        def add(ref, text, kind, weight):
+            text = " ".join((text or "").split())
+            if text:
+                sources[ref] = [(key, -weight, text, kind, ref) for key in keys(text)]
+                entries.extend(sources[ref])
+
+        artists = {}
+        for audio_id, title, artist, plays in Audio.objects.values_list("id", "title", "artist", "play_count"):
+            add(("audio", audio_id), title, "audio", plays)
+            ref = ("artist", normalize(artist))
+            if plays >= artists.get(ref, (None, -1))[1]:
+                artists[ref] = (artist, plays)
+        for ref, (artist, plays) in artists.items():
+            add(ref, artist, "artist", plays)
+
+        for category_id, name, audios in Category.objects.annotate(audios=Count("audio")).values_list(
+            "id", "name", "audios"
+        ):
+            add(("category", category_id), name, "category", audios)
+
+        # history holds one row per user and query, so this counts searchers
+        queries = (
+            SearchHistory.objects.values("normalized_query")
+            .annotate(searches=Count("id"), text=Max("query"))
+            .filter(searches__gte=settings.SUGGEST_MIN_QUERY_COUNT)
+            .order_by("-searches")[:settings.SUGGEST_QUERY_LIMIT]
+        )
+        for row in queries:
+            add(("query", row["normalized_query"]), row["text"], "query", row["searches"])
+
+        entries.sort()
+        with self._lock:
+            self._entries, self._sources = entries, sources
+            self._version = version
+            self._built_at = time.monotonic()
+
+
+suggestions = SuggestionIndex()
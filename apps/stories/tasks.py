@@ -0,0 +1,97 @@
+"""Background job handlers, run by `manage.py run_workers`"""
+import logging
+from datetime import timedelta
+
+from apps.user.models import User
+from .cache import bump_catalog_version
+from .fanout import run_fan_out
+from .images import build_derivatives
+from .jobs import enqueue, job
+from .models import Audio, Notification
+from .notifications import push
+from .probe import ProbeError, probe
+from .storage import blob_digest, digest_of
+from .transcode import TranscodeError, prune_renditions, transcode
+from .waveform import build_waveform
+
+logger = logging.getLogger(__name__)
+
+
+@job("notifications.fan_out")
+def fan_out(fan_out_id):
+    # resumes after the last committed batch when retried
+    run_fan_out(fan_out_id)
+
+
+@job("notifications.subscription")
+def subscription_reminder(user_id):
+    user = User.objects.select_related("subscription").filter(pk=user_id).first()
+    if user is None:
+        return
+    subscription = getattr(user, "subscription", None)
+    if subscription and subscription.is_active():
+        notification = Notification.objects.create(
+            user=user,
+            message=f"You Have {subscription.months_left()} Months Left On Your Subscription.",
+            # audio/category ফাঁকা থাকবে
+        )
+        push([notification])
+
+
+@job("media.probe")
+def probe_audio(audio_id):
+    audio = Audio.objects.filter(pk=audio_id).only("audio_file").first()
+    if audio is None or not audio.audio_file:
+        return
+    name = audio.audio_file.name
+    current = Audio.objects.filter(pk=audio_id, audio_file=name)  # unless replaced meanwhile
+    digest = blob_digest(name) or ""
+    try:
+        with audio.audio_file.open("rb") as file:
+            # for download manifests, free for content-addressed files
+            digest = digest or digest_of(file)
+            info = probe(file)
+        size = audio.audio_file.size
+    except (ProbeError, FileNotFoundError) as exc:
+        # stored before uploads were validated; keep the typed-in metadata, do not retry
+        logger.warning("Audio %s (%s) cannot be probed: %s", audio_id, name, exc)
+        current.update(probed_file=name, file_sha256=digest)
+        return
+    updated = current.update(
+        duration=timedelta(seconds=round(info.duration, 3)), codec=info.codec, bitrate=info.bitrate,
+        sample_rate=info.sample_rate, channels=info.channels, file_size=size, probed_file=name,
+        file_sha256=digest,
+    )
+    if updated:
+        bump_catalog_version()
+        # renditions are planned from the source bitrate
+        enqueue("media.transcode", max_attempts=3, audio_id=audio_id)
+        enqueue("media.waveform", max_attempts=3, audio_id=audio_id)
+
+
+@job("media.transcode")
+def transcode_audio(audio_id, force=False):
+    try:
+        transcode(audio_id, force=force)
+    except TranscodeError as exc:
+        # not audio or corrupt: keep serving the original, do not retry
+        logger.warning("Audio %s cannot be transcoded: %s", audio_id, exc)
+
+
+@job("media.prune_renditions")
+def prune_old_renditions(audio_id):
+    prune_renditions(audio_id)
+
+
+@job("media.waveform")
+def waveform(audio_id):
+    try:
+        build_waveform(audio_id)
+    except TranscodeError as exc:
+        logger.warning("Audio %s cannot be decoded for its waveform: %s", audio_id, exc)
+
+
+@job("media.images")
+def image_derivatives(source):
+    if build_derivatives(source):
+        bump_catalog_version()  # cached audio renderings still point at the original
@@ -1,3 +1,1349 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.user.models import Subscription, User
+from .cache import cache_stats, catalog_cache
+from .counters import PlayCountBuffer, play_counter
+from .rendering import EMPTY_OVERLAY
+from .fanout import run_fan_out
+from .history import history_writer
+from . import jobs
+from .jobs import backoff, enqueue, work_off
+from .thread import create_audio_notifications, create_category_notifications, create_subscription_notification
+from .probe import ProbeError, probe, validate_audio_file
+from .search import get_search_backend
+from .pubsub import Broker, user_channel
+from .suggest import SuggestionIndex, suggestions
+from .transcode import FFmpegEncoder, TranscodeError, prune_renditions
+from .waveform import decode_levels
+from .downloads import repr_digest
+from .models import (
+    Audio, AudioPlayBucket, Broadcast, BroadcastReceipt, Category, Comment, Download, FollowCategory, History,
+    ImageDerivative, Job, Like, Notification, NotificationFanOut, Playlist, SearchHistory, StoredBlob, TrendingScore,
+    TrendingState,
+)
+from .trending import decay_rate, rebuild_trending, update_trending
+
+
+@override_settings(
+    PLAY_COUNT_FLUSH_INTERVAL=0, HISTORY_FLUSH_INTERVAL=0, SUGGEST_CHECK_INTERVAL=0,
+    NOTIFICATION_PUBSUB_BACKEND="apps.stories.pubsub.LocalBackend",
+)
+class StoriesTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="listener@example.com", password="foo", is_active=True)
+        self.category = Category.objects.create(name="Sleep")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        catalog_cache().clear()
+
+    def make_audio(self, title="Story", **extra):
+        extra.setdefault("category", self.category)
+        extra.setdefault("audio_file", "audios/story.mp3")
+        extra.setdefault("duration", timedelta(minutes=10))
+        return Audio.objects.create(title=title, artist="Narrator", **extra)
+
+
+class AudioCounterTests(StoriesTestCase):
+
+    def test_like_toggle_keeps_counter_in_sync(self):
+        audio = self.make_audio()
+        url = f"/api/story/audios/{audio.id}/like-toggle/"
+
+        response = self.client.post(url)
+        self.assertEqual(response.data["data"]["total_like"], 1)
+        audio.refresh_from_db()
+        self.assertEqual(audio.like_count, 1)
+
+        response = self.client.post(url)
+        self.assertEqual(response.data["data"]["total_like"], 0)
+        audio.refresh_from_db()
+        self.assertEqual(audio.like_count, 0)
+
+    def test_comment_create_and_delete_update_counter(self):
+        audio = self.make_audio()
+        response = self.client.post(f"/api/story/audios/{audio.id}/comments/", {"text": "Lovely"})
+        audio.refresh_from_db()
+        self.assertEqual(audio.comment_count, 1)
+
+        self.client.delete(f"/api/story/comments/{response.data['data']['id']}/")
+        audio.refresh_from_db()
+        self.assertEqual(audio.comment_count, 0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        audio = self.make_audio()
+        Like.objects.create(user=self.user, audio=audio)
+        Comment.objects.create(user=self.user, audio=audio, text="Hi")
+        untouched = self.make_audio(title="Quiet")
+
+        self.assertEqual(Audio.reconcile_counters(), 1)
+        audio.refresh_from_db()
+        untouched.refresh_from_db()
+        self.assertEqual((audio.like_count, audio.comment_count), (1, 1))
+        self.assertEqual((untouched.like_count, untouched.comment_count), (0, 0))
+
+
+class AudioListQueryTests(StoriesTestCase):
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertFlatQueries(self, url, add_rows):
+        add_rows(2)
+        small = self.count_queries(url)
+        add_rows(8)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_audio_list_query_count_is_flat(self):
+        def add_rows(n):
+            for _ in range(n):
+                audio = self.make_audio()
+                Like.objects.create(user=self.user, audio=audio)
+        self.assertFlatQueries("/api/story/audios/", add_rows)
+
+    def test_playlist_query_count_is_flat(self):
+        def add_rows(n):
+            for _ in range(n):
+                playlist = Playlist.objects.create(user=self.user, name="Night")
+                playlist.audios.add(self.make_audio(), self.make_audio())
+        self.assertFlatQueries("/api/story/playlists/", add_rows)
+
+    def test_download_list_query_count_is_flat(self):
+        def add_rows(n):
+            for _ in range(n):
+                Download.objects.create(user=self.user, audio=self.make_audio())
+        self.assertFlatQueries("/api/story/downloads/", add_rows)
+
+    def test_list_flags_match_user(self):
+        liked = self.make_audio(title="Liked")
+        self.make_audio(title="Plain")
+        Like.objects.create(user=self.user, audio=liked)
+        Download.objects.create(user=self.user, audio=liked)
+
+        data = self.client.get("/api/story/audios/").data["data"]
+        flags = {row["title"]: (row["is_liked"], row["is_downloaded"]) for row in data}
+        self.assertEqual(flags, {"Liked": (True, True), "Plain": (False, False)})
+
+
+class KeysetPaginationTests(StoriesTestCase):
+
+    def walk(self, url):
+        titles, cursor = [], None
+        while True:
+            response = self.client.get(url, {"page_size": 2, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            titles += [row["title"] for row in response.data["data"]]
+            cursor = response.data["pagination"]["next_cursor"]
+            if not cursor:
+                return titles
+
+    def test_pages_follow_popular_ordering_without_gaps(self):
+        for index, plays in enumerate([5, 9, 5, 0, 9]):
+            self.make_audio(title=f"Story {index}", play_count=plays)
+        expected = list(Audio.objects.order_by("-play_count", "-created_at", "-id").values_list("title", flat=True))
+        self.assertEqual(self.walk("/api/story/audios/top/"), expected)
+
+    def test_latest_pages_ignore_play_count_changes(self):
+        audios = [self.make_audio(title=f"Story {index}") for index in range(5)]
+        first = self.client.get("/api/story/audios/", {"page_size": 2})
+        # with OFFSET pagination a reshuffle would duplicate or skip rows on the next page
+        Audio.objects.filter(pk=audios[-1].pk).update(play_count=100)
+        second = self.client.get("/api/story/audios/", {"page_size": 2, "cursor": first.data["pagination"]["next_cursor"]})
+        self.assertEqual([row["title"] for row in second.data["data"]], ["Story 2", "Story 1"])
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get("/api/story/audios/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data["success"])
+
+
+class CategoryPreviewTests(StoriesTestCase):
+
+    def test_previews_cost_constant_queries(self):
+        def browse():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get("/api/story/categories/", {"per_category": 2})
+            return response, len(queries)
+
+        for index in range(3):
+            self.make_audio(title=f"Sleep {index}")
+        _, few = browse()
+
+        for name in ("Rain", "Ocean", "Forest"):
+            category = Category.objects.create(name=name)
+            for index in range(3):
+                self.make_audio(title=f"{name} {index}", category=category)
+        response, many = browse()
+
+        self.assertEqual(many, few)
+        rows = {row["category_name"]: row for row in response.data["data"]}
+        self.assertEqual(rows["Rain"]["total_audios"], 3)
+        self.assertEqual([audio["title"] for audio in rows["Rain"]["audios"]], ["Rain 2", "Rain 1"])
+
+    def test_see_more_cursor_continues_on_category_endpoint(self):
+        for index in range(3):
+            self.make_audio(title=f"Sleep {index}")
+        preview = self.client.get("/api/story/categories/", {"per_category": 2}).data["data"][0]
+
+        response = self.client.get("/api/story/categories/Sleep/", {"cursor": preview["next_cursor"]})
+        self.assertEqual([audio["title"] for audio in response.data["data"]["audios"]], ["Sleep 0"])
+        self.assertIsNone(response.data["pagination"]["next_cursor"])
+
+
+class PlayCountBufferTests(StoriesTestCase):
+
+    @override_settings(PLAY_COUNT_FLUSH_INTERVAL=60)
+    def test_plays_are_coalesced_until_flush(self):
+        audio = self.make_audio(play_count=3)
+        for expected in (4, 5):
+            response = self.client.get(f"/api/story/audios/{audio.id}/play/")
+            self.assertEqual(response.data["data"]["play_count"], expected)
+
+        audio.refresh_from_db()
+        self.assertEqual(audio.play_count, 3)
+        self.assertEqual(play_counter.pending(audio.id), 2)
+
+        self.assertEqual(play_counter.flush(), 2)
+        audio.refresh_from_db()
+        self.assertEqual(audio.play_count, 5)
+        self.assertEqual(play_counter.pending(audio.id), 0)
+        self.assertEqual(play_counter.flush(), 0)
+
+    @override_settings(PLAY_COUNT_FLUSH_INTERVAL=60)
+    def test_pending_plays_outlive_the_worker_that_buffered_them(self):
+        audio = self.make_audio(play_count=3)
+        self.assertEqual(PlayCountBuffer().add(audio.id, plays=2), 5)
+
+        # another process, e.g. after the first one was killed
+        restarted = PlayCountBuffer()
+        self.assertEqual(restarted.pending(audio.id), 2)
+        self.assertEqual(restarted.flush(), 2)
+        self.assertEqual(restarted.total(audio.id), 5)
+        self.assertEqual(play_counter.flush(), 0)
+
+
+class HistoryWriterTests(StoriesTestCase):
+
+    @override_settings(HISTORY_FLUSH_INTERVAL=60)
+    def test_views_are_batched_off_the_response_path(self):
+        audio = self.make_audio()
+        with mock.patch.object(history_writer, "_write") as write:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(f"/api/story/audios/{audio.id}/details/")
+                self.client.get(f"/api/story/audios/{audio.id}/play/")
+            history_writer.drain()
+
+        self.assertFalse(any(query["sql"].startswith('INSERT INTO "stories_history"') for query in queries))
+        write.assert_called_once()
+        self.assertEqual([event[:2] for event in write.call_args.args[0]], [(self.user.id, audio.id)] * 2)
+
+    def test_anonymous_views_are_not_recorded(self):
+        audio = self.make_audio()
+        response = APIClient().get(f"/api/story/audios/{audio.id}/details/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(History.objects.exists())
+
+    def test_synchronous_mode_writes_immediately(self):
+        audio = self.make_audio()
+        self.client.get(f"/api/story/audios/{audio.id}/play/")
+        self.assertTrue(History.objects.filter(user=self.user, audio=audio).exists())
+
+
+class TrendingTests(StoriesTestCase):
+
+    def play(self, audio, hours_ago, times=1):
+        played_at = timezone.now() - timedelta(hours=hours_ago)
+        History.objects.bulk_create([History(user=self.user, audio=audio, played_at=played_at)] * times)
+
+    def trending_titles(self):
+        return [row["title"] for row in self.client.get("/api/story/audios/trending/").data["data"]]
+
+    def test_recent_plays_outrank_old_lifetime_plays(self):
+        classic = self.make_audio(title="Classic", play_count=1000)
+        self.play(classic, hours_ago=24 * 20, times=50)
+        hot = self.make_audio(title="Hot")
+        self.play(hot, hours_ago=1, times=5)
+
+        self.assertEqual(update_trending(), 55)
+        self.assertEqual(self.trending_titles(), ["Hot", "Classic"])
+
+    def test_updates_are_incremental_and_rebuild_matches(self):
+        audio = self.make_audio()
+        self.play(audio, hours_ago=2, times=2)
+        update_trending()
+        self.play(audio, hours_ago=0, times=3)
+        # too recent: a batch with lower ids may still be committing
+        self.assertEqual(update_trending(), 0)
+        later = timezone.now() + timedelta(minutes=10)
+        self.assertEqual(update_trending(later), 3)
+        self.assertEqual(update_trending(later), 0)
+
+        self.assertEqual(sum(AudioPlayBucket.objects.values_list("plays", flat=True)), 5)
+        incremental = TrendingScore.objects.get(audio=audio).score
+        old_epoch = TrendingState.objects.get().epoch
+
+        self.assertEqual(rebuild_trending(later), 5)
+        # same decayed value, only expressed relative to the new epoch
+        shift = (TrendingState.objects.get().epoch - old_epoch).total_seconds()
+        rebuilt = TrendingScore.objects.get(audio=audio).score
+        self.assertTrue(math.isclose(incremental * math.exp(-decay_rate() * shift), rebuilt, rel_tol=1e-9))
+
+
+class CatalogCacheTests(StoriesTestCase):
+
+    def test_anonymous_responses_are_cached_until_catalog_changes(self):
+        self.make_audio(title="First")
+        anonymous = APIClient()
+        anonymous.get("/api/story/audios/")
+        with CaptureQueriesContext(connection) as queries:
+            cached = anonymous.get("/api/story/audios/")
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([row["title"] for row in cached.data["data"]], ["First"])
+
+        self.make_audio(title="Second")
+        fresh = anonymous.get("/api/story/audios/")
+        self.assertEqual([row["title"] for row in fresh.data["data"]], ["Second", "First"])
+
+        stats = cache_stats()
+        self.assertEqual((stats["hit"], stats["miss"]), (1, 2))
+
+    def test_stale_entry_is_served_while_another_worker_rebuilds(self):
+        self.make_audio(title="First")
+        anonymous = APIClient()
+        anonymous.get("/api/story/audios/")
+        self.make_audio(title="Second")
+
+        key = "catalog:response:http://testserver/api/story/audios/?#full.jpeg"
+        catalog_cache().add(f"{key}:lock", 1)
+        with CaptureQueriesContext(connection) as queries:
+            stale = anonymous.get("/api/story/audios/")
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([row["title"] for row in stale.data["data"]], ["First"])
+        self.assertEqual(cache_stats()["stale"], 1)
+
+    def test_entries_are_kept_per_scheme_and_host(self):
+        self.make_audio()
+        anonymous = APIClient()
+        anonymous.get("/api/story/audios/")
+        secure = anonymous.get("/api/story/audios/", secure=True).data["data"][0]
+        self.assertTrue(secure["audio_file"].startswith("https://testserver/"))
+        other = anonymous.get("/api/story/audios/", HTTP_HOST="cdn.example.com").data["data"][0]
+        self.assertTrue(other["audio_file"].startswith("http://cdn.example.com/"))
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        self.make_audio()
+        self.client.get("/api/story/audios/")
+        self.assertEqual(cache_stats()["miss"], 0)
+
+
+class CatalogOverlayTests(StoriesTestCase):
+
+    def test_catalog_part_is_shared_and_overlay_is_per_user(self):
+        audio = self.make_audio(title="Shared")
+        Like.objects.create(user=self.user, audio=audio)
+        History.objects.create(user=self.user, audio=audio, duration_played=42)
+        other = User.objects.create_user(email="other@example.com", password="foo", is_active=True)
+        other_client = APIClient()
+        other_client.force_authenticate(other)
+
+        mine = self.client.get("/api/story/audios/").data["data"][0]
+        with mock.patch("apps.stories.serializers.AudioCatalogSerializer") as render:
+            with CaptureQueriesContext(connection) as queries:
+                theirs = other_client.get("/api/story/audios/").data["data"][0]
+        render.assert_not_called()
+        # page query and one overlay query
+        self.assertEqual(len(queries), 2)
+
+        self.assertEqual((mine["is_liked"], mine["progress"]), (True, 42))
+        self.assertEqual((theirs["is_liked"], theirs["progress"]), (False, 0))
+        self.assertEqual({k: v for k, v in mine.items() if k not in EMPTY_OVERLAY},
+                         {k: v for k, v in theirs.items() if k not in EMPTY_OVERLAY})
+
+    def test_counters_are_live_on_cached_renderings(self):
+        audio = self.make_audio()
+        self.client.get("/api/story/audios/")
+        Audio.objects.filter(pk=audio.pk).update(play_count=7)
+        self.assertEqual(self.client.get("/api/story/audios/").data["data"][0]["play_count"], 7)
+
+
+class SearchIndexTests(StoriesTestCase):
+
+    def search(self, q, **params):
+        return self.client.get("/api/story/search/", {"q": q, **params})
+
+    def result_titles(self, response):
+        return [row["title"] for row in response.data["data"]["results"]]
+
+    def test_title_match_outranks_description_match(self):
+        self.make_audio("Rainy night", description="calm")
+        self.make_audio("Forest walk", description="a night in the forest")
+
+        response = self.search("night")
+        self.assertEqual(self.result_titles(response), ["Rainy night", "Forest walk"])
+
+    def test_index_follows_audio_and_category_changes(self):
+        audio = self.make_audio("Harbour")
+        self.assertEqual(self.result_titles(self.search("sleep")), ["Harbour"])
+
+        self.category.name = "Bedtime"
+        self.category.save()
+        self.assertEqual(self.result_titles(self.search("sleep")), [])
+        self.assertEqual(self.result_titles(self.search("bedt")), ["Harbour"])
+
+        audio.delete()
+        self.assertEqual(self.result_titles(self.search("harbour")), [])
+
+    def test_results_are_paginated(self):
+        for i in range(5):
+            self.make_audio(f"Ocean {i}")
+
+        first = self.search("ocean", page_size=3)
+        cursor = first.data["pagination"]["next_cursor"]
+        second = self.search("ocean", page_size=3, cursor=cursor)
+
+        titles = self.result_titles(first) + self.result_titles(second)
+        self.assertEqual(sorted(titles), [f"Ocean {i}" for i in range(5)])
+        self.assertIsNone(second.data["pagination"]["next_cursor"])
+
+    @mock.patch("apps.stories.search.INDEX_BATCH_SIZE", 2)
+    def test_rebuild_indexes_in_batches(self):
+        for i in range(5):
+            self.make_audio(f"Ocean {i}")
+
+        with CaptureQueriesContext(connection) as queries:
+            get_search_backend().rebuild()
+        inserts = [query for query in queries if "INSERT INTO stories_audio_search" in query["sql"]]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(len(self.result_titles(self.search("ocean"))), 5)
+
+
+class SuggestionTests(StoriesTestCase):
+
+    def suggest(self, q):
+        return self.client.get("/api/story/search/suggest/", {"q": q}).data["data"]
+
+    def test_prefix_matches_any_word_ranked_by_weight(self):
+        self.make_audio("Rainy night", play_count=5)
+        self.make_audio("Night train", play_count=50)
+        for i in range(3):
+            user = User.objects.create_user(email=f"searcher{i}@example.com", password="foo")
+            SearchHistory.objects.create(user=user, query="Nightingale", normalized_query="nightingale")
+        suggestions.rebuild()
+
+        texts = [row["text"] for row in self.suggest("nig")]
+        self.assertEqual(texts, ["Night train", "Rainy night", "Nightingale"])
+        self.assertEqual(self.suggest("sle")[0], {"text": "Sleep", "type": "category", "id": self.category.id})
+
+    def test_answers_without_queries_and_follows_local_changes(self):
+        self.suggest("warm")
+        audio = self.make_audio("Lighthouse")
+
+        with self.assertNumQueries(0):
+            self.assertEqual([row["text"] for row in self.suggest("light")], ["Lighthouse"])
+
+        # a lookup in progress keeps reading the list it started with
+        entries = suggestions._entries
+        snapshot = list(entries)
+        audio.delete()
+        self.assertEqual(entries, snapshot)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest("light"), [])
+        self.assertFalse(SearchHistory.objects.exists())
+
+    @override_settings(SUGGEST_CHECK_INTERVAL=5)
+    def test_first_lookup_builds_in_the_background(self):
+        self.make_audio("Lighthouse")
+        index = SuggestionIndex()
+
+        with mock.patch("apps.stories.suggest.threading.Thread") as thread, self.assertNumQueries(0):
+            self.assertEqual(index.suggest("light", 8), [])
+            self.assertEqual(index.suggest("light", 8), [])
+        thread.assert_called_once_with(target=index._rebuild_in_background, name="suggest-rebuild", daemon=True)
+
+        index.rebuild()  # what the thread runs
+        self.assertEqual([row["text"] for row in index.suggest("light", 8)], ["Lighthouse"])
+
+
+@override_settings(SEARCH_HISTORY_LIMIT=3)
+class SearchHistoryTests(StoriesTestCase):
+
+    def history(self, **params):
+        return self.client.get("/api/story/search/history/", params).data
+
+    def test_repeated_query_bumps_existing_row(self):
+        self.client.get("/api/story/search/", {"q": "Rain"})
+        self.client.get("/api/story/search/", {"q": "ocean"})
+        self.client.get("/api/story/search/", {"q": "  rain "})
+
+        self.assertEqual(SearchHistory.objects.filter(user=self.user).count(), 2)
+        self.assertEqual([row["normalized_query"] for row in self.history()["data"]], ["rain", "ocean"])
+
+    def test_history_is_trimmed_and_paginated(self):
+        for q in ["one", "two", "three", "four", "five"]:
+            self.client.get("/api/story/search/", {"q": q})
+
+        self.assertEqual(SearchHistory.objects.filter(user=self.user).count(), 3)
+        first = self.history(page_size=2)
+        second = self.history(page_size=2, cursor=first["pagination"]["next_cursor"])
+        queries = [row["query"] for row in first["data"] + second["data"]]
+        self.assertEqual(queries, ["five", "four", "three"])
+
+
+class NotificationFanOutTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(4):
+            User.objects.create_user(email=f"reader{i}@example.com", password="foo")
+
+    def test_batches_reach_every_user(self):
+        fan_out = NotificationFanOut.objects.create(category=self.category, message="New category added: Sleep")
+
+        with self.assertNumQueries(1 + 1 + 3 * 4 + 1):  # load, stream ids, 3 batches, finish
+            run_fan_out(fan_out.pk, batch_size=2)
+
+        fan_out.refresh_from_db()
+        self.assertEqual(fan_out.sent, 5)
+        self.assertIsNotNone(fan_out.finished_at)
+        self.assertEqual(Notification.objects.filter(category=self.category).count(), 5)
+
+    def test_interrupted_fan_out_resumes_after_checkpoint(self):
+        fan_out = NotificationFanOut.objects.create(category=self.category, message="New category added: Sleep")
+        real_bulk_create = Notification.objects.bulk_create
+        calls = []
+
+        def failing_bulk_create(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise RuntimeError("worker killed")
+            return real_bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(Notification.objects, "bulk_create", side_effect=failing_bulk_create):
+            with self.assertRaises(RuntimeError):
+                run_fan_out(fan_out.pk, batch_size=2)
+
+        fan_out.refresh_from_db()
+        self.assertEqual(fan_out.sent, 2)
+        self.assertIsNone(fan_out.finished_at)
+
+        run_fan_out(fan_out.pk, batch_size=2)
+        per_user = Notification.objects.filter(category=self.category).values("user").annotate(n=Count("id"))
+        self.assertEqual(sorted(row["n"] for row in per_user), [1] * 5)
+
+
+class BroadcastTests(StoriesTestCase):
+
+    def feed(self):
+        return self.client.get("/api/story/notifications/").data["data"]
+
+    def test_publishing_writes_one_row_for_any_number_of_users(self):
+        for i in range(5):
+            User.objects.create_user(email=f"reader{i}@example.com", password="foo")
+
+        category = Category.objects.create(name="Fables")
+
+        with self.assertNumQueries(1):
+            create_category_notifications(category)
+        self.assertEqual(Broadcast.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_feed_merges_personal_and_broadcast_with_read_state(self):
+        Notification.objects.create(user=self.user, message="You Have 2 Months Left On Your Subscription.")
+        create_category_notifications(Category.objects.create(name="Fables"))
+        create_category_notifications(Category.objects.create(name="Poems"))
+
+        feed = self.feed()
+        self.assertEqual([row["type"] for row in feed], ["broadcast", "broadcast", "personal"])
+        self.assertFalse(any(row["is_read"] for row in feed))
+
+        self.client.post(f"/api/story/notifications/broadcasts/{feed[1]['id']}/")
+        self.assertEqual([row["is_read"] for row in self.feed()], [False, True, False])
+
+        # each limit only applies to its own kind
+        self.client.post("/api/story/notifications/read/", {"up_to_id": 0})
+        self.assertEqual([row["is_read"] for row in self.feed()], [False, True, False])
+        self.client.post("/api/story/notifications/read/", {"up_to_broadcast_id": feed[0]["id"]})
+        self.assertEqual([row["is_read"] for row in self.feed()], [True, True, False])
+
+        self.client.delete(f"/api/story/notifications/broadcasts/{feed[0]['id']}/")
+        self.assertEqual(len(self.feed()), 2)
+        self.assertEqual(BroadcastReceipt.objects.count(), 2)
+
+    def test_announcements_can_be_turned_off(self):
+        create_category_notifications(Category.objects.create(name="Fables"))
+        self.user.receive_announcements = False
+        self.user.save()
+        self.assertEqual(self.feed(), [])
+
+    def test_broadcasts_before_joining_are_hidden(self):
+        create_category_notifications(Category.objects.create(name="Fables"))
+        newcomer = User.objects.create_user(email="late@example.com", password="foo")
+        self.client.force_authenticate(newcomer)
+        self.assertEqual(self.feed(), [])
+
+
+class FollowerNotificationTests(StoriesTestCase):
+
+    def test_new_audio_reaches_only_category_followers(self):
+        follower = User.objects.create_user(email="fan@example.com", password="foo")
+        User.objects.create_user(email="bystander@example.com", password="foo")
+        FollowCategory.objects.create(user=follower, category=self.category)
+        FollowCategory.objects.create(user=self.user, category=Category.objects.create(name="Poems"))
+
+        create_audio_notifications(self.make_audio("Moonlight"))
+        work_off()
+        self.assertEqual(Job.objects.get(name="notifications.fan_out").status, Job.DONE)
+
+        self.assertEqual(list(Notification.objects.values_list("user", flat=True)), [follower.id])
+        self.assertFalse(Broadcast.objects.exists())
+
+
+class NotificationPollingTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            Notification.objects.create(user=self.user, message=f"Personal {i}")
+        create_category_notifications(Category.objects.create(name="Fables"))
+
+    def get(self, url, **params):
+        return self.client.get(f"/api/story/notifications/{url}", params).data
+
+    def test_unread_count_and_mark_up_to_id(self):
+        self.assertEqual(self.get("unread-count/")["data"], {"unread": 4, "personal": 3, "broadcasts": 1})
+
+        second = Notification.objects.order_by("id")[1].id
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post("/api/story/notifications/read/", {"up_to_id": second, "up_to_broadcast_id": 0})
+        updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "stories_notification"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.get("unread-count/")["data"], {"unread": 2, "personal": 1, "broadcasts": 1})
+
+        self.client.post("/api/story/notifications/read/")
+        self.assertEqual(self.get("unread-count/")["data"]["unread"], 0)
+
+    def test_pages_and_since_polling(self):
+        first = self.get("", page_size=3)
+        second = self.get("", page_size=3, cursor=first["pagination"]["next_cursor"])
+        self.assertEqual(len(first["data"]) + len(second["data"]), 4)
+        self.assertIsNone(second["pagination"]["next_cursor"])
+
+        latest = first["pagination"]
+        self.assertEqual(self.get("", since_id=latest["latest_id"], since_broadcast_id=latest["latest_broadcast_id"])["data"], [])
+
+        Notification.objects.create(user=self.user, message="Personal 3")
+        new = self.get("", since_id=latest["latest_id"], since_broadcast_id=latest["latest_broadcast_id"])
+        self.assertEqual([row["message"] for row in new["data"]], ["Personal 3"])
+
+
+class NotificationStreamTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def announce(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_category_notifications(Category.objects.create(name=name))
+
+    async def read_event(self, chunks):
+        while True:
+            chunk = await asyncio.wait_for(anext(chunks), 5)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith("id:"):
+                lines = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+                return lines["id"], json.loads(lines["data"])
+
+    async def test_replays_after_last_event_id_then_pushes_live(self):
+        first = await Notification.objects.acreate(user=self.user, message="Missed while offline")
+        response = await self.async_client.get(
+            "/api/story/notifications/stream/", {"token": self.token}, headers={"Last-Event-ID": "0:0"}
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        try:
+            event_id, data = await self.read_event(chunks)
+            self.assertEqual((event_id, data["message"]), (f"{first.id}:0", "Missed while offline"))
+
+            broadcast = await sync_to_async(self.announce)("Fables")
+            event_id, data = await self.read_event(chunks)
+            self.assertEqual((event_id, data["type"]), (f"{first.id}:{broadcast.id}", "broadcast"))
+        finally:
+            await chunks.aclose()
+
+    async def test_requires_a_valid_token(self):
+        response = await self.async_client.get("/api/story/notifications/stream/", {"token": "nope"})
+        self.assertEqual(response.status_code, 401)
+
+
+calls = []
+
+
+def flaky(fail_times):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError("try again")
+
+
+class SharedBackend:
+    """Stands in for NOTIFY: every broker, whatever its process, gets each message"""
+    processes = []
+
+    def __init__(self, deliver):
+        self.processes.append(deliver)
+
+    def publish(self, channel, message):
+        for deliver in self.processes:
+            deliver(channel, message)
+
+
+class JobQueueTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+        # registered for these tests only, the global registry stays as the app built it
+        registry = mock.patch.dict(jobs.registry, {"tests.flaky": flaky})
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        queued = enqueue("tests.flaky", fail_times=1)
+
+        self.assertEqual(work_off(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.QUEUED, 1))
+        self.assertIn("try again", queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds=backoff(1) * 0.5))
+        self.assertEqual(work_off(), 0)  # not due yet
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.assertEqual(work_off(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.DONE, 2))
+        self.assertIsNotNone(queued.duration_ms)
+
+    def test_job_fails_after_max_attempts(self):
+        queued = enqueue("tests.flaky", max_attempts=1, fail_times=5)
+        work_off()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+
+    def test_run_workers_refuses_the_local_pubsub_backend(self):
+        with self.assertRaisesMessage(CommandError, "PostgresBackend"):
+            call_command("run_workers", "--once", stdout=io.StringIO())
+
+    @override_settings(NOTIFICATION_PUBSUB_BACKEND="apps.stories.tests.SharedBackend")
+    async def test_job_notifications_reach_the_brokers_of_other_processes(self):
+        web = Broker()  # the broker of a web process, not the one the job publishes with
+        subscription = web.subscribe([user_channel(self.user.id)])
+        try:
+            await Subscription.objects.acreate(user=self.user, end_date=timezone.now() + timedelta(days=90))
+            await sync_to_async(create_subscription_notification)(self.user)
+
+            def run_jobs():
+                with self.captureOnCommitCallbacks(execute=True):
+                    work_off()
+            await sync_to_async(run_jobs)()
+
+            notification = await Notification.objects.aget(user=self.user)
+            message = await asyncio.wait_for(subscription.get(), 5)
+            self.assertEqual(message, {"type": "personal", "id": notification.id})
+        finally:
+            subscription.close()
+            SharedBackend.processes.clear()
+
+    def test_subscription_reminder_is_queued_not_threaded(self):
+        Subscription.objects.create(user=self.user, end_date=timezone.now() + timedelta(days=90))
+        create_subscription_notification(self.user)
+        self.assertFalse(Notification.objects.exists())
+
+        work_off()
+        self.assertTrue(Notification.objects.filter(user=self.user, message__contains="Months Left").exists())
+
+
+class AudioStreamTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, MEDIA_SENDFILE="")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.body = bytes(range(256)) * 40
+        os.makedirs(os.path.join(media_root, "audios"))
+        with open(os.path.join(media_root, "audios", "story.mp3"), "wb") as f:
+            f.write(self.body)
+        self.url = f"/api/story/audios/{self.make_audio().id}/stream/"
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_full_and_partial_responses(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(self.content(response), self.body)
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.body)}")
+        self.assertEqual(self.content(response), self.body[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(self.content(response), self.body[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.body)}-")
+        self.assertEqual(response.status_code, 416)
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        stale = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(stale.status_code, 200)
+        current = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(current.status_code, 206)
+
+    @override_settings(MEDIA_SENDFILE="x-accel-redirect", MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/")
+    def test_offload_to_front_server(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/audios/story.mp3")
+
+        with open(os.path.join(settings.MEDIA_ROOT, "audios", "night? #2 ü.mp3"), "wb") as f:
+            f.write(self.body)
+        audio = self.make_audio(audio_file="audios/night? #2 ü.mp3")
+        response = self.client.get(f"/api/story/audios/{audio.id}/stream/")
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/audios/night%3F%20%232%20%C3%BC.mp3")
+        self.assertEqual(response.content, b"")
+
+
+def mp3_bytes(frames, kbps=128, vbr_frames=None):
+    """ID3v2 tag and MPEG-1 layer III frames (44.1 kHz stereo) with silent payloads"""
+    header = bytes([0xFF, 0xFB, [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192].index(kbps) << 4, 0])
+    frame = header + bytes(144 * kbps * 1000 // 44100 - 4)
+    first = frame
+    if vbr_frames is not None:
+        xing = b"Xing" + struct.pack(">II", 1, vbr_frames)
+        first = header + bytes(32) + xing + bytes(len(frame) - 36 - len(xing))
+    return b"ID3\x04\x00\x00\x00\x00\x00\x0a" + bytes(10) + first + frame * (frames - 1)
+
+
+def ogg_page(granule, packet, header_type=0):
+    return (
+        b"OggS" + bytes([0, header_type]) + struct.pack("<qIII", granule, 7, 0, 0)
+        + bytes([1, len(packet)]) + packet
+    )
+
+
+def mp4_box(kind, payload):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+class ProbeTests(StoriesTestCase):
+
+    def test_mp3_without_vbr_header_counts_frames(self):
+        info = probe(io.BytesIO(mp3_bytes(100) + b"TAG" + bytes(125)))
+        self.assertEqual((info.codec, info.bitrate, info.sample_rate, info.channels), ("mp3", 128, 44100, 2))
+        self.assertAlmostEqual(info.duration, 100 * 1152 / 44100)
+
+    def test_mp3_constant_bitrate_is_not_walked(self):
+        # padded a byte now and then like an encoder, to average 144 * 128000 / 44100 bytes
+        frames = []
+        for i in range(20000):
+            padded = (i + 1) * 18432000 // 44100 - i * 18432000 // 44100 == 418
+            frames.append(bytes([0xFF, 0xFB, 0x92 if padded else 0x90, 0]) + bytes(414 if padded else 413))
+        file = io.BytesIO(b"".join(frames))
+        with mock.patch.object(file, "read", wraps=file.read) as read:
+            info = probe(file)
+        self.assertLess(read.call_count, 10)
+        self.assertAlmostEqual(info.duration, 20000 * 1152 / 44100)
+
+    def test_mp3_variable_bitrate_without_header_counts_frames(self):
+        data = mp3_bytes(4) + mp3_bytes(6, kbps=192)[20:]
+        info = probe(io.BytesIO(data))
+        self.assertAlmostEqual(info.duration, 10 * 1152 / 44100)
+
+    def test_mp3_xing_header_gives_frame_count(self):
+        info = probe(io.BytesIO(mp3_bytes(2, vbr_frames=500)))
+        self.assertAlmostEqual(info.duration, 500 * 1152 / 44100)
+
+    def test_ogg_opus(self):
+        head = b"OpusHead" + bytes([1, 2]) + struct.pack("<HIhB", 312, 44100, 0, 0)
+        data = ogg_page(0, head, header_type=2) + ogg_page(0, b"OpusTags") + ogg_page(48000 * 5 + 312, bytes(10), 4)
+        info = probe(io.BytesIO(data))
+        self.assertEqual((info.codec, info.sample_rate, info.channels), ("opus", 44100, 2))
+        self.assertAlmostEqual(info.duration, 5)
+
+    def test_adts_aac(self):
+        length = 200
+        frame = bytes([0xFF, 0xF1, 0x50, 0x80 | length >> 11, length >> 3 & 0xFF, (length & 7) << 5 | 0x1F, 0xFC])
+        info = probe(io.BytesIO((frame + bytes(length - 7)) * 43))
+        self.assertEqual((info.codec, info.sample_rate, info.channels), ("aac", 44100, 2))
+        self.assertAlmostEqual(info.duration, 43 * 1024 / 44100)
+
+    def test_mp4(self):
+        mvhd = mp4_box(b"mvhd", bytes(12) + struct.pack(">II", 1000, 90500) + bytes(80))
+        entry = mp4_box(b"mp4a", bytes(6) + struct.pack(">H", 1) + bytes(8) + struct.pack(">HHHHI", 1, 16, 0, 0, 48000 << 16))
+        stsd = mp4_box(b"stsd", struct.pack(">II", 0, 1) + entry)
+        trak = mp4_box(b"trak", mp4_box(b"mdia", mp4_box(b"minf", mp4_box(b"stbl", stsd))))
+        data = mp4_box(b"ftyp", b"M4A " + bytes(4)) + mp4_box(b"mdat", bytes(5000)) + mp4_box(b"moov", mvhd + trak)
+        info = probe(io.BytesIO(data))
+        self.assertEqual((info.codec, info.sample_rate, info.channels), ("aac", 48000, 1))
+        self.assertAlmostEqual(info.duration, 90.5)
+
+    def test_non_audio_is_rejected(self):
+        with self.assertRaises(ProbeError):
+            probe(io.BytesIO(b"%PDF-1.4\n" + bytes(1000)))
+        with self.assertRaises(ValidationError):
+            validate_audio_file(SimpleUploadedFile("notes.mp3", b"%PDF-1.4\n"))
+        validate_audio_file(SimpleUploadedFile("story.mp3", mp3_bytes(3)))
+
+    def test_upload_metadata_is_filled_in_by_the_worker(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root, AUDIO_ENCODER="apps.stories.tests.FakeEncoder"):
+            audio = self.make_audio(audio_file=SimpleUploadedFile("story.mp3", mp3_bytes(100)), duration=None)
+            work_off()
+        audio.refresh_from_db()
+        self.assertEqual(audio.duration, timedelta(seconds=round(100 * 1152 / 44100, 3)))
+        self.assertEqual((audio.codec, audio.bitrate, audio.file_size), ("mp3", 128, len(mp3_bytes(100))))
+        self.assertEqual(audio.probed_file, audio.audio_file.name)
+
+class FakeEncoder:
+    """Copies instead of encoding; refuses PDFs like ffmpeg would"""
+    codec = "aac"
+    extension = ".m4a"
+
+    def encode(self, source, target, bitrate):
+        with open(source, "rb") as f:
+            data = f.read()
+        if data.startswith(b"%PDF"):
+            raise TranscodeError("Invalid data found when processing input")
+        with open(target, "wb") as f:
+            f.write(data[: bitrate * 10])
+
+    def segment(self, source, directory, seconds):
+        os.makedirs(directory)
+        with open(os.path.join(directory, "seg_00000.ts"), "wb") as f:
+            f.write(b"segment")
+        playlist = os.path.join(directory, "index.m3u8")
+        with open(playlist, "w") as f:
+            f.write(f"#EXTM3U\n#EXT-X-TARGETDURATION:{seconds}\n#EXTINF:{seconds}.0,\nseg_00000.ts\n#EXT-X-ENDLIST\n")
+        return playlist
+
+    def decode(self, source, sample_rate):
+        # a loud second, then a quiet one, in chunks that split samples and blocks
+        pcm = struct.pack(f"<{sample_rate * 2}h", *(
+            (16384 if i < sample_rate else 1024) * (1 if i % 2 else -1) for i in range(sample_rate * 2)
+        ))
+        for start in range(0, len(pcm), 1001):
+            yield pcm[start:start + 1001]
+
+
+@override_settings(AUDIO_ENCODER="apps.stories.tests.FakeEncoder", AUDIO_RENDITIONS={"low": 48, "medium": 96, "high": 160})
+class TranscodeTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(self.media_root, "audios"))
+
+    def upload(self, name, data):
+        with open(os.path.join(self.media_root, "audios", name), "wb") as f:
+            f.write(data)
+        return f"audios/{name}"
+
+    def test_upload_is_transcoded_on_the_worker(self):
+        audio = self.make_audio(audio_file=self.upload("story.mp3", mp3_bytes(50, kbps=192)))
+        self.assertEqual(work_off(), 3)  # probe, then the transcode and waveform it queues
+
+        renditions = list(audio.renditions.all())
+        self.assertEqual([r.name for r in renditions], ["low", "medium", "high"])
+        for rendition in renditions:
+            self.assertTrue(os.path.isfile(rendition.file.path))
+            self.assertTrue(os.path.isfile(rendition.playlist.path))
+        with open(os.path.join(self.media_root, renditions[0].master_playlist)) as f:
+            master = f.read()
+        self.assertIn("#EXT-X-STREAM-INF:BANDWIDTH=48000\nlow/index.m3u8", master)
+
+        streams = self.client.get(f"/api/story/audios/{audio.id}/play/").data["data"]["audio"]["streams"]
+        self.assertTrue(streams["hls"].endswith(renditions[0].master_playlist))
+        self.assertEqual([(r["name"], r["bitrate"]) for r in streams["renditions"]], [("low", 48), ("medium", 96), ("high", 160)])
+        details = self.client.get(f"/api/story/audios/{audio.id}/details/").data["data"]
+        self.assertEqual(details["streams"], streams)
+
+        # saving again does not queue another job, a new upload does and replaces the old version
+        audio.refresh_from_db()
+        audio.title = "Renamed"
+        audio.save()
+        self.assertEqual(work_off(), 0)
+        old_directory = os.path.dirname(renditions[0].file.path)
+        audio.audio_file = self.upload("story-v2.mp3", mp3_bytes(80, kbps=192))
+        audio.save()
+        self.assertEqual(work_off(), 3)
+        self.assertEqual(set(audio.renditions.values_list("source", flat=True)), {"audios/story-v2.mp3"})
+
+        # the replaced version stays for players still streaming it
+        self.assertTrue(os.path.exists(old_directory))
+        prune = Job.objects.get(name="media.prune_renditions")
+        self.assertGreater(prune.run_at, timezone.now() + timedelta(days=1))
+        self.assertEqual(prune_renditions(audio.id), 0)
+        with override_settings(RENDITION_GRACE_PERIOD=0):
+            self.assertEqual(prune_renditions(audio.id), 1)
+        self.assertFalse(os.path.exists(old_directory))
+        self.assertTrue(all(os.path.isfile(r.file.path) for r in audio.renditions.all()))
+
+    def test_renditions_stop_at_the_source_bitrate(self):
+        audio = self.make_audio(audio_file=self.upload("story.mp3", mp3_bytes(50, kbps=128)))
+        work_off()
+        self.assertEqual(list(audio.renditions.values_list("name", flat=True)), ["low", "medium"])
+
+    def test_non_audio_file_is_not_transcoded(self):
+        # stored before uploads were validated
+        audio = self.make_audio(audio_file=self.upload("notes.pdf", b"%PDF-1.4 not audio"))
+        work_off()
+        self.assertEqual(Job.objects.get(name="media.probe").status, Job.DONE)
+        self.assertFalse(Job.objects.filter(name="media.transcode").exists())
+        self.assertFalse(audio.renditions.exists())
+        data = self.client.get(f"/api/story/audios/{audio.id}/play/").data["data"]["audio"]
+        self.assertEqual(data["streams"], {"hls": None, "renditions": []})
+
+
+def jpeg_bytes(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (40, 60, 200)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class ImageDerivativeTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_SIZES={"thumbnail": 160, "card": 480, "full": 1280})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_cover_derivatives_are_served_by_requested_size(self):
+        audio = self.make_audio(cover_image=SimpleUploadedFile("cover.jpg", jpeg_bytes(3000, 2000)))
+        url = f"/api/story/audios/{audio.id}/details/"
+        self.assertTrue(self.client.get(url).data["data"]["audio"]["cover_image"].endswith(audio.cover_image.url))
+
+        work_off()
+        derivatives = {(d.size, d.format): d for d in ImageDerivative.objects.filter(source=audio.cover_image.name)}
+        self.assertEqual(len(derivatives), 6)
+        self.assertEqual((derivatives["card", "webp"].width, derivatives["card", "webp"].height), (480, 320))
+        self.assertEqual(derivatives["full", "jpeg"].width, 1280)
+
+        cover = self.client.get(url, {"image_size": "thumbnail"}, HTTP_ACCEPT="image/webp,*/*").data["data"]["audio"]["cover_image"]
+        self.assertTrue(cover.endswith(derivatives["thumbnail", "webp"].file.url))
+        self.assertRegex(cover, r"/derivatives/[0-9a-f]{2}/[0-9a-f]{32}\.webp$")
+        cover = self.client.get(url, {"image_size": "card"}).data["data"]["audio"]["cover_image"]
+        self.assertTrue(cover.endswith(derivatives["card", "jpeg"].file.url))
+        cover = self.client.get(url, {"image_size": "original"}).data["data"]["audio"]["cover_image"]
+        self.assertTrue(cover.endswith(audio.cover_image.url))
+
+        # catalog lists render per size, with one derivative lookup per page
+        self.make_audio("Other", cover_image=SimpleUploadedFile("other.jpg", jpeg_bytes(600, 600)))
+        work_off()
+        catalog_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get("/api/story/audios/", {"image_size": "thumbnail"}).data["data"]
+        self.assertEqual(sum("stories_imagederivative" in q["sql"] for q in queries.captured_queries), 1)
+        self.assertTrue(all("/derivatives/" in audio["cover_image"] for audio in results))
+
+        # anonymous responses are cached per negotiated format
+        anonymous = APIClient()
+        webp = anonymous.get("/api/story/audios/", HTTP_ACCEPT="application/json, image/webp").data["data"]
+        jpeg = anonymous.get("/api/story/audios/", HTTP_ACCEPT="application/json").data["data"]
+        self.assertTrue(all(audio["cover_image"].endswith(".webp") for audio in webp))
+        self.assertTrue(all(audio["cover_image"].endswith(".jpg") for audio in jpeg))
+
+    def test_user_photo_and_notification_image(self):
+        self.user.photo = SimpleUploadedFile("me.jpg", jpeg_bytes(2000, 2000))
+        self.user.save()
+        audio = self.make_audio(cover_image=SimpleUploadedFile("cover.jpg", jpeg_bytes(800, 800)))
+        Notification.objects.create(user=self.user, audio=audio, message="New story")
+        work_off()
+
+        photo = self.client.get("/api/auth/profile/", {"image_size": "thumbnail"}).data["data"]["photo"]
+        thumbnail = ImageDerivative.objects.get(source=self.user.photo.name, size="thumbnail", format="jpeg")
+        self.assertTrue(photo.startswith("http://") and photo.endswith(thumbnail.file.url))
+        self.assertEqual((thumbnail.width, thumbnail.height), (160, 160))
+
+        feed = self.client.get("/api/story/notifications/", {"image_size": "card", "image_format": "webp"}).data["data"]
+        card = ImageDerivative.objects.get(source=audio.cover_image.name, size="card", format="webp")
+        self.assertTrue(feed[0]["image"].endswith(card.file.url))
+
+
+class ContentAddressedStorageTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_identical_uploads_share_one_counted_blob(self):
+        data = mp3_bytes(5)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.make_audio(audio_file=SimpleUploadedFile("story.mp3", data))
+            second = self.make_audio(audio_file=SimpleUploadedFile("story.mp3", data))
+        name = first.audio_file.name
+        self.assertEqual(name, second.audio_file.name)
+        self.assertRegex(name, r"^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.mp3$")
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.audio_file.path))), 1)
+
+        # the stream URL outlives a replaced file, so it is never immutable
+        response = self.client.get(f"/api/story/audios/{first.id}/stream/")
+        self.assertEqual(response["Cache-Control"], "public, max-age=86400")
+
+        # a new upload releases the old blob, the last reference removes it
+        with self.captureOnCommitCallbacks(execute=True):
+            second.audio_file = SimpleUploadedFile("other.mp3", mp3_bytes(6))
+            second.save()
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, name)))
+        self.assertTrue(os.path.exists(second.audio_file.path))
+
+    def test_reuploading_the_same_content_keeps_one_reference(self):
+        data = mp3_bytes(5)
+        with self.captureOnCommitCallbacks(execute=True):
+            audio = self.make_audio(audio_file=SimpleUploadedFile("story.mp3", data))
+        name = audio.audio_file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            audio.audio_file = SimpleUploadedFile("again.mp3", data)
+            audio.save()
+        self.assertEqual(audio.audio_file.name, name)
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            audio.delete()
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+
+    def test_dedupe_media_merges_existing_duplicates(self):
+        os.makedirs(os.path.join(self.media_root, "audios"))
+        os.makedirs(os.path.join(self.media_root, "user_None"))
+        for name, data in [("audios/a.mp3", mp3_bytes(5)), ("audios/a_QvBBRxj.mp3", mp3_bytes(5)),
+                           ("audios/b.mp3", mp3_bytes(7)), ("user_None/IMG.jpeg", b"photo")]:
+            with open(os.path.join(self.media_root, name), "wb") as f:
+                f.write(data)
+        first = self.make_audio(audio_file="audios/a.mp3")
+        second = self.make_audio(audio_file="audios/a_QvBBRxj.mp3")
+        third = self.make_audio(audio_file="audios/b.mp3")
+        Audio.objects.filter(pk=second.pk).update(probed_file="audios/a_QvBBRxj.mp3")
+        User.objects.filter(pk=self.user.pk).update(photo="user_None/IMG.jpeg")
+
+        out = io.StringIO()
+        call_command("dedupe_media", stdout=out)
+        self.assertIn("Merged 1 duplicates of 4 files", out.getvalue())
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual(first.audio_file.name, second.audio_file.name)
+        self.assertEqual(second.probed_file, second.audio_file.name)
+        self.assertNotEqual(first.audio_file.name, third.audio_file.name)
+        self.assertEqual(StoredBlob.objects.get(name=first.audio_file.name).refcount, 2)
+        with first.audio_file.open("rb") as f:
+            self.assertEqual(f.read(), mp3_bytes(5))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "audios")), [])
+        self.assertTrue(User.objects.get(pk=self.user.pk).photo.name.startswith("cas/"))
+
+    def test_dedupe_media_failure_keeps_files_of_unmigrated_rows(self):
+        os.makedirs(os.path.join(self.media_root, "audios"))
+        with open(os.path.join(self.media_root, "audios/a.mp3"), "wb") as f:
+            f.write(mp3_bytes(5))
+        audio = self.make_audio(audio_file="audios/a.mp3")
+
+        with mock.patch(
+            "apps.stories.management.commands.dedupe_media.rename_references", side_effect=DatabaseError
+        ), self.assertRaises(DatabaseError):
+            call_command("dedupe_media", stdout=io.StringIO())
+        audio.refresh_from_db()
+        self.assertEqual(audio.audio_file.name, "audios/a.mp3")
+        self.assertTrue(os.path.exists(audio.audio_file.path))
+
+        call_command("dedupe_media", stdout=io.StringIO())
+        audio.refresh_from_db()
+        self.assertTrue(audio.audio_file.name.startswith("cas/"))
+        self.assertEqual(StoredBlob.objects.get(name=audio.audio_file.name).refcount, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "audios/a.mp3")))
+
+
+@override_settings(AUDIO_ENCODER="apps.stories.tests.FakeEncoder", WAVEFORM_SAMPLE_RATE=8192, WAVEFORM_RESOLUTIONS=(4, 16))
+class WaveformTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_envelope_is_computed_and_served(self):
+        audio = self.make_audio(audio_file=SimpleUploadedFile("story.mp3", mp3_bytes(20)))
+        url = f"/api/story/audios/{audio.id}/waveform/"
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        work_off()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertEqual(response["Cache-Control"], "public, max-age=86400")
+        data = b"".join(response.streaming_content)
+        self.assertEqual(len(data), 12 + 2 * 4 + 2 * (4 + 16))
+        self.assertEqual(struct.unpack_from("<I", data, 8)[0], 2000)  # duration in ms
+
+        levels = decode_levels(data)
+        self.assertEqual(sorted(levels), [4, 16])
+        loud, quiet = (16384 * 255 + 16384) // 32768, round(1024 * 255 / 32768)
+        self.assertEqual(levels[4], [(loud, loud), (loud, loud), (quiet, quiet), (quiet, quiet)])
+        self.assertEqual(levels[16][0], (loud, loud))
+        self.assertEqual(levels[16][-1], (quiet, quiet))
+
+
+class FFmpegDecodeTests(TestCase):
+
+    def fake_ffmpeg(self, script):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "ffmpeg")
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\n" + script)
+        os.chmod(path, 0o755)
+        return path
+
+    def test_error_output_larger_than_a_pipe_does_not_block(self):
+        binary = self.fake_ffmpeg("head -c 300000 /dev/zero | tr '\\0' e >&2\necho corrupt >&2\nexit 1\n")
+        with override_settings(FFMPEG_BINARY=binary), self.assertRaisesRegex(TranscodeError, "corrupt$"):
+            list(FFmpegEncoder().decode("story.mp3", 8000))
+
+    def test_decode_is_killed_after_the_timeout(self):
+        binary = self.fake_ffmpeg("exec sleep 30\n")
+        with override_settings(FFMPEG_BINARY=binary, TRANSCODE_TIMEOUT=0.2), self.assertRaises(subprocess.TimeoutExpired):
+            list(FFmpegEncoder().decode("story.mp3", 8000))
+
+
+class DownloadTransferTests(StoriesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.data = mp3_bytes(10)
+        self.audio = self.make_audio("Night Train", audio_file=SimpleUploadedFile("story.mp3", self.data))
+
+    def create(self):
+        response = self.client.post(f"/api/story/downloads/{self.audio.id}/create/")
+        self.assertIn(response.status_code, (200, 201))
+        return response.data["data"]["manifest"]
+
+    def test_manifest_links_resume_and_carry_checksums(self):
+        manifest = self.create()
+        (entry,) = manifest["files"]
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(entry["kind"], "audio")
+        self.assertEqual(entry["name"], "night-train.mp3")
+        self.assertEqual((entry["size"], entry["sha256"]), (len(self.data), digest))
+        # the same download keeps handing out working links
+        self.assertEqual(self.create()["files"][0]["sha256"], digest)
+
+        anonymous = APIClient()
+        response = anonymous.get(entry["url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["Cache-Control"], "private, max-age=0")
+        self.assertEqual(response["Repr-Digest"], repr_digest(digest))
+        self.assertIn('filename="night-train.mp3"', response["Content-Disposition"])
+
+        response = anonymous.get(entry["url"], HTTP_RANGE="bytes=10-", HTTP_IF_RANGE=response["ETag"])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.data[10:])
+
+    @override_settings(AUDIO_ENCODER="apps.stories.tests.FakeEncoder", WAVEFORM_SAMPLE_RATE=8192)
+    def test_checksums_come_from_the_media_jobs(self):
+        legacy = os.path.join(settings.MEDIA_ROOT, "audios", "legacy.mp3")
+        os.makedirs(os.path.dirname(legacy))
+        with open(legacy, "wb") as f:
+            f.write(self.data)
+        self.audio = self.make_audio("Legacy", audio_file="audios/legacy.mp3")
+        with mock.patch("apps.stories.storage.digest_of", side_effect=AssertionError("hashed in the request")):
+            (entry,) = self.create()["files"]
+        self.assertIsNone(entry["sha256"])  # not probed yet
+        self.assertNotIn("Repr-Digest", APIClient().get(entry["url"]))
+
+        work_off()
+        self.audio.refresh_from_db()
+        self.assertEqual(self.audio.file_sha256, hashlib.sha256(self.data).hexdigest())
+        with mock.patch("apps.stories.storage.digest_of", side_effect=AssertionError("hashed in the request")):
+            files = self.create()["files"]
+        self.assertEqual([f["kind"] for f in files], ["audio", "rendition-low", "rendition-medium"])
+        for entry, rendition in zip(files[1:], self.audio.renditions.all()):
+            with open(rendition.file.path, "rb") as f:
+                self.assertEqual(entry["sha256"], hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual(files[0]["sha256"], self.audio.file_sha256)
+
+    @override_settings(DOWNLOAD_WINDOW_DAYS=30)
+    def test_repeat_download_names_the_configured_window(self):
+        self.create()
+        response = self.client.post(f"/api/story/downloads/{self.audio.id}/create/")
+        self.assertEqual(response.data["message"], "Audio already in your download list (within 30 days)")
+
+    def test_tampered_expired_and_removed_links_are_refused(self):
+        url = self.create()["files"][0]["url"]
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(url.replace("/transfer/", "/transfer/x")).status_code, 403)
+
+        Download.objects.update(created_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(anonymous.get(url).status_code, 410)
+
+        Download.objects.update(created_at=timezone.now())
+        self.assertEqual(anonymous.get(url).status_code, 200)
+        Download.objects.all().delete()
+        self.assertEqual(anonymous.get(url).status_code, 410)
@@ -1,52 +1,24 @@
-import threading
-from apps.user.models import User
-from apps.stories.models import Notification
-
+from apps.stories.jobs import enqueue
+from apps.stories.models import NotificationFanOut
+from apps.stories.notifications import publish
 
 
 def create_audio_notifications(audio):
-    """Background thread task for audio notifications"""
-    def task():
-        users = User.objects.all()
-        notifications = [
-            Notification(
-                user=user,
-                audio=audio,
-                message=f"New story uploaded: {audio.title}"
-            )
-            for user in users
-        ]
-        Notification.objects.bulk_create(notifications)
-    threading.Thread(target=task).start()
+    """Queue the notification of the followers of the audio's category"""
+    if audio.category_id is None:
+        return None
+    fan_out = NotificationFanOut.objects.create(
+        audio=audio, followers_of_id=audio.category_id, message=f"New story uploaded: {audio.title}"
+    )
+    enqueue("notifications.fan_out", fan_out_id=fan_out.pk)
+    return fan_out
 
 
 def create_category_notifications(category):
-    """Background thread task for category notifications"""
-    def task():
-        users = User.objects.all()
-        notifications = [
-            Notification(
-                user=user,
-                category=category,
-                message=f"New category added: {category.name}"
-            )
-            for user in users
-        ]
-        Notification.objects.bulk_create(notifications)
-    threading.Thread(target=task).start()
+    """Publish a "new category" broadcast, one row however many users there are"""
+    return publish(f"New category added: {category.name}", category=category)
 
 
 def create_subscription_notification(user):
-    """Background thread task for subscription notifications"""
-    def task():
-        if user.subscription and user.subscription.is_active():
-            months_left = user.subscription.months_left()
-            message = f"You Have {months_left} Months Left On Your Subscription."
-
-            Notification.objects.create(
-                user=user,
-                message=message,
-                # audio/category ফাঁকা থাকবে
-            )
-
-    threading.Thread(target=task).start()
+    """Queue the "months left" reminder of the user's subscription"""
+    return enqueue("notifications.subscription", user_id=user.pk)
@@ -0,0 +1,254 @@
+"""
+Bitrate renditions and HLS segments of uploaded audio.
+
+Once an upload is probed the "media.transcode" job (tasks.py) encodes
+`Audio.audio_file` into a progressive file per AUDIO_RENDITIONS entry up
+to the source bitrate, cuts each of those into HLS_SEGMENT_SECONDS
+segments with a media playlist (stream copy, no second encode) and
+writes a master playlist listing them all, under
+
+    MEDIA_ROOT/renditions/<audio id>/<version>/
+        master.m3u8
+        low.m4a      low/index.m3u8     low/seg_00000.ts ...
+        medium.m4a   medium/...
+
+`version` is derived from the source file plus a token of the run, so
+every build gets fresh URLs that can be cached forever. Each run builds
+in a staging directory of its own and moves it in place once complete.
+The version it replaces stays in place for RENDITION_GRACE_PERIOD
+seconds, so players already streaming it can finish. After that the
+"media.prune_renditions" job removes it.
+
+The encoder is pluggable through AUDIO_ENCODER: any class with `codec`,
+`extension`, `encode(source, target, bitrate)` and
+`segment(source, directory, seconds)` returning the playlist path, and
+`decode(source, sample_rate)` yielding mono 16-bit PCM (waveform.py).
+FFmpegEncoder runs the local FFMPEG_BINARY.
+"""
+import hashlib
+import logging
+import os
+import posixpath
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .jobs import enqueue
+from .models import Audio, AudioRendition
+from .storage import digest_of
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = "renditions"
+PARTIAL_SUFFIX = ".partial"
+STDERR_TAIL = 4096  # bytes of ffmpeg's error output kept for the error message
+
+
+class TranscodeError(Exception):
+    """The source cannot be transcoded (not audio, corrupt), retrying will not help"""
+
+
+class FFmpegEncoder:
+    codec = "aac"
+    extension = ".m4a"
+    codecs_attribute = "mp4a.40.2"  # AAC-LC, for the master playlist
+
+    def run(self, args):
+        command = [settings.FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error", "-y", *args]
+        try:
+            subprocess.run(command, check=True, capture_output=True, timeout=settings.TRANSCODE_TIMEOUT)
+        except subprocess.CalledProcessError as exc:
+            raise TranscodeError(exc.stderr.decode(errors="replace").strip() or f"ffmpeg exited with {exc.returncode}")
+
+    def encode(self, source, target, bitrate):
+        self.run([
+            "-i", source, "-map", "0:a:0", "-vn",
+            "-c:a", "aac", "-b:a", f"{bitrate}k",
+            "-movflags", "+faststart", target,
+        ])
+
+    def segment(self, source, directory, seconds):
+        os.makedirs(directory, exist_ok=True)
+        playlist = os.path.join(directory, "index.m3u8")
+        self.run([
+            "-i", source, "-map", "0:a:0", "-c", "copy",
+            "-f", "hls", "-hls_time", str(seconds), "-hls_playlist_type", "vod",
+            "-hls_segment_filename", os.path.join(directory, "seg_%05d.ts"),
+            playlist,
+        ])
+        return playlist
+
+    def decode(self, source, sample_rate):
+        """Mono signed 16-bit little-endian PCM, streamed in chunks"""
+        command = [
+            settings.FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error",
+            "-i", source, "-map", "0:a:0", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-",
+        ]
+        # stderr goes to a file: a full pipe nobody reads would block ffmpeg and this reader
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+            timed_out = threading.Event()
+
+            def expire():
+                timed_out.set()
+                process.kill()
+
+            timer = threading.Timer(settings.TRANSCODE_TIMEOUT, expire)
+            timer.start()
+            try:
+                while chunk := process.stdout.read(64 * 1024):
+                    yield chunk
+            finally:
+                timer.cancel()
+                process.stdout.close()
+                if process.poll() is None:
+                    process.kill()
+                returncode = process.wait()
+            errors.seek(max(0, errors.seek(0, os.SEEK_END) - STDERR_TAIL))
+            stderr = errors.read().decode(errors="replace").strip()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(command, settings.TRANSCODE_TIMEOUT)
+        if returncode:
+            raise TranscodeError(stderr or f"ffmpeg exited with {returncode}")
+
+
+def get_encoder():
+    return import_string(settings.AUDIO_ENCODER)()
+
+
+def source_version(path, name):
+    stat = os.stat(path)
+    return hashlib.sha1(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+
+
+def relative(path):
+    return os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/")
+
+
+def write_master(path, renditions, encoder):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    codecs = getattr(encoder, "codecs_attribute", "")
+    for rendition in renditions:
+        attributes = f"BANDWIDTH={rendition.bitrate * 1000}" + (f',CODECS="{codecs}"' if codecs else "")
+        lines.append(f"#EXT-X-STREAM-INF:{attributes}")
+        lines.append(posixpath.relpath(rendition.playlist.name, posixpath.dirname(rendition.file.name)))
+    with open(path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def planned_renditions(audio):
+    """AUDIO_RENDITIONS by bitrate, less those above the source's (the lowest is always made)"""
+    planned = sorted(settings.AUDIO_RENDITIONS.items(), key=lambda item: item[1])
+    if audio.bitrate:
+        planned = planned[:1] + [(name, bitrate) for name, bitrate in planned[1:] if bitrate <= audio.bitrate]
+    return planned
+
+
+def is_current(renditions, audio):
+    return (
+        {rendition.name for rendition in renditions} == {name for name, _ in planned_renditions(audio)}
+        and all(rendition.source == audio.audio_file.name for rendition in renditions)
+    )
+
+
+def transcode(audio_id, force=False):
+    """(Re)build the renditions of an audio, returns them; a no-op when they are current unless `force`"""
+    audio = Audio.objects.filter(pk=audio_id).only("audio_file", "bitrate").first()
+    if audio is None or not audio.audio_file:
+        return []
+    existing = list(audio.renditions.all())
+    if existing and is_current(existing, audio) and not force:
+        return existing
+
+    source = audio.audio_file.path
+    if not os.path.isfile(source):
+        raise TranscodeError(f"{audio.audio_file.name} is missing")
+    root = os.path.join(settings.MEDIA_ROOT, RENDITIONS_DIR, str(audio.pk))
+    version = f"{source_version(source, audio.audio_file.name)}-{uuid.uuid4().hex[:8]}"
+    directory = os.path.join(root, version)
+    # built aside and moved in place once complete, the served version stays intact until then
+    staging = directory + PARTIAL_SUFFIX
+    os.makedirs(staging)
+
+    encoder = get_encoder()
+    renditions = []
+    try:
+        for name, bitrate in planned_renditions(audio):
+            target = os.path.join(staging, name + encoder.extension)
+            encoder.encode(source, target, bitrate)
+            playlist = encoder.segment(target, os.path.join(staging, name), settings.HLS_SEGMENT_SECONDS)
+            renditions.append(AudioRendition(
+                audio=audio, name=name, bitrate=bitrate, codec=encoder.codec,
+                file=relative(os.path.join(directory, os.path.relpath(target, staging))),
+                playlist=relative(os.path.join(directory, os.path.relpath(playlist, staging))),
+                source=audio.audio_file.name, size=os.path.getsize(target), sha256=file_sha256(target),
+            ))
+        write_master(os.path.join(staging, "master.m3u8"), renditions, encoder)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    os.replace(staging, directory)
+
+    with transaction.atomic():
+        AudioRendition.objects.filter(audio=audio).delete()
+        AudioRendition.objects.bulk_create(renditions)
+        retire(existing, audio.pk)
+
+    logger.info("Transcoded audio %s into %s renditions", audio.pk, len(renditions))
+    return renditions
+
+
+def file_sha256(path):
+    with open(path, "rb") as file:
+        return digest_of(file)
+
+
+def version_directory(rendition):
+    return os.path.dirname(rendition.file.path)
+
+
+def retire(renditions, audio_id):
+    """Start the grace period of the version `renditions` were published in"""
+    directories = {version_directory(rendition) for rendition in renditions}
+    for directory in directories:
+        if os.path.isdir(directory):
+            os.utime(directory)  # the mtime of a retired version is when it stopped being served
+    if directories:
+        run_at = timezone.now() + timedelta(seconds=settings.RENDITION_GRACE_PERIOD)
+        enqueue("media.prune_renditions", run_at=run_at, audio_id=audio_id)
+
+
+def prune_renditions(audio_id):
+    """
+    Remove the versions of an audio retired more than RENDITION_GRACE_PERIOD
+    ago and the staging directories of runs that can no longer be alive
+    """
+    root = os.path.join(settings.MEDIA_ROOT, RENDITIONS_DIR, str(audio_id))
+    if not os.path.isdir(root):
+        return 0
+    current = {version_directory(rendition) for rendition in AudioRendition.objects.filter(audio_id=audio_id)}
+    now = time.time()
+    # two ffmpeg runs per rendition at most
+    longest_run = 2 * len(settings.AUDIO_RENDITIONS) * settings.TRANSCODE_TIMEOUT
+    removed = 0
+    for entry in os.scandir(root):
+        if not entry.is_dir() or entry.path in current:
+            continue
+        limit = longest_run if entry.name.endswith(PARTIAL_SUFFIX) else settings.RENDITION_GRACE_PERIOD
+        if now - entry.stat().st_mtime >= limit:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def remove_renditions(audio_id):
+    shutil.rmtree(os.path.join(settings.MEDIA_ROOT, RENDITIONS_DIR, str(audio_id)), ignore_errors=True)
@@ -0,0 +1,140 @@
+"""
+Time-decayed trending scores.
+
+Plays recorded in History are folded into hourly AudioPlayBucket rows and
+each bucket adds `plays * 2 ** ((hour - epoch) / half_life)` to the
+audio's TrendingScore. Scaling every contribution to a shared epoch means
+stored scores never have to be decayed in place: dividing them all by the
+same factor would not change their order, so the endpoint reads them as
+they are with an index scan on `-score`. The epoch is moved forward
+(one UPDATE) before the factors grow too large for a float.
+
+History is consumed by `played_at` up to TRENDING_SAFETY_LAG seconds ago,
+not by id: writers commit batches out of id order, and a row that became
+visible after a higher id was checkpointed would never be counted.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import AudioPlayBucket, History, TrendingScore, TrendingState
+
+# exp(600) is ~1e260, well inside float range with room for the sums
+MAX_EXPONENT = 600
+
+
+def decay_rate():
+    """Per-second decay constant for TRENDING_HALF_LIFE_HOURS"""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def weight(hour, epoch):
+    return math.exp(decay_rate() * (hour - epoch).total_seconds())
+
+
+def rebase(state, now):
+    """Move the epoch to `now`, rescaling every stored score in one UPDATE"""
+    factor = math.exp(-decay_rate() * (now - state.epoch).total_seconds())
+    TrendingScore.objects.update(score=F("score") * factor)
+    state.epoch = now
+    state.save(update_fields=["epoch"])
+
+
+def update_trending(now=None):
+    """
+    Fold History rows played since the last run, and at least
+    TRENDING_SAFETY_LAG seconds ago, into the hourly buckets and trending
+    scores. Returns the number of History rows consumed.
+    """
+    now = now or timezone.now()
+    until = now - timedelta(seconds=settings.TRENDING_SAFETY_LAG)
+    with transaction.atomic():
+        state = TrendingState.objects.select_for_update().filter(pk=1).first()
+        if state is None:
+            state = TrendingState.objects.create(pk=1, epoch=now)
+        if state.played_until is not None and until <= state.played_until:
+            return 0
+
+        if decay_rate() * (now - state.epoch).total_seconds() > MAX_EXPONENT:
+            rebase(state, now)
+
+        history = History.objects.filter(played_at__lt=until)
+        if state.played_until is not None:
+            history = history.filter(played_at__gte=state.played_until)
+        rows = (
+            history.annotate(hour=TruncHour("played_at"))
+            .values("audio_id", "hour")
+            .annotate(plays=Count("id"))
+            .order_by()
+        )
+        plays = {(row["audio_id"], row["hour"]): row["plays"] for row in rows}
+        consumed = sum(plays.values())
+
+        add_to_buckets(plays)
+        add_to_scores(plays, state.epoch)
+
+        state.played_until = until
+        state.save(update_fields=["played_until"])
+
+    prune_buckets(now)
+    return consumed
+
+
+def add_to_buckets(plays):
+    audio_ids = {audio_id for audio_id, _ in plays}
+    hours = {hour for _, hour in plays}
+    existing = {
+        (bucket.audio_id, bucket.hour): bucket
+        for bucket in AudioPlayBucket.objects.filter(audio_id__in=audio_ids, hour__in=hours)
+    }
+    changed, created = [], []
+    for (audio_id, hour), count in plays.items():
+        bucket = existing.get((audio_id, hour))
+        if bucket:
+            bucket.plays += count
+            changed.append(bucket)
+        else:
+            created.append(AudioPlayBucket(audio_id=audio_id, hour=hour, plays=count))
+    AudioPlayBucket.objects.bulk_update(changed, ["plays"], batch_size=500)
+    AudioPlayBucket.objects.bulk_create(created, batch_size=500)
+
+
+def add_to_scores(plays, epoch):
+    now = timezone.now()
+    deltas = defaultdict(float)
+    for (audio_id, hour), count in plays.items():
+        deltas[audio_id] += count * weight(hour, epoch)
+
+    existing = {score.audio_id: score for score in TrendingScore.objects.filter(audio_id__in=deltas)}
+    changed, created = [], []
+    for audio_id, delta in deltas.items():
+        score = existing.get(audio_id)
+        if score:
+            score.score += delta
+            score.updated_at = now
+            changed.append(score)
+        else:
+            created.append(TrendingScore(audio_id=audio_id, score=delta))
+    TrendingScore.objects.bulk_update(changed, ["score", "updated_at"], batch_size=500)
+    TrendingScore.objects.bulk_create(created, batch_size=500)
+
+
+def prune_buckets(now):
+    cutoff = now - timedelta(days=settings.TRENDING_BUCKET_RETENTION_DAYS)
+    AudioPlayBucket.objects.filter(hour__lt=cutoff).delete()
+
+
+def rebuild_trending(now=None):
+    """Drop every bucket and score and aggregate History from the start"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        AudioPlayBucket.objects.all().delete()
+        TrendingScore.objects.all().delete()
+        TrendingState.objects.update_or_create(pk=1, defaults={"played_until": None, "epoch": now})
+    return update_trending(now)
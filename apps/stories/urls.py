@@ -1,7 +1,10 @@
 from django.urls import path
+from .events import notification_stream
 from .views import (
     AudioListView,
     AudioPlayView,
+    AudioStreamView,
+    AudioWaveformView,
     TrendingAudioView,
     PopularAudioView,
     RecommendedAudioView,
@@ -11,6 +14,9 @@ from .views import (
     TopAllStoriesView,
     NotificationListView,
     NotificationMarkReadView,
+    BroadcastReadView,
+    NotificationUnreadCountView,
+    NotificationReadAllView,
     FollowCategoryCreateView,
     FollowCategoryDeleteView,
     FollowCategoryListView,
@@ -23,8 +29,13 @@ from .views import (
     DownloadCreateView,
     DownloadListView,
     DownloadDeleteView,
+    DownloadTransferView,
     AudioSearchView,
+    SearchSuggestView,
+    SearchHistoryListView,
     SearchHistoryDeleteView,
+    CatalogCacheStatsView,
+    JobStatsView,
 )
 
 urlpatterns = [
@@ -34,15 +45,20 @@ urlpatterns = [
     # Audio
     path("audios/", AudioListView.as_view(), name="audio-list"),
     path("audios/<int:pk>/play/", AudioPlayView.as_view(), name="audio-play"),
+    path("audios/<int:pk>/stream/", AudioStreamView.as_view(), name="audio-stream"),
+    path("audios/<int:pk>/waveform/", AudioWaveformView.as_view(), name="audio-waveform"),
     path("audios/<int:pk>/details/", AudioDetailsView.as_view(), name="audio-play"),
     
     #Downloades
     path('downloads/', DownloadListView.as_view(), name='download-list'),
     path('downloads/<int:audio_id>/create/', DownloadCreateView.as_view(), name='download-create'),
     path('downloads/<int:pk>/delete/', DownloadDeleteView.as_view(), name='download-delete'),
+    path('downloads/transfer/<str:token>/', DownloadTransferView.as_view(), name='download-transfer'),
     
     #Search
     path('search/', AudioSearchView.as_view(), name='audio-search'),
+    path('search/suggest/', SearchSuggestView.as_view(), name='search-suggest'),
+    path('search/history/', SearchHistoryListView.as_view(), name='search-history'),
     path('search/history/<int:pk>/delete/', SearchHistoryDeleteView.as_view(), name='search-history-delete'),
 
     # Trending / Top Story / Popular / Recommended
@@ -51,6 +67,9 @@ urlpatterns = [
     path("audios/popular/", PopularAudioView.as_view(), name="popular-audios"),
     path("audios/recommended/", RecommendedAudioView.as_view(), name="recommended-audios"),
     
+    path("cache/stats/", CatalogCacheStatsView.as_view(), name="catalog-cache-stats"),
+    path("jobs/stats/", JobStatsView.as_view(), name="job-stats"),
+
     path('categories/', CategoryListView.as_view(), name='categories-list'),
     path('categories/<str:category_name>/', CategoryView.as_view(), name='category-audios'),
 
@@ -73,4 +92,8 @@ urlpatterns = [
     # Notifications
     path("notifications/", NotificationListView.as_view(), name="notifications"),
     path("notifications/<int:pk>/", NotificationMarkReadView.as_view(), name="notification_mark_read"),
+    path("notifications/broadcasts/<int:pk>/", BroadcastReadView.as_view(), name="broadcast_mark_read"),
+    path("notifications/unread-count/", NotificationUnreadCountView.as_view(), name="notification_unread_count"),
+    path("notifications/read/", NotificationReadAllView.as_view(), name="notification_read_all"),
+    path("notifications/stream/", notification_stream, name="notification_stream"),
 ]
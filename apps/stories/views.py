@@ -1,25 +1,41 @@
 from django.shortcuts import render
 from .models import *
 from .serializers import *
+from .cache import cache_stats, catalog_cached
+from .history import history_writer
+from .downloads import DownloadGone, file_name, manifest, repr_digest, resolve, window_start
+from .streaming import serve_file
+from .waveform import waveform_path
+from .jobs import job_stats
+from . import notifications
+from .search import record_search, search_audios
+from .suggest import suggestions
+from .pagination import KeysetPaginator, InvalidCursor, LATEST_ORDERING, POPULAR_ORDERING, TRENDING_ORDERING
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
+from django.core import signing
 from django.utils import timezone
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
+from django.conf import settings
 from datetime import timedelta
+import os
 
 
 class BaseAPIView(APIView):
     
-    def success_response(self, message="Thank you for your request", data=None, status_code=status.HTTP_200_OK):
-        return Response(
-            {
+    def success_response(self, message="Thank you for your request", data=None, status_code=status.HTTP_200_OK, pagination=None):
+        payload = {
             "success": True,
             "message": message,
             "status_code": status_code,
             "data": data or []
-            }, 
-            status=status_code)
+            }
+        if pagination is not None:
+            payload["pagination"] = pagination
+        return Response(payload, status=status_code)
         
     # Accepts `errors` as an alias for `data` to support serializer.errors usage
     def error_response(self, message="I am sorry for your request", data=None, errors=None, status_code=status.HTTP_400_BAD_REQUEST):
@@ -33,17 +49,28 @@ class BaseAPIView(APIView):
             }, 
             status=status_code)
 
+    def paginate(self, request, queryset, ordering):
+        """Returns (rows, pagination) for the keyset page selected by `?cursor=`"""
+        return KeysetPaginator(ordering).paginate(queryset, request)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, InvalidCursor):
+            return self.error_response(message=str(exc), status_code=status.HTTP_400_BAD_REQUEST)
+        return super().handle_exception(exc)
+
 
 class AudioListView(BaseAPIView):
     permission_classes=[permissions.AllowAny]
     
+    @catalog_cached
     def get(self, request):
-        audios = Audio.objects.all().order_by("-created_at")
-        serializer = AudioSerializer(audios, many=True)
+        audios, pagination = self.paginate(request, Audio.objects.select_related("category"), LATEST_ORDERING)
+        serializer = AudioSerializer(audios, many=True, context={"request": request})
         
         return self.success_response(
             message="Audio list retrieved successfully",
-            data=serializer.data
+            data=serializer.data,
+            pagination=pagination
         )
 
 class AudioDetailsView(BaseAPIView):
@@ -53,7 +80,7 @@ class AudioDetailsView(BaseAPIView):
         try:
             audio = Audio.objects.get(pk=pk)
             
-            History.objects.create(user=request.user, audio=audio)
+            history_writer.record(request.user, audio)
             serializer = AudioSerializer(audio, context={"request": request})
 
             related_audios= Audio.objects.filter(category= audio.category).exclude(id=audio.id)
@@ -64,6 +91,7 @@ class AudioDetailsView(BaseAPIView):
                 data={
                     "play_count": audio.play_count,
                     "audio": serializer.data ,
+                    "streams": audio_streams(audio, request),
                     "related_audios": related_serializer.data
                 }
             )        
@@ -82,7 +110,7 @@ class AudioPlayView(BaseAPIView):
             audio = Audio.objects.get(pk=pk)
             audio.increment_play()
             
-            History.objects.create(user=request.user, audio=audio)
+            history_writer.record(request.user, audio)
             serializer = AudioPlaySerializer(audio, context={"request": request})
             
             return self.success_response(
@@ -99,42 +127,113 @@ class AudioPlayView(BaseAPIView):
                 status_code=status.HTTP_404_NOT_FOUND
             )               
 
+class AudioStreamView(BaseAPIView):
+    """
+    The audio file itself, with Range (seeking), ETag and sendfile support
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        audio = Audio.objects.filter(pk=pk).only("audio_file").first()
+        if audio is None or not audio.audio_file or not os.path.isfile(audio.audio_file.path):
+            return self.error_response(
+                message="Audio not found. Please check the audio ID.",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        # the URL names the audio, not its content: revalidated with the ETag
+        return serve_file(request, audio.audio_file.path)
+
+
+class AudioWaveformView(BaseAPIView):
+    """
+    Peak/RMS envelope of the audio at several resolutions (see waveform.py),
+    a few KB of binary revalidated against its ETag
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        audio = Audio.objects.filter(pk=pk).only("audio_file").first()
+        path = waveform_path(audio) if audio is not None and audio.audio_file else None
+        if path is None or not os.path.isfile(path):
+            return self.error_response(
+                message="Waveform not available yet.",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        # keyed by the audio like the stream: a new upload gets a new ETag
+        return serve_file(request, path, content_type="application/octet-stream")
+
+
+def category_previews(request):
+    """
+    Latest N audios of every category in a constant number of queries:
+    one for the categories, one GROUP BY for the totals and one
+    ROW_NUMBER() window for the previews. "See more" continues from
+    `next_cursor` on the category endpoint.
+    """
+    try:
+        per_category = int(request.GET.get("per_category", settings.CATEGORY_PREVIEW_SIZE))
+    except ValueError:
+        per_category = settings.CATEGORY_PREVIEW_SIZE
+    per_category = max(1, min(per_category, settings.CATALOG_MAX_PAGE_SIZE))
+
+    categories = Category.objects.order_by("id")
+    totals = dict(
+        Audio.objects.filter(category__isnull=False)
+        .values_list("category_id").annotate(total=Count("id")).order_by()
+    )
+    latest = list(
+        Audio.objects.filter(category__isnull=False).select_related("category")
+        .annotate(row_number=Window(
+            RowNumber(), partition_by=F("category_id"), order_by=[F("created_at").desc(), F("id").desc()]
+        ))
+        .filter(row_number__lte=per_category)
+        .order_by("category_id", "-created_at", "-id")
+    )
+    rendered = AudioSerializer(latest, many=True, context={"request": request}).data
+
+    grouped = {}
+    for audio, data in zip(latest, rendered):
+        grouped.setdefault(audio.category_id, []).append((audio, data))
+
+    paginator = KeysetPaginator(LATEST_ORDERING)
+    result = []
+    for category in categories:
+        rows = grouped.get(category.id, [])
+        total = totals.get(category.id, 0)
+        result.append({
+            "category_id": category.id,
+            "category_name": category.name,
+            "total_audios": total,
+            "audios": [data for _, data in rows],
+            "next_cursor": paginator.encode_cursor(rows[-1][0]) if total > len(rows) else None,
+        })
+    return result
+
+
 class CategoryListView(BaseAPIView):
     permission_classes = [permissions.AllowAny]
     
+    @catalog_cached
     def get(self, request):
-        # Get all categories with their audios
-        categories = Category.objects.all()
-        result = []
-        
-        for category in categories:
-            audios = Audio.objects.filter(category=category).order_by("-created_at")
-            audio_serializer = AudioSerializer(audios, many=True, context={"request": request})
-            
-            result.append({
-                "category_id": category.id,
-                "category_name": category.name,
-                "total_audios": audios.count(),
-                "audios": audio_serializer.data
-                
-            })
-        
+        # Get all categories with their latest audios
         return self.success_response(
             message="All categories with their audios retrieved successfully",
-            data=result
+            data=category_previews(request)
         )
 
  
 class CategoryView(BaseAPIView):
     permission_classes = [permissions.AllowAny]
     
+    @catalog_cached
     def get(self, request, category_name=None):
         if category_name:
             # Filter by specific category from URL parameter
             try:
                 category = Category.objects.get(name=category_name)
-                audios = Audio.objects.filter(category=category).order_by("-created_at")
-                audio_serializer = AudioSerializer(audios, many=True, context={"request": request})
+                audios = Audio.objects.filter(category=category)
+                page, pagination = self.paginate(request, audios.select_related("category"), LATEST_ORDERING)
+                audio_serializer = AudioSerializer(page, many=True, context={"request": request})
                 
                 return self.success_response(
                     message=f"Audios for category '{category_name}' retrieved successfully",
@@ -143,7 +242,8 @@ class CategoryView(BaseAPIView):
                         "category_name": category.name,
                         "audios": audio_serializer.data,
                         "total_audios": audios.count()
-                    }
+                    },
+                    pagination=pagination
                 )
             except Category.DoesNotExist:
                 return self.error_response(
@@ -151,28 +251,35 @@ class CategoryView(BaseAPIView):
                     status_code=status.HTTP_404_NOT_FOUND
                 )
         else:
-            # Get all categories with their audios
-            categories = Category.objects.all()
-            result = []
-            
-            for category in categories:
-                audios = Audio.objects.filter(category=category).order_by("-created_at")
-                audio_serializer = AudioSerializer(audios, many=True, context={"request": request})
-                
-                result.append({
-                    "total_audios": audios.count(),
-                    "category_id": category.id,
-                    "category_name": category.name,
-                    "audios": audio_serializer.data,
-                    "total_audios": audios.count()
-                })
-            
+            # Get all categories with their latest audios
             return self.success_response(
                 message="All categories with their audios retrieved successfully",
-                data=result
+                data=category_previews(request)
             )  
         
 
+class CatalogCacheStatsView(BaseAPIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """Catalog response cache hit/miss counters for monitoring"""
+        return self.success_response(
+            message="Catalog cache statistics retrieved successfully",
+            data=cache_stats()
+        )
+
+
+class JobStatsView(BaseAPIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """Background job counts and run times per job name, for monitoring"""
+        return self.success_response(
+            message="Job statistics retrieved successfully",
+            data=job_stats()
+        )
+
+
 class FollowCategoryCreateView(BaseAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -226,7 +333,7 @@ class FollowCategoryListView(BaseAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        follows = FollowCategory.objects.filter(user=request.user)
+        follows = FollowCategory.objects.filter(user=request.user).select_related("category")
         serializer = FollowCategorySerializer(follows, many=True)
         return self.success_response(
             message="Your followed categories retrieved successfully",
@@ -238,12 +345,42 @@ class NotificationListView(BaseAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        """Get all notifications for the logged in user"""
-        notifications = Notification.objects.filter(user=request.user).order_by("-created_at")
-        serializer = NotificationSerializer(notifications, many=True, context={"request": request})
+        """Get the logged in user's notifications, broadcasts included, newest first"""
+        items, pagination = notifications.feed(request.user, request)
+        serializer = FeedSerializer(items, many=True, context={"request": request})
         return self.success_response(
             message="Your notifications retrieved successfully",
-            data=serializer.data
+            data=serializer.data,
+            pagination=pagination,
+        )
+
+
+class NotificationUnreadCountView(BaseAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """Unread badge count"""
+        return self.success_response(
+            message="Unread notifications counted successfully",
+            data=notifications.unread_counts(request.user),
+        )
+
+
+class NotificationReadAllView(BaseAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """Mark everything (or everything up to `up_to_id` / `up_to_broadcast_id`) as read"""
+        limits = {}
+        for name in ("up_to_id", "up_to_broadcast_id"):
+            value = request.data.get(name)
+            try:
+                limits[name] = int(value) if value is not None else None
+            except (TypeError, ValueError):
+                return self.error_response(message=f"{name} must be an integer.")
+        return self.success_response(
+            message="Notifications marked as read successfully",
+            data=notifications.mark_read(request.user, **limits),
         )
 
 class NotificationMarkReadView(BaseAPIView):
@@ -280,40 +417,75 @@ class NotificationMarkReadView(BaseAPIView):
             )        
 
         
+class BroadcastReadView(BaseAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_broadcast(self, request, pk):
+        return notifications.broadcasts_for(request.user).filter(pk=pk).first()
+
+    def post(self, request, pk):
+        """Mark a broadcast as read"""
+        broadcast = self.get_broadcast(request, pk)
+        if broadcast is None:
+            return self.error_response(
+                message="Notification not found. Please check the notification ID.",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        notifications.set_receipt(request.user, broadcast, is_read=True)
+        return self.success_response(message="Notification marked as read successfully")
+
+    def delete(self, request, pk):
+        """Dismiss a broadcast for this user only"""
+        broadcast = self.get_broadcast(request, pk)
+        if broadcast is None:
+            return self.error_response(
+                message="Notification not found or you don't have permission.",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        notifications.set_receipt(request.user, broadcast, is_dismissed=True)
+        return self.success_response(message="Notification deleted successfully", data={"deleted_id": pk})
+
+
 class TrendingAudioView(BaseAPIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        last_week = timezone.now() - timedelta(days=7)
-        audios = Audio.objects.filter(created_at__gte=last_week).order_by("-play_count", "-created_at")
-        serializer = AudioSerializer(audios, many=True, context={"request": request})
+        # scores are materialized by `manage.py update_trending`
+        scores = TrendingScore.objects.select_related("audio__category")
+        scores, pagination = self.paginate(request, scores, TRENDING_ORDERING)
+        serializer = AudioSerializer([score.audio for score in scores], many=True, context={"request": request})
         return self.success_response(
-            message="Trending audios from the last week retrieved successfully",
-            data=serializer.data
+            message="Trending audios retrieved successfully",
+            data=serializer.data,
+            pagination=pagination
         )
 
 
 class TopAllStoriesView(BaseAPIView):
     permission_classes = [permissions.AllowAny]
 
+    @catalog_cached
     def get(self, request):
-        audios = Audio.objects.order_by("-play_count", "-created_at")
+        audios, pagination = self.paginate(request, Audio.objects.select_related("category"), POPULAR_ORDERING)
         serializer = AudioSerializer(audios, many=True, context={"request": request})
         return self.success_response(
             message="Top stories retrieved successfully",
-            data=serializer.data
+            data=serializer.data,
+            pagination=pagination
         )
 
 
 class PopularAudioView(BaseAPIView):
     permission_classes = [permissions.AllowAny]
 
+    @catalog_cached
     def get(self, request):
-        audios = Audio.objects.order_by("-play_count")
+        audios, pagination = self.paginate(request, Audio.objects.select_related("category"), POPULAR_ORDERING)
         serializer = AudioSerializer(audios, many=True, context={"request": request})
         return self.success_response(
             message="Popular audios retrieved successfully",
-            data=serializer.data
+            data=serializer.data,
+            pagination=pagination
         )
 
 
@@ -340,28 +512,32 @@ class LikeToggleView(BaseAPIView):
     def post(self, request, pk):
         try:
             audio = Audio.objects.get(pk=pk)
-            like = Like.objects.filter(user=request.user, audio=audio).first()
 
-            if like:
-                # already liked → unlike
-                like.delete()
+            with transaction.atomic():
+                # already liked → unlike, otherwise like
+                deleted, _ = Like.objects.filter(user=request.user, audio=audio).delete()
+                if deleted:
+                    Audio.adjust_counters(audio.id, likes=-deleted)
+                else:
+                    Like.objects.create(user=request.user, audio=audio)
+                    Audio.adjust_counters(audio.id, likes=1)
+            audio.refresh_from_db(fields=["like_count"])
+
+            if deleted:
                 return self.success_response(
                     message="Audio unliked successfully",
                     data={
                         "is_liked": False,
-                        "total_like": Like.objects.filter(audio=audio).count()
-                    }
-                )
-            else:
-                # not liked → like
-                Like.objects.create(user=request.user, audio=audio)
-                return self.success_response(
-                    message="Audio liked successfully",
-                    data={
-                        "is_liked": True,
-                        "total_like": Like.objects.filter(audio=audio).count()
+                        "total_like": audio.like_count
                     }
                 )
+            return self.success_response(
+                message="Audio liked successfully",
+                data={
+                    "is_liked": True,
+                    "total_like": audio.like_count
+                }
+            )
 
         except Audio.DoesNotExist:
             return self.error_response(
@@ -384,7 +560,7 @@ class CommentView(BaseAPIView):
                 status_code=status.HTTP_404_NOT_FOUND
             )
 
-        comments = Comment.objects.filter(audio=audio).order_by("-created_at")
+        comments = Comment.objects.filter(audio=audio).select_related("user").order_by("-created_at")
         serializer = CommentSerializer(comments, many=True, context={"request": request})
         
         return self.success_response(
@@ -407,7 +583,9 @@ class CommentView(BaseAPIView):
 
         serializer = CommentSerializer(data=request.data, context={"request": request})
         if serializer.is_valid():
-            serializer.save(user=request.user, audio=audio)
+            with transaction.atomic():
+                serializer.save(user=request.user, audio=audio)
+                Audio.adjust_counters(audio.id, comments=1)
             return self.success_response(
                 message="Comment added successfully",
                 data=serializer.data,
@@ -462,7 +640,9 @@ class CommentDetailView(BaseAPIView):
                 message="You are not authorized to delete this comment or comment not found",
                 status_code=status.HTTP_403_FORBIDDEN
             )
-        comment.delete()
+        with transaction.atomic():
+            deleted, _ = Comment.objects.filter(pk=comment.pk).delete()
+            Audio.adjust_counters(comment.audio_id, comments=-deleted)
         return self.success_response(
             message="Comment deleted successfully"
         )
@@ -487,8 +667,10 @@ class PlayListView(BaseAPIView):
         )
     
     def get(self, request):
-        playlists = Playlist.objects.filter(user=request.user)
-        serializer = PlayListSerializer(playlists, many=True)
+        playlists = Playlist.objects.filter(user=request.user).prefetch_related(
+            Prefetch("audios", queryset=Audio.objects.select_related("category"))
+        )
+        serializer = PlayListSerializer(playlists, many=True, context={"request": request})
         
         return self.success_response(
             message="Your playlists retrieved successfully",
@@ -539,14 +721,14 @@ class DownloadListView(BaseAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # --- Auto delete older than 7 days ---
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        Download.objects.filter(created_at__lt=seven_days_ago).delete()
+        # --- Auto delete expired downloads ---
+        since = window_start()
+        Download.objects.filter(created_at__lt=since).delete()
 
-        # --- Return only last 7 days ---
+        # --- Return only the current window ---
         downloads = Download.objects.filter(
             user=request.user,
-            created_at__gte=seven_days_ago
+            created_at__gte=since
         ).order_by('-created_at')
 
         serializer = DownloadSerializer(downloads, many=True, context={'request': request})
@@ -562,8 +744,8 @@ class DownloadCreateView(BaseAPIView):
 
     def post(self, request, audio_id):
        
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        Download.objects.filter(created_at__lt=seven_days_ago).delete()
+        since = window_start()
+        Download.objects.filter(created_at__lt=since).delete()
 
    
         try:
@@ -578,14 +760,15 @@ class DownloadCreateView(BaseAPIView):
         existing = Download.objects.filter(
             user=request.user,
             audio=audio,
-            created_at__gte=seven_days_ago
+            created_at__gte=since
         ).first()
 
+        # signed transfer links with the size and checksum of every file
         if existing:
             serializer = DownloadSerializer(existing, context={'request': request})
             return self.success_response(
-                message="Audio already in your download list (within 7 days)",
-                data=serializer.data
+                message=f"Audio already in your download list (within {settings.DOWNLOAD_WINDOW_DAYS} days)",
+                data={**serializer.data, "manifest": manifest(existing, request)}
             )
 
  
@@ -594,9 +777,39 @@ class DownloadCreateView(BaseAPIView):
 
         return self.success_response(
             message="Audio added to your download list successfully",
-            data=serializer.data,
+            data={**serializer.data, "manifest": manifest(download, request)},
             status_code=status.HTTP_201_CREATED
         )
+
+
+class DownloadTransferView(BaseAPIView):
+    """
+    A file of a download, authorized by the signed token from its manifest
+    alone; resumable with Range/If-Range
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get(self, request, token):
+        try:
+            download, kind, field_file, digest = resolve(token)
+        except signing.BadSignature:
+            return self.error_response(
+                message="Invalid download link.",
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+        except DownloadGone as exc:
+            return self.error_response(message=str(exc), status_code=status.HTTP_410_GONE)
+        if not os.path.isfile(field_file.path):
+            return self.error_response(message="File not found.", status_code=status.HTTP_404_NOT_FOUND)
+
+        response = serve_file(
+            request, field_file.path, private=True, max_age=0,
+            filename=file_name(download.audio, kind, field_file),
+        )
+        if digest:
+            response["Repr-Digest"] = repr_digest(digest)
+        return response
         
         
 class DownloadDeleteView(BaseAPIView):
@@ -605,8 +818,7 @@ class DownloadDeleteView(BaseAPIView):
 
     def delete(self, request, pk):
         
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        Download.objects.filter(created_at__lt=seven_days_ago).delete()
+        Download.objects.filter(created_at__lt=window_start()).delete()
 
         try:
             download = Download.objects.get(pk=pk, user=request.user)
@@ -624,7 +836,7 @@ class DownloadDeleteView(BaseAPIView):
         
 class AudioSearchView(BaseAPIView):
     """
-    Search functionality + return history in same response
+    Ranked search, the query is recorded in the user's search history
     """
     permission_classes = [permissions.AllowAny]
 
@@ -632,34 +844,59 @@ class AudioSearchView(BaseAPIView):
         query = request.GET.get('q', '')
 
         results = []  # search result list
+        pagination = None
 
         if query:
-            # search result
-            audios = Audio.objects.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query) |
-                Q(category__name__icontains=query)
-            ).order_by('-created_at')
+            # ranked full-text search, see search.py
+            audios, pagination = search_audios(query, request)
 
-            # save history
-            SearchHistory.objects.create(user=request.user, query=query)
+            # save history (repeats are bumped, not duplicated)
+            record_search(request.user, query)
 
             results = AudioSerializer(audios, many=True, context={'request': request}).data
 
-        # Always include history
-        histories = SearchHistory.objects.filter(user=request.user).order_by('-created_at')
-        history_data = SearchHistorySerializer(histories, many=True).data
+        return self.success_response(
+            message="Search results retrieved successfully",
+            data={"results": results},
+            pagination=pagination,
+        )
+
+
+class SearchHistoryListView(BaseAPIView):
+    """
+    The user's recent searches, newest first
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
+    def get(self, request):
+        histories, pagination = self.paginate(
+            request, SearchHistory.objects.filter(user=request.user), ("-searched_at", "-id")
+        )
         return self.success_response(
-            message="Search results & history retrieved successfully",
-            data={
-                 "history": history_data,
-                "results": results  
-               
-            }
+            message="Search history retrieved successfully",
+            data=SearchHistorySerializer(histories, many=True).data,
+            pagination=pagination,
         )
 
 
+class SearchSuggestView(BaseAPIView):
+    """
+    Search-as-you-type suggestions, answered from the in-process prefix index
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get("limit", settings.SUGGEST_LIMIT))
+        except ValueError:
+            limit = settings.SUGGEST_LIMIT
+        limit = max(1, min(limit, settings.SUGGEST_MAX_LIMIT))
+
+        return self.success_response(
+            message="Suggestions retrieved successfully",
+            data=suggestions.suggest(request.GET.get("q", ""), limit),
+        )
+
 
 class SearchHistoryDeleteView(BaseAPIView):
     """
@@ -0,0 +1,123 @@
+"""
+Waveform envelopes for drawing a seek bar without downloading the audio.
+
+The "media.waveform" job (tasks.py) decodes `Audio.audio_file` once to
+mono WAVEFORM_SAMPLE_RATE PCM through the AUDIO_ENCODER, reduces it on the
+fly to blocks of BLOCK samples (peak and sum of squares), then groups
+those into WAVEFORM_RESOLUTIONS bins per level. Memory stays bounded by
+the number of blocks, not samples. The result is written next to the audio
+file as `<audio file>.peaks`:
+
+    header   "<4sBBHI"  b"PEAK", version, level count, 0, duration in ms
+    levels   "<I" each  number of bins per level, coarsest first
+    data     per level, per bin: peak, rms (uint8, full scale = 255)
+
+A blob of the content-addressed store never changes, so neither does its
+waveform and it is only built once. `GET audios/<id>/waveform/` serves it.
+"""
+import math
+import os
+import struct
+import sys
+from array import array
+from operator import mul
+
+from django.conf import settings
+
+from .models import Audio
+from .storage import WAVEFORM_SUFFIX, is_immutable
+from .transcode import get_encoder
+
+MAGIC = b"PEAK"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHI")
+BLOCK = 256  # samples
+
+
+def blocks(chunks):
+    """Peak and sum of squares per BLOCK samples of 16-bit little-endian PCM chunks"""
+    peaks, squares = array("H"), array("d")
+    carry = b""
+    total = 0
+
+    def reduce(data):
+        samples = array("h")
+        samples.frombytes(data)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        for start in range(0, len(samples), BLOCK):
+            block = samples[start:start + BLOCK]
+            peaks.append(max(max(block), -min(block)))
+            squares.append(sum(map(mul, block, block)))
+        return len(samples)
+
+    for chunk in chunks:
+        data = carry + chunk
+        usable = len(data) - len(data) % (BLOCK * 2)
+        carry = data[usable:]
+        if usable:
+            total += reduce(data[:usable])
+    usable = len(carry) - len(carry) % 2
+    if usable:
+        total += reduce(carry[:usable])
+    return peaks, squares, total
+
+
+def level(peaks, squares, total, bins):
+    """`bins` (peak, rms) pairs as uint8, fewer when the audio has fewer blocks"""
+    count = len(peaks)
+    bins = min(bins, count)
+    out = bytearray()
+    for index in range(bins):
+        start, end = index * count // bins, (index + 1) * count // bins
+        samples = min(end * BLOCK, total) - start * BLOCK
+        peak = max(peaks[start:end])
+        rms = math.sqrt(sum(squares[start:end]) / samples) if samples else 0
+        out.append(min(round(peak * 255 / 32768), 255))
+        out.append(min(round(rms * 255 / 32768), 255))
+    return bins, bytes(out)
+
+
+def encode(peaks, squares, total, sample_rate):
+    levels = [level(peaks, squares, total, bins) for bins in sorted(settings.WAVEFORM_RESOLUTIONS)]
+    header = HEADER.pack(MAGIC, VERSION, len(levels), 0, round(total * 1000 / sample_rate))
+    return header + b"".join(struct.pack("<I", bins) for bins, _ in levels) + b"".join(data for _, data in levels)
+
+
+def decode_levels(data):
+    """{bins: [(peak, rms), ...]} of a .peaks file"""
+    magic, version, count, _, duration_ms = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a waveform file")
+    sizes = struct.unpack_from(f"<{count}I", data, HEADER.size)
+    offset = HEADER.size + 4 * count
+    levels = {}
+    for bins in sizes:
+        chunk = data[offset:offset + bins * 2]
+        levels[bins] = list(zip(chunk[0::2], chunk[1::2]))
+        offset += bins * 2
+    return levels
+
+
+def waveform_path(audio):
+    return audio.audio_file.path + WAVEFORM_SUFFIX
+
+
+def build_waveform(audio_id):
+    """Write the .peaks file of an audio, returns its path (None without a file)"""
+    audio = Audio.objects.filter(pk=audio_id).only("audio_file").first()
+    if audio is None or not audio.audio_file:
+        return None
+    target = waveform_path(audio)
+    if is_immutable(audio.audio_file.name) and os.path.exists(target):
+        return target  # same content, same waveform
+
+    sample_rate = settings.WAVEFORM_SAMPLE_RATE
+    peaks, squares, total = blocks(get_encoder().decode(audio.audio_file.path, sample_rate))
+    if not total:
+        return None
+    temporary = f"{target}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(encode(peaks, squares, total, sample_rate))
+    os.replace(temporary, target)
+    return target
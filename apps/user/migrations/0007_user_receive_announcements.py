@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0006_subscription'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='receive_announcements',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:57
+
+import apps.stories.storage
+import apps.user.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_user_receive_announcements'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=apps.stories.storage.media_storage, upload_to=apps.user.models.user_photo_upload_path),
+        ),
+    ]
@@ -6,6 +6,7 @@ from django.db import models
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
+from apps.stories.storage import media_storage
 
 
 class Subscription(models.Model):
@@ -54,8 +55,10 @@ def user_photo_upload_path(instance, filename):
 class User(AbstractBaseUser, PermissionsMixin):
     email= models.EmailField('Your Email', unique=True)
     full_name = models.CharField(max_length=150, blank=True)
-    photo = models.ImageField(upload_to=user_photo_upload_path, blank=True, null=True)
+    photo = models.ImageField(upload_to=user_photo_upload_path, storage=media_storage, blank=True, null=True)
     is_subscribed = models.BooleanField(default=False)
+    # new-category announcements; new stories only reach followers of their category
+    receive_announcements = models.BooleanField(default=True)
 
     is_active= models.BooleanField(default= False)
     is_staff= models.BooleanField(default=False)
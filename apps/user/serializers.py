@@ -11,17 +11,13 @@ from django.utils.timezone import now, timedelta
 from django.utils import timezone
 User = get_user_model()
 from rest_framework_simplejwt.tokens import RefreshToken
+from apps.stories.images import image_url
 
 
 class AbsoluteImageSerializer(serializers.ImageField):
     def to_representation(self, value):
-        request = self.context.get('request', None)
-        if value:
-            url = value.url
-            if request is not None:
-                return request.build_absolute_uri(url)
-            return url
-        return None
+        # the resized derivative the client asked for (?image_size=), else the original
+        return image_url(value, self.context)
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -43,7 +39,7 @@ class UserProfileSerializer( serializers.ModelSerializer):
     photo = AbsoluteImageSerializer(required=False)
     class Meta:
         model= User
-        fields= ['id','full_name', 'is_subscribed', 'photo']
+        fields= ['id','full_name', 'is_subscribed', 'photo', 'receive_announcements']
 
 
 class SignUpSerializer(serializers.ModelSerializer):
@@ -107,7 +107,7 @@ class UserProfileAPIView(BaseAPIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserProfileSerializer(request.user)
+        serializer = UserProfileSerializer(request.user, context={"request": request})
         return self.success_response(data=serializer.data)
 
 
@@ -123,7 +123,7 @@ class UserProfileDetailAPIView(BaseAPIView):
         else:
             user = request.user
 
-        serializer = UserProfileSerializer(user)
+        serializer = UserProfileSerializer(user, context={"request": request})
         return self.success_response(data=serializer.data)
     
     def put(self, request, id=None):
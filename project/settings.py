@@ -65,6 +65,124 @@ REST_FRAMEWORK = {
 }
 
 
+# Cursor pagination for catalog list endpoints
+CATALOG_PAGE_SIZE = config('CATALOG_PAGE_SIZE', cast=int, default=20)
+CATALOG_MAX_PAGE_SIZE = config('CATALOG_MAX_PAGE_SIZE', cast=int, default=100)
+CATEGORY_PREVIEW_SIZE = config('CATEGORY_PREVIEW_SIZE', cast=int, default=10)
+
+# Seconds between the flushes of pending plays into play_count, 0 writes
+# every play immediately
+PLAY_COUNT_FLUSH_INTERVAL = config('PLAY_COUNT_FLUSH_INTERVAL', cast=float, default=5)
+
+# Background History writer: batch size, max seconds between writes
+# (0 writes synchronously), queue bound and how long a full queue blocks
+HISTORY_BATCH_SIZE = config('HISTORY_BATCH_SIZE', cast=int, default=500)
+HISTORY_FLUSH_INTERVAL = config('HISTORY_FLUSH_INTERVAL', cast=float, default=2)
+HISTORY_QUEUE_SIZE = config('HISTORY_QUEUE_SIZE', cast=int, default=10000)
+HISTORY_ENQUEUE_TIMEOUT = config('HISTORY_ENQUEUE_TIMEOUT', cast=float, default=0.05)
+
+# Trending: half-life of a play's weight and how long hourly buckets are kept.
+# Scores are refreshed by `manage.py update_trending`, run it from cron. Plays
+# are counted once they are TRENDING_SAFETY_LAG seconds old, well past the
+# time a History batch takes to be written (HISTORY_FLUSH_INTERVAL).
+TRENDING_HALF_LIFE_HOURS = config('TRENDING_HALF_LIFE_HOURS', cast=float, default=24)
+TRENDING_BUCKET_RETENTION_DAYS = config('TRENDING_BUCKET_RETENTION_DAYS', cast=int, default=30)
+TRENDING_SAFETY_LAG = config('TRENDING_SAFETY_LAG', cast=int, default=300)
+
+# Caches. The catalog alias holds anonymous catalog responses and the catalog
+# version; with several workers point it at a shared backend (file-based,
+# Redis, ...) so a version bump in one process is seen by all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': config('CATALOG_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default='catalog'),
+    },
+}
+CATALOG_CACHE_ALIAS = 'catalog'
+# Seconds an entry is fresh (0 disables the cache), how long it may then be
+# served stale while one worker rebuilds it, and the rebuild lock lifetime
+CATALOG_CACHE_TTL = config('CATALOG_CACHE_TTL', cast=int, default=60)
+CATALOG_CACHE_STALE_TTL = config('CATALOG_CACHE_STALE_TTL', cast=int, default=600)
+CATALOG_CACHE_LOCK_TIMEOUT = config('CATALOG_CACHE_LOCK_TIMEOUT', cast=int, default=30)
+# Lifetime of the shared per-audio catalog renderings merged into user lists
+CATALOG_RENDER_TTL = config('CATALOG_RENDER_TTL', cast=int, default=3600)
+
+# Search suggestions: default/max results, how often a worker checks the
+# catalog version (0 rebuilds synchronously on the request), full rebuild
+# period for popular queries, and which past queries count as popular
+SUGGEST_LIMIT = config('SUGGEST_LIMIT', cast=int, default=8)
+SUGGEST_MAX_LIMIT = config('SUGGEST_MAX_LIMIT', cast=int, default=20)
+SUGGEST_CHECK_INTERVAL = config('SUGGEST_CHECK_INTERVAL', cast=float, default=5)
+SUGGEST_REBUILD_INTERVAL = config('SUGGEST_REBUILD_INTERVAL', cast=int, default=900)
+SUGGEST_MIN_QUERY_COUNT = config('SUGGEST_MIN_QUERY_COUNT', cast=int, default=3)
+SUGGEST_QUERY_LIMIT = config('SUGGEST_QUERY_LIMIT', cast=int, default=2000)
+# Entries kept per user in the search history, older ones are trimmed
+SEARCH_HISTORY_LIMIT = config('SEARCH_HISTORY_LIMIT', cast=int, default=50)
+
+# Notifications inserted per fan-out batch (one short transaction each)
+NOTIFICATION_BATCH_SIZE = config('NOTIFICATION_BATCH_SIZE', cast=int, default=1000)
+
+# Live notification stream (SSE, needs the ASGI app). Notifications are
+# published by the job workers (run_workers), another process than the web
+# app, so the default 'apps.stories.pubsub.PostgresBackend' (LISTEN/NOTIFY)
+# carries them across. 'apps.stories.pubsub.LocalBackend' only reaches the
+# publishing process, run_workers refuses to start with it.
+NOTIFICATION_PUBSUB_BACKEND = config('NOTIFICATION_PUBSUB_BACKEND', default='apps.stories.pubsub.PostgresBackend')
+SSE_HEARTBEAT_INTERVAL = config('SSE_HEARTBEAT_INTERVAL', cast=float, default=15)
+SSE_RETRY_MS = config('SSE_RETRY_MS', cast=int, default=3000)
+SSE_REPLAY_LIMIT = config('SSE_REPLAY_LIMIT', cast=int, default=100)
+SSE_QUEUE_SIZE = config('SSE_QUEUE_SIZE', cast=int, default=100)
+
+# Background jobs (`manage.py run_workers`): pool size, idle poll period,
+# attempts per job, retry backoff base/cap, how often a running job
+# refreshes its lock and after how long a running job whose worker went
+# away (no refresh) is handed out again (all in seconds)
+JOB_WORKERS = config('JOB_WORKERS', cast=int, default=4)
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', cast=float, default=1)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', cast=int, default=5)
+JOB_RETRY_BACKOFF = config('JOB_RETRY_BACKOFF', cast=float, default=10)
+JOB_RETRY_BACKOFF_MAX = config('JOB_RETRY_BACKOFF_MAX', cast=float, default=3600)
+JOB_HEARTBEAT_INTERVAL = config('JOB_HEARTBEAT_INTERVAL', cast=float, default=60)
+JOB_LOCK_TIMEOUT = config('JOB_LOCK_TIMEOUT', cast=int, default=900)
+
+# Media streaming (see apps/stories/streaming.py). MEDIA_SENDFILE hands the
+# transfer to the front server: '' (the worker sends it), 'x-accel-redirect'
+# (nginx, with an internal location at MEDIA_ACCEL_REDIRECT_PREFIX aliased
+# to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+MEDIA_STREAM_MAX_AGE = config('MEDIA_STREAM_MAX_AGE', cast=int, default=86400)
+
+
+# Renditions made from every upload (see apps/stories/transcode.py): the
+# encoder class, the ffmpeg it runs, name -> bitrate in kbit/s, HLS segment
+# length, the time limit of one ffmpeg run and how long a replaced version
+# stays available to players still streaming it (seconds; longer than a
+# client may keep an old master playlist, MEDIA_STREAM_MAX_AGE)
+AUDIO_ENCODER = config('AUDIO_ENCODER', default='apps.stories.transcode.FFmpegEncoder')
+FFMPEG_BINARY = config('FFMPEG_BINARY', default='ffmpeg')
+AUDIO_RENDITIONS = {'low': 48, 'medium': 96, 'high': 160}
+HLS_SEGMENT_SECONDS = config('HLS_SEGMENT_SECONDS', cast=int, default=6)
+TRANSCODE_TIMEOUT = config('TRANSCODE_TIMEOUT', cast=int, default=1800)
+RENDITION_GRACE_PERIOD = config('RENDITION_GRACE_PERIOD', cast=int, default=2 * 86400)
+# Waveform envelopes (apps/stories/waveform.py): decode rate and bins per level
+WAVEFORM_SAMPLE_RATE = config('WAVEFORM_SAMPLE_RATE', cast=int, default=8000)
+WAVEFORM_RESOLUTIONS = (128, 512, 2048)
+# Offline downloads (see apps/stories/downloads.py): days a download and
+# its signed transfer links stay valid
+DOWNLOAD_WINDOW_DAYS = config('DOWNLOAD_WINDOW_DAYS', cast=int, default=7)
+
+# Image derivatives (see apps/stories/images.py): longest edge per size,
+# the size served when the client does not ask, and encoder quality.
+# Files under MEDIA_ROOT/derivatives/ are content-hashed and can be served
+# with "Cache-Control: public, max-age=31536000, immutable".
+IMAGE_SIZES = {'thumbnail': 160, 'card': 480, 'full': 1280}
+IMAGE_DEFAULT_SIZE = config('IMAGE_DEFAULT_SIZE', default='full')
+IMAGE_WEBP_QUALITY = config('IMAGE_WEBP_QUALITY', cast=int, default=80)
+IMAGE_JPEG_QUALITY = config('IMAGE_JPEG_QUALITY', cast=int, default=82)
 
 # for email functionality
 
@@ -192,6 +310,15 @@ import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # uploaded audio, covers and user photos: deduplicated under MEDIA_ROOT/cas/
+    # by content hash (apps/stories/storage.py); those paths never change
+    # content, serve them with "Cache-Control: public, max-age=31536000, immutable"
+    'media': {'BACKEND': 'apps.stories.storage.ContentAddressedStorage'},
+}
+
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'static'
 